@@ -1,5 +1,6 @@
 import prisma from '../lib/prisma.js';
 import bcrypt from 'bcryptjs';
+import { syncMLProfile } from './flatmateController.js';
 import jwt from 'jsonwebtoken';const generateToken = (userId) => {
   return jwt.sign({ userId }, process.env.JWT_SECRET || 'your-secret-key', {
     expiresIn: '7d'
@@ -39,9 +40,28 @@ export const register = async (req, res) => {
         city: true,
         locality: true,
         budget: true,
-        createdAt: true
+        sleepPattern: true,
+        dietaryPrefs: true,
+        cleanliness: true,
+        smokingHabits: true,
+        drinkingHabits: true,
+        personalityType: true,
+        socialStyle: true,
+        hostingStyle: true,
+        weekendStyle: true,
+        hobbies: true,
+        interests: true,
+        musicGenres: true,
+        sportsActivities: true,
+        languagesSpoken: true,
+        petOwnership: true,
+        petPreference: true,
+        createdAt: true,
+        updatedAt: true
       }
-    });    const token = generateToken(user.id);
+    });
+    syncMLProfile(user);
+    const token = generateToken(user.id);
     res.status(201).json({
       success: true,
       message: 'User registered successfully',
@@ -270,6 +290,7 @@ export const updateProfile = async (req, res) => {
       }
     });
     console.log('✅ Profile updated successfully for:', updatedUser.email);
+    syncMLProfile(updatedUser);
     res.json({
       success: true,
       message: 'Profile updated successfully',
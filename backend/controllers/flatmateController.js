@@ -6,100 +6,129 @@ const ML_SERVICE_URL = process.env.ML_SERVICE_URL || 'http://localhost:5001';
 
 console.log("🔧 ML Service URL configured:", ML_SERVICE_URL);
 
-// Budget compatibility function
-const budgetOrder = [
-  "<15000",
-  "15000-20000",
-  "20000-25000",
-  "25000-30000",
-  "30000-40000",
-  "40000+"
-];
+// Essential pre-filtering (only practical necessities), applied by the ML service
+// before scoring: budget brackets at most one apart, and a compatible gender
+const ESSENTIAL_FILTER = { budget_window: 1, gender: true };
 
-function isBudgetCompatible(userBudget, candidateBudget) {
-  const userIdx = budgetOrder.indexOf(userBudget);
-  const candIdx = budgetOrder.indexOf(candidateBudget);
-  return Math.abs(userIdx - candIdx) <= 1; // Within 1 range
+// Profile fields used by the ML service for feature encoding
+function toMLProfile(profile) {
+  return {
+    age: profile.age,
+    city: profile.city,
+    locality: profile.locality,
+    gender: profile.gender,
+    budget: profile.budget,
+    sleepPattern: profile.sleepPattern,
+    dietaryPrefs: profile.dietaryPrefs,
+    smokingHabits: profile.smokingHabits,
+    drinkingHabits: profile.drinkingHabits,
+    personalityType: profile.personalityType,
+    socialStyle: profile.socialStyle,
+    hostingStyle: profile.hostingStyle,
+    weekendStyle: profile.weekendStyle,
+    cleanliness: profile.cleanliness,
+    petOwnership: profile.petOwnership,
+    petPreference: profile.petPreference,
+    hobbies: profile.hobbies || [],
+    interests: profile.interests || [],
+    musicGenres: profile.musicGenres || [],
+    sportsActivities: profile.sportsActivities || [],
+    languagesSpoken: profile.languagesSpoken || []
+  };
 }
 
-// Enhanced compatibility scoring using ML Service
-async function getMLCompatibilityScores(userProfile, candidates) {
-  console.log("🤖 Using ML service for compatibility prediction...");
-  
-  // Prepare data for ML service (expects array of user-candidate pairs)
-  const mlRequestData = candidates.map(candidate => ({
-    user: {
-      age: userProfile.age,
-      city: userProfile.city,
-      locality: userProfile.locality,
-      gender: userProfile.gender,
-      budget: userProfile.budget,
-      sleepPattern: userProfile.sleepPattern,
-      dietaryPrefs: userProfile.dietaryPrefs,
-      smokingHabits: userProfile.smokingHabits,
-      drinkingHabits: userProfile.drinkingHabits,
-      personalityType: userProfile.personalityType,
-      socialStyle: userProfile.socialStyle,
-      hostingStyle: userProfile.hostingStyle,
-      weekendStyle: userProfile.weekendStyle,
-      cleanliness: userProfile.cleanliness,
-      petOwnership: userProfile.petOwnership,
-      petPreference: userProfile.petPreference,
-      hobbies: userProfile.hobbies || [],
-      interests: userProfile.interests || [],
-      musicGenres: userProfile.musicGenres || [],
-      sportsActivities: userProfile.sportsActivities || [],
-      languagesSpoken: userProfile.languagesSpoken || []
-    },
-    candidate: {
-      age: candidate.age,
-      city: candidate.city,
-      locality: candidate.locality,
-      gender: candidate.gender,
-      budget: candidate.budget,
-      sleepPattern: candidate.sleepPattern,
-      dietaryPrefs: candidate.dietaryPrefs,
-      smokingHabits: candidate.smokingHabits,
-      drinkingHabits: candidate.drinkingHabits,
-      personalityType: candidate.personalityType,
-      socialStyle: candidate.socialStyle,
-      hostingStyle: candidate.hostingStyle,
-      weekendStyle: candidate.weekendStyle,
-      cleanliness: candidate.cleanliness,
-      petOwnership: candidate.petOwnership,
-      petPreference: candidate.petPreference,
-      hobbies: candidate.hobbies || [],
-      interests: candidate.interests || [],
-      musicGenres: candidate.musicGenres || [],
-      sportsActivities: candidate.sportsActivities || [],
-      languagesSpoken: candidate.languagesSpoken || []
-    }
-  }));
+// Profile version used by the ML service's candidate store
+function profileVersion(profile) {
+  return profile.updatedAt instanceof Date ? profile.updatedAt.toISOString() : String(profile.updatedAt);
+}
 
-  // Call ML service
-  const controller = new AbortController();
-  const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
-  
-  const response = await fetch(`${ML_SERVICE_URL}/predict-enhanced`, {
+async function postToMLService(path, body, signal) {
+  return fetch(`${ML_SERVICE_URL}${path}`, {
     method: 'POST',
     headers: {
       'Content-Type': 'application/json',
     },
-    body: JSON.stringify(mlRequestData),
-    signal: controller.signal
+    body: JSON.stringify(body),
+    signal
   });
+}
 
-  clearTimeout(timeoutId);
-
-  if (!response.ok) {
-    const errorText = await response.text();
-    throw new Error(`ML service responded with status: ${response.status} - ${errorText}`);
+// Push a created or updated profile to the ML service, which rescores only the
+// pairs involving it in its per-user match index. Failures are logged, not thrown.
+export async function syncMLProfile(profile) {
+  try {
+    const response = await postToMLService('/candidates', [{
+      id: profile.id,
+      version: profileVersion(profile),
+      profile: toMLProfile(profile)
+    }]);
+    if (!response.ok) {
+      console.error(`❌ ML profile sync failed with status: ${response.status}`);
+    }
+  } catch (error) {
+    console.error('❌ ML profile sync error:', error.message);
   }
+}
+
+// Enhanced compatibility ranking using ML Service: scores every candidate that
+// passes `filter` and returns { matches: [{ index, match_percentage }], filtered },
+// with the top K best first and indices into `candidates`
+async function getMLTopMatches(userProfile, candidates, k, filter) {
+  console.log("🤖 Using ML service for compatibility prediction...");
+  
+  // Candidates are referenced by id + version; the ML service keeps their
+  // encoded profiles, so only the user profile is sent in full
+  const mlRequestData = {
+    k,
+    filter,
+    user: toMLProfile(userProfile),
+    candidate_refs: candidates.map(candidate => ({
+      id: candidate.id,
+      version: profileVersion(candidate)
+    }))
+  };
 
-  const result = await response.json();
-  console.log(`✅ ML service returned ${result.match_percentages?.length || 0} predictions`);
+  // Call ML service
+  const controller = new AbortController();
+  const timeoutId = setTimeout(() => controller.abort(), 30000); // 30 second timeout
   
-  return result.match_percentages || [];
+  try {
+    let response = await postToMLService('/rank', mlRequestData, controller.signal);
+
+    // Missing or stale candidates: retry once with just those profiles attached;
+    // the ML service stores them before scoring, whichever worker handles it
+    if (response.status === 409) {
+      const { missing = [], stale = [] } = await response.json();
+      const outdated = new Set([...missing, ...stale]);
+      console.log(`📦 Uploading ${outdated.size} candidate profiles to ML service`);
+
+      response = await postToMLService('/rank', {
+        ...mlRequestData,
+        candidate_profiles: candidates
+          .filter(candidate => outdated.has(candidate.id))
+          .map(candidate => ({
+            id: candidate.id,
+            version: profileVersion(candidate),
+            profile: toMLProfile(candidate)
+          }))
+      }, controller.signal);
+    }
+
+    if (!response.ok) {
+      const errorText = await response.text();
+      throw new Error(`ML service responded with status: ${response.status} - ${errorText}`);
+    }
+
+    const result = await response.json();
+    console.log(`✅ ML service ranked ${result.total ?? 0} candidates, returned top ${result.matches?.length || 0}`);
+    
+    return {
+      matches: result.matches || [],
+      filtered: result.filtered ?? candidates.length
+    };
+  } finally {
+    clearTimeout(timeoutId);
+  }
 }
 
 export async function findFlatmateMatches(req, res) {
@@ -146,7 +175,8 @@ export async function findFlatmateMatches(req, res) {
         languagesSpoken: true,
         petOwnership: true,
         petPreference: true,
-        createdAt: true
+        createdAt: true,
+        updatedAt: true
       }
     });
     console.log(`📊 Found ${candidates.length} candidates in ${userProfile.city}`);
@@ -161,37 +191,13 @@ export async function findFlatmateMatches(req, res) {
       });
     }
 
-    // Essential pre-filtering (only practical necessities)
-    const filteredCandidates = candidates.filter(candidate => {
-      // 1. Budget compatibility (financial feasibility)
-      const budgetMatch = isBudgetCompatible(userProfile.budget, candidate.budget);
-      
-      // 2. Gender preference (user safety/preference)
-      const genderMatch = userProfile.gender === "Both" ||
-                         candidate.gender === userProfile.gender ||
-                         candidate.gender === "Both";
-      
-      return budgetMatch && genderMatch;
-    });
-    
-    console.log(`✅ ${filteredCandidates.length} candidates after essential pre-filtering (budget + gender)`);
+    // Use ML service for essential pre-filtering (budget + gender) and
+    // compatibility scoring of the whole city - pure ML approach
+    console.log("🤖 Getting ML top matches for all candidates...");
     
-    // If no candidates after essential filtering
-    if (filteredCandidates.length === 0) {
-      return res.json({
-        matches: [],
-        total: 0,
-        message: `Found ${candidates.length} users in ${userProfile.city}, but none match your essential criteria (budget: ${userProfile.budget}, gender preference).`,
-        suggestion: `Try adjusting your budget range or gender preferences for more matches.`
-      });
-    }
-
-    // Use ML service for compatibility scoring - pure ML approach
-    console.log("🤖 Getting ML predictions for all candidates...");
-    
-    let compatibilityScores;
+    let ranking;
     try {
-      compatibilityScores = await getMLCompatibilityScores(userProfile, filteredCandidates);
+      ranking = await getMLTopMatches(userProfile, candidates, 10, ESSENTIAL_FILTER);
     } catch (error) {
       console.error("❌ ML service failed:", error.message);
       console.error("❌ ML service error details:", error);
@@ -221,9 +227,21 @@ export async function findFlatmateMatches(req, res) {
       });
     }
     
-    // Create matches with ML-predicted scores only
-    const matches = filteredCandidates.map((candidate, index) => {
-      const mlScore = compatibilityScores[index];
+    console.log(`✅ ${ranking.filtered} candidates after essential pre-filtering (budget + gender)`);
+    
+    // If no candidates after essential filtering
+    if (ranking.filtered === 0) {
+      return res.json({
+        matches: [],
+        total: 0,
+        message: `Found ${candidates.length} users in ${userProfile.city}, but none match your essential criteria (budget: ${userProfile.budget}, gender preference).`,
+        suggestion: `Try adjusting your budget range or gender preferences for more matches.`
+      });
+    }
+    
+    // Create matches for the top 10 ML-ranked candidates only (already sorted, highest first)
+    const topMatches = ranking.matches.map(({ index, match_percentage: mlScore }) => {
+      const candidate = candidates[index];
       
       return {
         candidate: {
@@ -259,13 +277,9 @@ export async function findFlatmateMatches(req, res) {
         match_percentage: mlScore
       };
     });
-    // Sort by compatibility score (highest first)
-    matches.sort((a, b) => b.match_percentage - a.match_percentage);
-    // Return top 10 matches
-    const topMatches = matches.slice(0, 10);
     res.json({
       matches: topMatches,
-      total: filteredCandidates.length,
+      total: ranking.filtered,
       message: `Found ${topMatches.length} ML-powered compatible flatmates`
     });
   } catch (error) {
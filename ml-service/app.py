@@ -1,22 +1,144 @@
 """
 Homiee ML Service - Flatmate Compatibility Prediction
 Uses trained machine learning model for flatmate matching
+
+Startup imports only what scoring needs: joblib (legacy pickle) and pyarrow
+(Arrow requests, see arrow_io.py) are imported when first used, and each
+startup phase is timed and reported on /startup.
 """
-from flask import Flask, request, jsonify
+import time
+STARTUP_STARTED = time.perf_counter()
+
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
-import joblib
+import hmac
+import json
 import numpy as np
-import pandas as pd
 import os
 import logging
+import pickle
+
+from feature_encoder import (
+    encode_pair_features, encode_profiles, scores_from_predictions, take_rows
+)
+from candidate_store import CandidateLookupError, CandidateStore
+from ranking import select_top_k
+from forest_engine import build_artifact_predictor, build_predictor, inference_engine_name
+from model_artifact import check_schema, open_artifact, read_header
+from score_cache import ScoreCache
+from match_index import MatchIndex
+from arrow_io import ARROW_STREAM_MIMETYPE, ArrowRequestError, is_table, metadata_json, read_table, table_columns, write_table
+from prefilter import filter_pairs, parse_filter
+from prerank import prerank
+from serving_model import ModelReloader, ModelWatcher, ServingModel, file_signature
+from micro_batch import MicroBatcher
+from profiling import ProfilerBusyError, RequestProfile, WorstProfiles
+from metrics import REGISTRY, REQUESTS, REQUEST_LATENCY, PAIRS_PER_REQUEST, Counter, Gauge, phase_timer, stage_timer
+
+# Seconds per startup phase, in the order they ran; see /startup
+STARTUP_TIMINGS = {'imports': time.perf_counter() - STARTUP_STARTED}
 
 app = Flask(__name__)
 CORS(app)
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
+# Log every scored pair (raw prediction, non-zero features, final score); off by default
+DEBUG_PAIRS = os.environ.get('ML_DEBUG_PAIRS', '').lower() in ('1', 'true', 'yes')
+
+# Streaming mode: newline-delimited JSON pairs in, one result line per pair out,
+# scored and flushed this many pairs at a time
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/jsonl')
+STREAM_CHUNK_PAIRS = int(os.environ.get('ML_STREAM_CHUNK_PAIRS', 1000))
+
+# /rank cascade: only the best N candidates by the linear pre-ranker reach the model (0 scores all with the model)
+CASCADE_TOP_N = int(os.environ.get('ML_CASCADE_TOP_N', 0))
+
+# Micro-batching: concurrent requests' uncached rows share one model call, collected for up to
+# this many milliseconds or until the batch holds ML_MICRO_BATCH_MAX_ROWS rows (0 disables it)
+MICRO_BATCH_WAIT_MS = float(os.environ.get('ML_MICRO_BATCH_WAIT_MS', 0))
+MICRO_BATCH_MAX_ROWS = int(os.environ.get('ML_MICRO_BATCH_MAX_ROWS', 2048))
+
+# Request profiling (see profiling.py), disabled unless ML_PROFILE_TOKEN is set. A request to
+# a profiled endpoint with X-Profile ("table" or "collapsed") and a matching X-Profile-Token
+# header is answered with its profile; with ML_PROFILE_EVERY_N, every nth request is profiled
+# as well and the ML_PROFILE_KEEP slowest of those are served on /profiles
+PROFILE_TOKEN = os.environ.get('ML_PROFILE_TOKEN', '')
+PROFILE_EVERY_N = int(os.environ.get('ML_PROFILE_EVERY_N', 0))
+PROFILE_KEEP = int(os.environ.get('ML_PROFILE_KEEP', 5))
+PROFILED_ENDPOINTS = ('predict_enhanced', 'rank_candidates')
+worst_profiles = WorstProfiles(PROFILE_EVERY_N, PROFILE_KEEP)
+
+def _token_matches(header, token):
+    """Whether a token is configured and the request's header carries it, compared in constant time"""
+    return bool(token) and hmac.compare_digest(request.headers.get(header, '').encode(), token.encode())
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+
+@app.before_request
+def start_profiling():
+    """Profile this request when asked to, or when it is the nth since the last sampled one"""
+    # Streamed responses are produced after the view returns, so they cannot be profiled here
+    if not PROFILE_TOKEN or request.endpoint not in PROFILED_ENDPOINTS or request.mimetype in NDJSON_MIMETYPES:
+        return None
+    requested = request.headers.get('X-Profile')
+    if requested is not None:
+        if not _token_matches('X-Profile-Token', PROFILE_TOKEN):
+            return jsonify({"error": "Profiling needs a matching X-Profile-Token header"}), 403
+        try:
+            profile = RequestProfile(requested or 'table', request.headers.get('X-Profile-Sort', 'cumulative'))
+            profile.start()
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        except ProfilerBusyError as e:
+            return jsonify({"error": str(e)}), 409
+        g.profile, g.profile_requested = profile, True
+    elif worst_profiles.due():
+        profile = RequestProfile()
+        try:
+            profile.start()
+        except ProfilerBusyError:
+            return None
+        g.profile, g.profile_requested = profile, False
+    return None
+
+# Flask runs after_request hooks in reverse order of registration, so this one,
+# registered first, swaps in the profile report only after record_request_metrics
+# has counted the view's own response
+@app.after_request
+def finish_profiling(response):
+    """Answer a requested profile with its report, keep a sampled one if it is among the slowest"""
+    profile = g.pop('profile', None)
+    if profile is None:
+        return response
+    report = profile.finish()
+    if not g.profile_requested:
+        worst_profiles.add(profile.seconds, request.endpoint, report)
+        return response
+    profiled = Response(report, content_type='text/plain; charset=utf-8')
+    profiled.headers['X-Profiled-Status'] = str(response.status_code)
+    profiled.headers['X-Profile-Seconds'] = f"{profile.seconds:.6f}"
+    return profiled
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS.inc(endpoint=endpoint, status=str(response.status_code))
+    if 'request_start' in g:
+        REQUEST_LATENCY.observe(time.perf_counter() - g.request_start, endpoint=endpoint)
+    return response
+
+@app.teardown_request
+def release_profiler(exc):
+    """A view that raised skips after_request; stop its profile so the next one can start"""
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.finish()
+
 @app.route('/', methods=['GET'])
 def home():
     """Root endpoint with service information"""
@@ -26,7 +148,14 @@ def home():
         "version": "1.0.0",
         "endpoints": {
             "/health": "Health check",
-            "/predict": "Flatmate compatibility prediction"
+            "/ready": "Readiness: 503 until a warmed-up model is serving",
+            "/reload": "Load, warm up and swap in a new model artifact (needs X-Reload-Token)",
+            "/predict": "Flatmate compatibility prediction",
+            "/rank": "Top-K compatible candidates",
+            "/matches/<user_id>": "Precomputed top matches of a stored user",
+            "/startup": "Per-phase startup timings of this process",
+            "/profiles": "Slowest sampled request profiles (needs X-Profile-Token)",
+            "/metrics": "Prometheus metrics"
         }
     }), 200
 
@@ -35,22 +164,76 @@ def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "service": "enhanced-ml-service"}), 200
 
-# Global variables for model and columns
-model = None
-model_columns = None
+# The model being served (see serving_model.py); replaced as a whole on reload, so
+# request code reads it once into a local and uses that snapshot throughout
+serving = None
+
+# Memory-mapped model artifact written by retrain_model.py; used instead of the pickle when present
+MODEL_ARTIFACT_PATH = os.environ.get(
+    'ML_MODEL_ARTIFACT', os.path.join(os.path.dirname(__file__), 'flatmate_match_model.bin')
+)
+MODEL_COLUMNS_PATH = os.path.join(os.path.dirname(__file__), 'flatmate_model_columns.pkl')
+
+# Shared secret for POST /reload, which is disabled when unset
+RELOAD_TOKEN = os.environ.get('ML_RELOAD_TOKEN', '')
+# Poll the artifact for changes every this many seconds and reload it, 0 disables watching
+MODEL_WATCH_SECONDS = float(os.environ.get('ML_MODEL_WATCH_SECONDS', 0))
+
+def load_columns(columns_path):
+    """Feature columns pickle; plain pickle reads joblib's uncompressed dumps without importing joblib"""
+    try:
+        with open(columns_path, 'rb') as f:
+            return pickle.load(f)
+    except (pickle.UnpicklingError, EOFError, ValueError):
+        import joblib
+        return joblib.load(columns_path)
+
+def load_model_artifact(columns_path, artifact_path=None):
+    """Open the memory-mapped artifact, checking it against the columns pickle when there is one.
+
+    The artifact header names the model backend, whose array engine then serves
+    predictions. For tree ensembles, batches above ML_ARRAY_ENGINE_MAX_ROWS go
+    to the sklearn model pickled next to the artifact (same name, .pkl), loaded
+    on first use; see build_artifact_predictor.
+    """
+    artifact_path = artifact_path or MODEL_ARTIFACT_PATH
+    timings = {}
+    # Taken before reading, so a file replaced mid-load looks changed to the watcher rather than current
+    signature = file_signature(artifact_path)
+    with phase_timer(timings, 'columns_load'):
+        expected_columns = load_columns(columns_path) if os.path.exists(columns_path) else None
+    with phase_timer(timings, 'schema_check'):
+        header = read_header(artifact_path)
+        check_schema(artifact_path, header, expected_columns)
+    with phase_timer(timings, 'artifact_open'):
+        engine = open_artifact(artifact_path, header)
+    predictor = build_artifact_predictor(
+        engine, os.path.splitext(artifact_path)[0] + '.pkl', len(header['feature_columns'])
+    )
+    
+    logger.info(f"✅ Model artifact {header['model_version']} ({header['backend']}) mapped with {len(header['feature_columns'])} features")
+    return ServingModel(
+        engine, header['feature_columns'], predictor,
+        version=header['model_version'], backend=header['backend'], source=artifact_path,
+        timings=timings, signature=signature
+    )
 
 def load_enhanced_model():
     """Load the enhanced trained model and feature columns"""
-    global model, model_columns
-    
     # Import required modules at the beginning
     import warnings
-    import pickle
     import os
     
     try:
         model_path = os.path.join(os.path.dirname(__file__), 'flatmate_match_model.pkl')
-        columns_path = os.path.join(os.path.dirname(__file__), 'flatmate_model_columns.pkl')
+        columns_path = MODEL_COLUMNS_PATH
+        
+        if os.path.exists(MODEL_ARTIFACT_PATH):
+            return load_model_artifact(columns_path)
+        
+        # Legacy pickle path only: joblib (and sklearn, through the pickle) load here
+        import joblib
+        started = time.perf_counter()
         
         # Handle numpy compatibility issues aggressively
         warnings.filterwarnings('ignore')
@@ -72,7 +255,6 @@ def load_enhanced_model():
         logger.info(f"Loading model with numpy {np.__version__}")
         
         # Try multiple loading strategies
-        model_loaded = False
         for attempt in range(3):
             try:
                 if attempt == 0:
@@ -96,7 +278,6 @@ def load_enhanced_model():
                 
                 logger.info(f"✅ Model loaded successfully with {len(model_columns)} features (attempt {attempt + 1})")
                 logger.info(f"✅ Test prediction: {prediction[0]:.2f}")
-                model_loaded = True
                 break
                 
             except Exception as e:
@@ -104,206 +285,508 @@ def load_enhanced_model():
                 if attempt == 2:  # Last attempt
                     raise e
         
-        return model_loaded
+        return ServingModel(
+            model, model_columns, build_predictor(model, len(model_columns)),
+            source=model_path, timings={'model_load': time.perf_counter() - started}
+        )
         
     except Exception as e:
         logger.error(f"❌ Error loading enhanced model: {str(e)}")
         raise RuntimeError(f"Model loading failed: {str(e)}")
 
-# Load model on import
-load_enhanced_model()
+# Load and warm up the model on import, so no request pays for cold pages or first-call setup
+serving = load_enhanced_model()
+serving.warm_up()
+STARTUP_TIMINGS.update(serving.timings)
+
+# Pre-encoded candidate profiles, keyed by user id and profile version
+candidate_store = CandidateStore()
+
+# Raw predictions memoized per encoded feature row, cleared when the model changes
+score_cache = ScoreCache()
+
+micro_batcher = MicroBatcher(MICRO_BATCH_MAX_ROWS, MICRO_BATCH_WAIT_MS / 1000) if MICRO_BATCH_WAIT_MS > 0 else None
+
+def model_predictor(active):
+    """The serving model's predictor, behind the micro-batcher when it is enabled"""
+    return micro_batcher.bind(active.predictor) if micro_batcher else active.predictor
+
+def score_encoded_pairs(user_columns, candidate_columns):
+    """Match percentages for aligned (or broadcast) encoded profile columns"""
+    active = serving
+    features = encode_pair_features(user_columns, candidate_columns, active.columns)
+    raw_predictions = score_cache.predict(model_predictor(active), features, (active.version, id(active.predictor))) if len(features) else np.zeros(0)
+    return scores_from_predictions(raw_predictions, features)
 
-def calculate_array_overlap(user_array, candidate_array):
-    """Calculate overlap percentage between two arrays"""
+# Persistent per-user top-K lists fed by /candidates; an empty path disables the index
+MATCH_INDEX_PATH = os.environ.get(
+    'ML_MATCH_INDEX_PATH', os.path.join(os.path.dirname(__file__), 'match_index.sqlite3')
+)
+MATCH_INDEX_K = int(os.environ.get('ML_MATCH_INDEX_K', 20))
+with phase_timer(STARTUP_TIMINGS, 'match_index'):
+    match_index = MatchIndex(
+        MATCH_INDEX_PATH, MATCH_INDEX_K, score_encoded_pairs, serving.tag
+    ) if MATCH_INDEX_PATH else None
+
+def activate_model(loaded):
+    """Serve a loaded, warmed-up model from the next request on.
+
+    In-flight requests finish on the model they started with. The score cache
+    clears itself on the new model key, and match lists stored under the old
+    model tag are recomputed lazily as they are read.
+    """
+    global serving
+    serving = loaded
+    if match_index:
+        match_index.model_tag = loaded.tag
+    logger.info(f"🔄 Now serving model {loaded.tag} from {loaded.source}")
+
+def load_reload_candidate(artifact_path):
+    """Reloads always come from a model artifact, checked against the columns pickle"""
+    return load_model_artifact(MODEL_COLUMNS_PATH, artifact_path)
+
+model_reloader = ModelReloader(load_reload_candidate, activate_model)
+model_watcher = None
+
+def start_model_watcher():
+    """Reload the artifact whenever it changes on disk, in every process that calls this (once per worker)"""
+    global model_watcher
+    if MODEL_WATCH_SECONDS > 0 and model_watcher is None:
+        model_watcher = ModelWatcher(MODEL_ARTIFACT_PATH, MODEL_WATCH_SECONDS, model_reloader, serving).start()
+
+def _process_uptime():
+    """Seconds since this process was started, None where /proc is unavailable"""
     try:
-        if not user_array or not candidate_array:
-            return 0
-        
-        user_items = set(str(user_array).split(';')) if isinstance(user_array, str) else set(user_array)
-        candidate_items = set(str(candidate_array).split(';')) if isinstance(candidate_array, str) else set(candidate_array)
-        
-        if len(user_items) == 0 or len(candidate_items) == 0:
-            return 0
+        with open('/proc/self/stat') as f:
+            start_ticks = int(f.read().rsplit(')', 1)[1].split()[19])
+        with open('/proc/uptime') as f:
+            return float(f.read().split()[0]) - start_ticks / os.sysconf('SC_CLK_TCK')
+    except (OSError, ValueError, IndexError):
+        return None
+
+def finish_startup_timings():
+    """Add the total and the time before app.py started importing, then log the breakdown"""
+    STARTUP_TIMINGS['total'] = time.perf_counter() - STARTUP_STARTED
+    uptime = _process_uptime()
+    if uptime is not None:
+        # Interpreter start-up plus whatever ran before importing the app (e.g. gunicorn's own imports)
+        STARTUP_TIMINGS['before_app'] = max(0.0, uptime - STARTUP_TIMINGS['total'])
+    for phase, seconds in STARTUP_TIMINGS.items():
+        STARTUP_PHASE_SECONDS.set(seconds, phase=phase)
+    logger.info("⏱️ Startup: " + ', '.join(f"{phase} {seconds * 1000:.0f}ms" for phase, seconds in STARTUP_TIMINGS.items()))
+
+SCORE_CACHE_HITS = REGISTRY.register(Counter('ml_score_cache_hits_total', 'Feature rows served from the score cache'))
+SCORE_CACHE_MISSES = REGISTRY.register(Counter('ml_score_cache_misses_total', 'Feature rows sent to the model'))
+SCORE_CACHE_ENTRIES = REGISTRY.register(Gauge('ml_score_cache_entries', 'Feature rows held in the score cache'))
+CANDIDATE_STORE_ENTRIES = REGISTRY.register(Gauge('ml_candidate_store_entries', 'Candidate profiles held in the candidate store'))
+STARTUP_PHASE_SECONDS = REGISTRY.register(Gauge(
+    'ml_startup_phase_seconds', 'Seconds spent in each startup phase (imports, artifact_open, schema_check, warm_up, ...)', ('phase',)
+))
+
+def collect_store_metrics():
+    SCORE_CACHE_HITS.set(score_cache.hits)
+    SCORE_CACHE_MISSES.set(score_cache.misses)
+    SCORE_CACHE_ENTRIES.set(len(score_cache))
+    CANDIDATE_STORE_ENTRIES.set(len(candidate_store))
+
+REGISTRY.add_collector(collect_store_metrics)
+finish_startup_timings()
+
+def _profile_version(entry):
+    """Normalise a profile version (e.g. updatedAt) so stored and requested versions compare equal"""
+    version = entry.get('version')
+    return None if version is None else str(version)
+
+class ScoringRequestError(Exception):
+    """A scoring request that cannot be served, carries the JSON error body and status"""
+
+    def __init__(self, body, status):
+        super().__init__(body.get("error"))
+        self.body = body
+        self.status = status
+
+def _candidate_entries(data):
+    """Validate {id, version, profile} entries into candidate store tuples"""
+    entries = []
+    for entry in data:
+        if not isinstance(entry, dict) or entry.get('id') is None or entry.get('version') is None:
+            raise ScoringRequestError({"error": "Every candidate entry needs an id, a version and a profile"}, 400)
+        entries.append((str(entry['id']), _profile_version(entry), entry.get('profile', {})))
+    return entries
+
+def _candidate_refs(data):
+    """Validate {id, version} refs into candidate store lookups"""
+    refs = []
+    for ref in data:
+        if not isinstance(ref, dict) or ref.get('id') is None:
+            raise ScoringRequestError({"error": "Every candidate ref needs an id"}, 400)
+        refs.append((str(ref['id']), _profile_version(ref)))
+    return refs
+
+def _is_pair(pair):
+    """A {user, candidate} object whose profiles, where given, are objects too"""
+    return isinstance(pair, dict) and isinstance(pair.get('user', {}), dict) and isinstance(pair.get('candidate', {}), dict)
+
+def _user_profile(data):
+    """The "user" profile of a shared-user request"""
+    user = data.get('user', {})
+    if not isinstance(user, dict):
+        raise ScoringRequestError({"error": "Expected the user profile to be an object"}, 400)
+    return user
+
+def score_request(data, endpoint, cascade_top_n=0):
+    """Encode and score any supported request schema, timing each stage under `endpoint`.
+
+    An optional "filter" spec (see prefilter.parse_filter) drops pairs before
+    their features are encoded. With cascade_top_n, every pair is scored by
+    the linear pre-ranker and only the best cascade_top_n by the model (see
+    prerank.py). Returns (match percentages, candidate ids or None when the
+    schema has no ids, indices of the scored pairs or None when nothing was
+    filtered, mask of the model-scored pairs or None without a cascade).
+    """
+    active = serving
+    model_columns = active.columns
+    with stage_timer(endpoint, 'feature_encode'):
+        user_columns, candidate_columns, candidate_ids = _request_columns(data)
         
-        overlap = len(user_items.intersection(candidate_items))
-        total_unique = len(user_items.union(candidate_items))
+        indices = None
+        filter_spec = _request_filter(data)
+        if filter_spec is not None:
+            with stage_timer(endpoint, 'prefilter'):
+                indices = filter_pairs(filter_spec, user_columns, candidate_columns)
+                if user_columns['size'] != 1:
+                    user_columns = take_rows(user_columns, indices)
+                candidate_columns = take_rows(candidate_columns, indices)
         
-        return overlap / total_unique if total_unique > 0 else 0
-    except:
-        return 0
-
-def calculate_hosting_compatibility(user_hosting, candidate_hosting):
-    """Calculate hosting compatibility score"""
-    if user_hosting == 'Either' or candidate_hosting == 'Either':
-        return 1.0
-    elif (user_hosting == 'I like hosting' and candidate_hosting == 'I like being guest') or \
-         (user_hosting == 'I like being guest' and candidate_hosting == 'I like hosting'):
-        return 1.0
-    elif user_hosting == candidate_hosting:
-        return 0.5
+        if candidate_columns['size'] == 0:
+            features = np.zeros((0, len(model_columns)))
+        else:
+            features = encode_pair_features(user_columns, candidate_columns, model_columns)
+    PAIRS_PER_REQUEST.observe(len(features), endpoint=endpoint)
+    
+    model_scored = None
+    if cascade_top_n > 0:
+        with stage_timer(endpoint, 'prerank'):
+            raw_predictions, model_scored = prerank(features, model_columns, cascade_top_n)
+        model_features = features[model_scored]
     else:
-        return 0.0
-
-def calculate_pet_compatibility(user_ownership, candidate_ownership, user_preference, candidate_preference):
-    """Calculate pet ownership and preference compatibility"""
-    if (user_ownership == 'Own pets' and candidate_preference == 'Love pets') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'Love pets'):
-        return 1.0
+        model_features = features
+    
+    # Score the pairs; only rows missing from the cache reach the model, in a single call
+    with stage_timer(endpoint, 'model_predict'):
+        model_predictions = score_cache.predict(model_predictor(active), model_features, (active.version, id(active.predictor))) if len(model_features) else np.zeros(0)
     
-    if (user_ownership == 'Own pets' and candidate_preference == 'Okay with pets') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'Okay with pets'):
-        return 0.7
+    if model_scored is None:
+        raw_predictions = model_predictions
+    else:
+        raw_predictions[model_scored] = model_predictions
     
-    if user_preference == 'No pets please' and candidate_preference == 'No pets please' and \
-       user_ownership == 'No pets' and candidate_ownership == 'No pets':
-        return 1.0
+    # Apply the non-zero-feature boost and clamp to 10-95
+    with stage_timer(endpoint, 'post_process'):
+        scores = scores_from_predictions(raw_predictions, features)
     
-    if (user_ownership == 'Own pets' and candidate_preference == 'No pets please') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'No pets please'):
-        return 0.0
+    if DEBUG_PAIRS:
+        for i, (raw, score) in enumerate(zip(raw_predictions.tolist(), scores.tolist())):
+            logger.info(f"🔍 Pair {i}: raw {raw:.4f}, {int(np.count_nonzero(features[i]))} non-zero features, score {score}")
     
-    return 0.5
+    return scores, candidate_ids, indices, model_scored
+
+def _read_request_body(endpoint):
+    """Parse the request body: an Arrow table for Arrow IPC Content-Type, JSON otherwise"""
+    if request.mimetype == ARROW_STREAM_MIMETYPE:
+        with stage_timer(endpoint, 'arrow_decode'):
+            try:
+                return read_table(request.get_data())
+            except ArrowRequestError as e:
+                raise ScoringRequestError({"error": str(e)}, 400)
+    with stage_timer(endpoint, 'json_parse'):
+        return request.json
+
+def _arrow_response(columns, metadata=None):
+    return Response(write_table(columns, metadata), mimetype=ARROW_STREAM_MIMETYPE)
 
-def encode_enhanced_features(user_data, candidate_data):
-    """Encode user and candidate data into enhanced model features"""
+def _request_filter(data):
+    """Parsed "filter" spec of a request, None when it has none"""
     try:
-        logger.info(f"🔧 Encoding enhanced features for user-candidate pair")
-        
-        # Initialize feature vector
-        features = np.zeros(len(model_columns))
-        feature_dict = {}
-        
-        # Basic demographic features
-        feature_dict['age_difference'] = abs(user_data.get('age', 25) - candidate_data.get('age', 25))
-        feature_dict['same_city'] = 1 if user_data.get('city') == candidate_data.get('city') else 0
-        feature_dict['same_locality'] = 1 if user_data.get('locality') == candidate_data.get('locality') else 0
-        feature_dict['same_gender'] = 1 if user_data.get('gender') == candidate_data.get('gender') else 0
-        
-        # Budget compatibility
-        budget_order = ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+']
+        if is_table(data):
+            spec = metadata_json(data, 'filter')
+        else:
+            spec = data.get('filter') if isinstance(data, dict) else None
+        return None if spec is None or spec is False else parse_filter(spec)
+    except ValueError as e:
+        raise ScoringRequestError({"error": str(e)}, 400)
+
+def _request_columns(data):
+    """Encode both sides of any supported request schema.
+
+    Returns (user columns, candidate columns, candidate ids or None); the user
+    side has a single row when one user is scored against every candidate.
+    """
+    candidate_ids = None
+    
+    if is_table(data):
+        # Arrow IPC schema: one row per pair with "user.*"/"candidate.*" columns, see arrow_io.py
+        try:
+            return table_columns(data)
+        except ArrowRequestError as e:
+            raise ScoringRequestError({"error": str(e)}, 400)
+    elif isinstance(data, dict) and isinstance(data.get('candidate_refs'), list):
+        # Stored-candidate schema: {"user": {...}, "candidate_refs": [{"id": ..., "version": ...}]}
+        # Optional "candidate_profiles" ({id, version, profile} entries) are stored first, so a
+        # retry after a 409 succeeds whichever worker process serves it
+        if isinstance(data.get('candidate_profiles'), list):
+            candidate_store.upsert(_candidate_entries(data['candidate_profiles']))
+        refs = _candidate_refs(data['candidate_refs'])
+        user = _user_profile(data)
         try:
-            user_budget_idx = budget_order.index(user_data.get('budget', '20000-25000'))
-            cand_budget_idx = budget_order.index(candidate_data.get('budget', '20000-25000'))
-            feature_dict['budget_difference'] = abs(user_budget_idx - cand_budget_idx)
-            feature_dict['budget_compatibility'] = 1 if feature_dict['budget_difference'] <= 1 else 0
-        except:
-            feature_dict['budget_difference'] = 0
-            feature_dict['budget_compatibility'] = 1
+            candidate_columns = candidate_store.gather(refs)
+        except CandidateLookupError as e:
+            raise ScoringRequestError({
+                "error": "Candidate profiles missing or out of date, upsert them via /candidates",
+                "missing": e.missing,
+                "stale": e.stale
+            }, 409)
+        candidate_ids = [candidate_id for candidate_id, _ in refs]
+        user_columns = encode_profiles([user])
+    elif isinstance(data, dict) and isinstance(data.get('candidates'), list):
+        # Shared-user schema: {"user": {...}, "candidates": [...]}
+        user_columns = encode_profiles([_user_profile(data)])
+        if not all(isinstance(candidate, dict) for candidate in data['candidates']):
+            raise ScoringRequestError({"error": "Expected every candidate profile to be an object"}, 400)
+        candidate_columns = encode_profiles(data['candidates'])
+    elif isinstance(data, list):
+        for index, pair in enumerate(data):
+            if not _is_pair(pair):
+                raise ScoringRequestError({"error": "Expected a {user, candidate} object", "index": index}, 400)
+        user_columns = encode_profiles([pair.get('user', {}) for pair in data])
+        candidate_columns = encode_profiles([pair.get('candidate', {}) for pair in data])
+    else:
+        raise ScoringRequestError({"error": "Expected list of user-candidate pairs or a {user, candidates} object"}, 400)
+    
+    return user_columns, candidate_columns, candidate_ids
+
+@app.route('/predict-enhanced', methods=['POST'])
+def predict_enhanced():
+    """Enhanced prediction endpoint using new optimized fields"""
+    if request.mimetype in NDJSON_MIMETYPES:
+        return stream_predictions()
+    
+    try:
+        data = _read_request_body(request.endpoint)
+        logger.debug(f"🎯 Enhanced prediction request received")
         
-        # Lifestyle compatibility
-        feature_dict['sleep_compatibility'] = 1 if user_data.get('sleepPattern') == candidate_data.get('sleepPattern') else 0
-        feature_dict['dietary_compatibility'] = 1 if user_data.get('dietaryPrefs') == candidate_data.get('dietaryPrefs') else 0
-        feature_dict['social_compatibility'] = 1 if user_data.get('socialStyle') == candidate_data.get('socialStyle') else 0
-        feature_dict['weekend_compatibility'] = 1 if user_data.get('weekendStyle') == candidate_data.get('weekendStyle') else 0
-        feature_dict['personality_compatibility'] = 1 if user_data.get('personalityType') == candidate_data.get('personalityType') else 0
+        scores, _, indices, _ = score_request(data, request.endpoint)
         
-        # Hosting compatibility
-        feature_dict['hosting_compatibility'] = calculate_hosting_compatibility(
-            user_data.get('hostingStyle'), candidate_data.get('hostingStyle')
-        )
+        # With a filter, only the surviving pairs are scored; "indices" maps them back to the request
+        with stage_timer(request.endpoint, 'serialize'):
+            if is_table(data):
+                columns = {"match_percentage": scores.astype(np.int32)}
+                if indices is not None:
+                    columns = {"index": indices, **columns}
+                response = _arrow_response(columns)
+            else:
+                body = {"match_percentages": scores.tolist()}
+                if indices is not None:
+                    body["indices"] = indices.tolist()
+                response = jsonify(body)
+        logger.debug(f"✅ Generated {len(scores)} enhanced predictions")
+        return response
         
-        # Cleanliness compatibility
-        user_cleanliness = user_data.get('cleanliness', 3)
-        cand_cleanliness = candidate_data.get('cleanliness', 3)
-        feature_dict['cleanliness_difference'] = abs(user_cleanliness - cand_cleanliness)
-        feature_dict['cleanliness_compatibility'] = 1 if feature_dict['cleanliness_difference'] <= 1 else 0
+    except ScoringRequestError as e:
+        return jsonify(e.body), e.status
+    except Exception as e:
+        logger.error(f"❌ Enhanced prediction error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+def _score_stream_chunk(entries, endpoint):
+    """Score one chunk of (index, pair or error message) entries into NDJSON lines, in input order"""
+    pairs = [pair for _, pair, error in entries if error is None]
+    try:
+        scores = score_request(pairs, endpoint)[0].tolist() if pairs else []
+    except Exception as e:
+        logger.error(f"❌ Streaming chunk error: {str(e)}")
+        return ''.join(json.dumps({"index": index, "error": str(e)}) + '\n' for index, _, _ in entries)
+    
+    lines = []
+    scores = iter(scores)
+    for index, _, error in entries:
+        if error is None:
+            lines.append(f'{{"index": {index}, "match_percentage": {next(scores)}}}\n')
+        else:
+            lines.append(json.dumps({"index": index, "error": error}) + '\n')
+    return ''.join(lines)
+
+def stream_predictions():
+    """Score an NDJSON body of {user, candidate} lines without holding the whole batch.
+
+    The body is read line by line; every STREAM_CHUNK_PAIRS pairs are encoded,
+    scored and written out as {"index", "match_percentage"} lines (or
+    {"index", "error"} for a line that is not a pair) before the next chunk is
+    read, so memory stays bounded by the chunk size.
+    """
+    endpoint = request.endpoint
+    stream = request.stream
+    
+    def generate():
+        entries = []
+        index = 0
+        for line in stream:
+            if not line.strip():
+                continue
+            try:
+                pair = json.loads(line)
+                error = None if _is_pair(pair) else "Expected a {user, candidate} object"
+            except ValueError as e:
+                pair, error = None, f"Invalid JSON: {str(e)}"
+            entries.append((index, pair, error))
+            index += 1
+            if len(entries) >= STREAM_CHUNK_PAIRS:
+                yield _score_stream_chunk(entries, endpoint)
+                entries = []
+        if entries:
+            yield _score_stream_chunk(entries, endpoint)
+        logger.debug(f"✅ Streamed {index} enhanced predictions")
+    
+    return Response(stream_with_context(generate()), mimetype=NDJSON_MIMETYPES[0])
+
+@app.route('/rank', methods=['POST'])
+def rank_candidates():
+    """Score candidates and return only the top K, best first.
+
+    Accepts the same schemas as /predict-enhanced plus optional "k" (default 10),
+    "offset" (default 0), "min_score" and "cascade" (pre-ranker top N, default
+    ML_CASCADE_TOP_N) fields on object requests, or as query parameters for
+    Arrow requests. With a cascade every match reports the "stage" that
+    scored it: "model" or "prerank".
+    """
+    try:
+        data = _read_request_body(request.endpoint)
+        options = request.args if is_table(data) else data if isinstance(data, dict) else {}
         
-        # Substance use compatibility
-        feature_dict['smoking_compatibility'] = 1 if user_data.get('smokingHabits') == candidate_data.get('smokingHabits') else 0
-        feature_dict['drinking_compatibility'] = 1 if user_data.get('drinkingHabits') == candidate_data.get('drinkingHabits') else 0
+        try:
+            k = int(options.get('k', 10))
+            offset = int(options.get('offset', 0))
+            min_score = options.get('min_score')
+            min_score = None if min_score is None else float(min_score)
+            cascade_top_n = int(options.get('cascade', CASCADE_TOP_N))
+        except (TypeError, ValueError):
+            return jsonify({"error": "k, offset, min_score and cascade must be numbers"}), 400
+        if k < 1 or offset < 0 or cascade_top_n < 0:
+            return jsonify({"error": "k must be positive, offset and cascade non-negative"}), 400
         
-        # Interest overlaps
-        feature_dict['hobbies_overlap'] = calculate_array_overlap(
-            user_data.get('hobbies', ''), candidate_data.get('hobbies', '')
-        )
-        feature_dict['interests_overlap'] = calculate_array_overlap(
-            user_data.get('interests', ''), candidate_data.get('interests', '')
-        )
-        feature_dict['music_overlap'] = calculate_array_overlap(
-            user_data.get('musicGenres', ''), candidate_data.get('musicGenres', '')
-        )
-        feature_dict['sports_overlap'] = calculate_array_overlap(
-            user_data.get('sportsActivities', ''), candidate_data.get('sportsActivities', '')
-        )
-        feature_dict['language_overlap'] = calculate_array_overlap(
-            user_data.get('languagesSpoken', ''), candidate_data.get('languagesSpoken', '')
-        )
+        scores, candidate_ids, survivors, model_scored = score_request(data, request.endpoint, cascade_top_n)
+        with stage_timer(request.endpoint, 'top_k'):
+            top, total = select_top_k(scores, k, offset, min_score)
+            # Positions in the filtered scores -> candidate indices in the request
+            indices = top if survivors is None else survivors[top]
         
-        # Pet compatibility
-        feature_dict['pet_ownership_compatibility'] = calculate_pet_compatibility(
-            user_data.get('petOwnership'), candidate_data.get('petOwnership'),
-            user_data.get('petPreference'), candidate_data.get('petPreference')
-        )
+        summary = {"total": total, "k": k, "offset": offset}
+        if survivors is not None:
+            summary["filtered"] = len(survivors)
+        stages = None
+        if model_scored is not None:
+            summary["model_scored"] = int(model_scored.sum())
+            stages = np.where(model_scored[top], 'model', 'prerank').tolist()
         
-        # Map feature dictionary to feature vector
-        for i, feature_name in enumerate(model_columns):
-            if feature_name in feature_dict:
-                features[i] = feature_dict[feature_name]
+        with stage_timer(request.endpoint, 'serialize'):
+            if is_table(data):
+                columns = {"index": indices, "match_percentage": scores[top].astype(np.int32)}
+                if candidate_ids is not None:
+                    columns["id"] = [candidate_ids[index] for index in indices.tolist()]
+                if stages is not None:
+                    columns["stage"] = stages
+                return _arrow_response(columns, summary)
+            
+            matches = []
+            for position, (index, score) in enumerate(zip(indices.tolist(), scores[top].tolist())):
+                match = {"index": index, "match_percentage": score}
+                if candidate_ids is not None:
+                    match["id"] = candidate_ids[index]
+                if stages is not None:
+                    match["stage"] = stages[position]
+                matches.append(match)
+            response = jsonify({"matches": matches, **summary})
         
-        logger.info(f"✅ Successfully encoded {len([f for f in feature_dict.values() if f != 0])} non-zero features")
-        return features.reshape(1, -1)
+        logger.debug(f"✅ Ranked {len(scores)} candidates, returning {len(matches)}")
+        return response
         
+    except ScoringRequestError as e:
+        return jsonify(e.body), e.status
     except Exception as e:
-        logger.error(f"❌ Error encoding enhanced features: {str(e)}")
-        # Return basic feature vector
-        return np.zeros((1, len(model_columns)))
+        logger.error(f"❌ Ranking error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
 
-@app.route('/predict-enhanced', methods=['POST'])
-def predict_enhanced():
-    """Enhanced prediction endpoint using new optimized fields"""
+@app.route('/candidates', methods=['POST'])
+def upsert_candidates():
+    """Store pre-encoded candidate profiles for id-based scoring and update the match index"""
     try:
         data = request.json
-        logger.info(f"🎯 Enhanced prediction request received")
         
         if not isinstance(data, list):
-            return jsonify({"error": "Expected list of user-candidate pairs"}), 400
-        
-        predictions = []
-        
-        for pair in data:
-            user_data = pair.get('user', {})
-            candidate_data = pair.get('candidate', {})
-            
-            # Encode features using enhanced feature engineering
-            features = encode_enhanced_features(user_data, candidate_data)
-            
-            # Get prediction and convert to percentage
-            prediction = model.predict(features)[0]
-            
-            # Count non-zero features for score boosting
-            non_zero_features = np.count_nonzero(features)
-            
-            # Convert to percentage (0.0-1.0 → 0-100)
-            percentage = prediction * 100
-            
-            # Boost score for high feature matches (more sophisticated compatibility)
-            if non_zero_features >= 18:  # Very high compatibility
-                percentage = min(95, percentage * 1.15)  # 15% boost
-            elif non_zero_features >= 15:  # High compatibility  
-                percentage = min(90, percentage * 1.10)  # 10% boost
-            elif non_zero_features >= 12:  # Good compatibility
-                percentage = min(85, percentage * 1.05)  # 5% boost
-            
-            # Clamp between reasonable bounds and round
-            final_score = max(10, min(95, round(percentage)))
-            predictions.append(final_score)
-            
-            logger.info(f"Raw: {prediction:.3f}, Features: {non_zero_features}, Final: {final_score}%")
+            return jsonify({"error": "Expected list of {id, version, profile} entries"}), 400
         
-        logger.info(f"✅ Generated {len(predictions)} enhanced predictions")
-        return jsonify({"match_percentages": predictions})
+        entries = _candidate_entries(data)
+        stored = candidate_store.upsert(entries)
+        indexed = match_index.update(entries) if match_index else 0
+        logger.info(f"✅ Stored {stored} candidate profiles ({len(candidate_store)} total), {indexed} re-indexed")
+        return jsonify({"stored": stored, "indexed": indexed, "total": len(candidate_store)})
         
+    except ScoringRequestError as e:
+        return jsonify(e.body), e.status
     except Exception as e:
-        logger.error(f"❌ Enhanced prediction error: {str(e)}")
+        logger.error(f"❌ Candidate upsert error: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/candidates/<candidate_id>', methods=['DELETE'])
+def delete_candidate(candidate_id):
+    """Remove a candidate profile from the store and the match index"""
+    removed = candidate_store.remove(candidate_id)
+    if match_index and match_index.remove(candidate_id):
+        removed = True
+    if not removed:
+        return jsonify({"error": f"Candidate {candidate_id} is not stored"}), 404
+    return jsonify({"removed": candidate_id, "total": len(candidate_store)})
+
+@app.route('/matches/<user_id>', methods=['GET'])
+def get_matches(user_id):
+    """Precomputed top matches of a user from the match index, best first"""
+    if match_index is None:
+        return jsonify({"error": "The match index is disabled (ML_MATCH_INDEX_PATH is empty)"}), 404
+    try:
+        k = int(request.args.get('k', MATCH_INDEX_K))
+    except ValueError:
+        return jsonify({"error": "k must be a number"}), 400
+    if not 1 <= k <= MATCH_INDEX_K:
+        return jsonify({"error": f"k must be between 1 and {MATCH_INDEX_K}"}), 400
+    
+    try:
+        matches = match_index.matches(user_id, k)
+    except Exception as e:
+        logger.error(f"❌ Match index error: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+    if matches is None:
+        return jsonify({"error": f"User {user_id} is not in the match index, upsert it via /candidates"}), 404
+    return jsonify({
+        "user_id": user_id,
+        "matches": [{"id": candidate_id, "match_percentage": score} for candidate_id, score in matches],
+        "k": k
+    })
+
 @app.route('/model-info', methods=['GET'])
 def model_info():
     """Get information about the enhanced model"""
+    active = serving
     try:
         return jsonify({
             "model_type": "Enhanced Flatmate Matching Model",
-            "features_count": len(model_columns),
+            "inference_engine": inference_engine_name(active.predictor),
+            "model_version": active.version,
+            "model_backend": active.backend,
+            "loaded_at": active.loaded_at,
+            "score_cache": score_cache.stats(),
+            "micro_batch": {"wait_ms": MICRO_BATCH_WAIT_MS, "max_rows": MICRO_BATCH_MAX_ROWS} if micro_batcher else None,
+            "match_index": match_index.stats() if match_index else None,
+            "features_count": len(active.columns),
             "key_features": [
                 "Direct optimized registration fields",
                 "Rich feature engineering",
@@ -321,6 +804,60 @@ def model_info():
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/ready', methods=['GET'])
+def readiness_check():
+    """Readiness endpoint: 200 once a warmed-up model is serving, 503 before.
+
+    Also 503 while a worker still serves a model the watched artifact no longer
+    holds, e.g. a recycled gunicorn worker forked from the master's original model.
+    """
+    active = serving
+    stale = model_watcher is not None and active is not None and model_watcher.stale_model is active
+    ready = active is not None and active.warmed_up and not stale
+    return jsonify({
+        "ready": ready,
+        "stale": stale,
+        "model_version": active.version if active else None,
+        "model_backend": active.backend if active else None,
+        "loaded_at": active.loaded_at if active else None,
+        "warmup_seconds": active.warmup_seconds if active else None,
+        "reload": model_reloader.status()
+    }), 200 if ready else 503
+
+@app.route('/startup', methods=['GET'])
+def startup_timings():
+    """Per-phase startup timings in seconds; under gunicorn these are the master's, which workers inherit"""
+    return jsonify({"phases": STARTUP_TIMINGS, "total_seconds": STARTUP_TIMINGS['total']}), 200
+
+@app.route('/profiles', methods=['GET'])
+def list_profiles():
+    """The slowest of the requests profiled every ML_PROFILE_EVERY_N, slowest first"""
+    if not _token_matches('X-Profile-Token', PROFILE_TOKEN):
+        return jsonify({"error": "Profiles need ML_PROFILE_TOKEN and a matching X-Profile-Token header"}), 403
+    return jsonify({"every_n": PROFILE_EVERY_N, "profiles": worst_profiles.entries()}), 200
+
+@app.route('/reload', methods=['POST'])
+def reload_model():
+    """Load, warm up and swap in a model artifact in the background.
+
+    Optional JSON body {"artifact": path}, defaulting to ML_MODEL_ARTIFACT.
+    Under multi-worker gunicorn this reaches a single worker; use
+    ML_MODEL_WATCH_SECONDS to reload every worker.
+    """
+    if not _token_matches('X-Reload-Token', RELOAD_TOKEN):
+        return jsonify({"error": "Reloading needs ML_RELOAD_TOKEN and a matching X-Reload-Token header"}), 403
+    data = request.get_json(silent=True) or {}
+    artifact_path = data.get('artifact') if isinstance(data, dict) else None
+    if not model_reloader.start(artifact_path):
+        return jsonify({"error": "A reload is already running", "reload": model_reloader.status()}), 409
+    return jsonify({"status": "reloading", "artifact": artifact_path or MODEL_ARTIFACT_PATH}), 202
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus metrics for this worker process"""
+    return Response(REGISTRY.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))  # Use port 5001 for ML service
+    start_model_watcher()
     app.run(host='0.0.0.0', port=port, debug=False)
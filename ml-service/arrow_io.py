@@ -0,0 +1,130 @@
+"""
+Homiee ML Service - Arrow IPC Batch I/O
+Reads scoring batches from Apache Arrow IPC streams and writes scores back as Arrow
+
+A request table has one row per pair, with profile fields as "user.<field>"
+and "candidate.<field>" columns (e.g. "user.age", "candidate.hobbies").
+Multi-valued fields may be list<string> or ';'-separated strings. A null
+scores like a JSON null and a missing column like a missing key. Instead of
+"user.*" columns, a single user profile may be given as JSON under the "user"
+key of the schema metadata and is scored against every row. A pre-filter
+spec (see prefilter.parse_filter) goes under the "filter" key the same way.
+
+pyarrow is imported on first use rather than with the module, so services
+that import this never pay for it at startup unless an Arrow request comes.
+"""
+import json
+import sys
+
+import numpy as np
+
+from feature_encoder import NUMERIC_DEFAULTS, encode_profile_columns, encode_profiles
+
+ARROW_STREAM_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+USER_PREFIX = 'user.'
+CANDIDATE_PREFIX = 'candidate.'
+ID_COLUMN = 'candidate.id'
+
+
+pa = pc = None  # pyarrow and pyarrow.compute, see _import_arrow
+
+
+class ArrowRequestError(ValueError):
+    """Raised when an Arrow body is not a readable pairs table"""
+
+
+def _import_arrow():
+    global pa, pc
+    if pa is None:
+        import pyarrow
+        import pyarrow.compute
+        pa, pc = pyarrow, pyarrow.compute
+
+
+def is_table(data):
+    # A Table can only exist once pyarrow is imported, so this never imports it
+    pyarrow = sys.modules.get('pyarrow')
+    return pyarrow is not None and isinstance(data, pyarrow.Table)
+
+
+def read_table(body):
+    """Decode an Arrow IPC stream into a Table"""
+    _import_arrow()
+    try:
+        return pa.ipc.open_stream(pa.py_buffer(body)).read_all()
+    except (pa.ArrowInvalid, OSError) as e:
+        raise ArrowRequestError(f"Invalid Arrow IPC stream: {str(e)}")
+
+
+def _numeric_column(array):
+    """(values, null) for a numeric field, values None when the column is not numeric"""
+    null = array.is_null().to_numpy(zero_copy_only=False)
+    if not (pa.types.is_integer(array.type) or pa.types.is_floating(array.type) or pa.types.is_boolean(array.type)):
+        return None, null
+    values = array.cast(pa.float64()).fill_null(0).to_numpy(zero_copy_only=False)
+    return values, null
+
+
+def _dictionary_column(array):
+    """(indices, dictionary) for any other field, index -1 where the value is null"""
+    if pa.types.is_list(array.type) or pa.types.is_large_list(array.type):
+        array = pc.binary_join(array.cast(pa.list_(pa.string())), ';')
+    encoded = array.dictionary_encode()
+    indices = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False).astype(np.int64)
+    return indices, encoded.dictionary.to_pylist()
+
+
+def profile_columns(table, prefix):
+    """Columnar profile fields under `prefix`, in the form encode_profile_columns expects"""
+    _import_arrow()
+    columns = {}
+    for name in table.column_names:
+        if not name.startswith(prefix):
+            continue
+        field = name[len(prefix):]
+        array = table.column(name).combine_chunks()
+        columns[field] = _numeric_column(array) if field in NUMERIC_DEFAULTS else _dictionary_column(array)
+    return columns
+
+
+def metadata_json(table, key):
+    """JSON value stored under `key` in the schema metadata, None when absent"""
+    metadata = table.schema.metadata or {}
+    if key.encode() not in metadata:
+        return None
+    try:
+        return json.loads(metadata[key.encode()])
+    except ValueError as e:
+        raise ArrowRequestError(f"Invalid {key} JSON in schema metadata: {str(e)}")
+
+
+def table_columns(table):
+    """Encoded (user columns, candidate columns, candidate ids or None) of a pairs table"""
+    _import_arrow()
+    candidate_columns = encode_profile_columns(profile_columns(table, CANDIDATE_PREFIX), table.num_rows)
+
+    user = metadata_json(table, 'user')
+    if user is not None:
+        user_columns = encode_profiles([user])
+    else:
+        user_columns = encode_profile_columns(profile_columns(table, USER_PREFIX), table.num_rows)
+
+    candidate_ids = None
+    if ID_COLUMN in table.column_names:
+        candidate_ids = table.column(ID_COLUMN).cast(pa.string()).to_pylist()
+
+    return user_columns, candidate_columns, candidate_ids
+
+
+def write_table(columns, metadata=None):
+    """Serialize named NumPy columns (plus optional string metadata) as an Arrow IPC stream"""
+    _import_arrow()
+    table = pa.table(
+        {name: pa.array(values) for name, values in columns.items()},
+        metadata={key: str(value) for key, value in (metadata or {}).items()} or None
+    )
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
@@ -0,0 +1,259 @@
+"""
+Homiee ML Service - ASGI Entry Point
+Serves the Flask app's routes from an event loop, with scoring offloaded to a bounded thread pool
+
+    uvicorn asgi:app --host 0.0.0.0 --port 5001
+
+Every route of app.py is available. Cheap routes (/health, /ready,
+/metrics, ...) are answered directly on the event loop, so they stay
+responsive while large batches are being scored; /model-info, which counts
+the match index in SQLite, likewise bypasses the scoring pool but runs on the
+loop's default executor so it never blocks the loop. Everything else
+(/predict-enhanced, /rank, /candidates, ...) runs on a pool of
+ML_ASGI_THREADS threads, in which NumPy's encoding and inference release the
+GIL for most of their work. At most ML_ASGI_QUEUE further requests wait for
+a free thread; beyond that a request is answered at once, without reading
+its body, with 503, Retry-After and Connection: close instead of queueing
+until the client times out.
+
+Offloaded request bodies are not buffered: the app reads wsgi.input on its
+pool thread, which pulls the body from the server one ASGI message at a
+time, so NDJSON batches stream through in bounded memory as under gunicorn.
+
+The model is loaded once per process; run several processes with uvicorn's
+--workers. A threaded pool also lets ML_MICRO_BATCH_WAIT_MS combine the
+model calls of concurrent requests.
+"""
+import asyncio
+import io
+import json
+import os
+import sys
+from concurrent.futures import ThreadPoolExecutor
+
+import app as service
+from werkzeug.exceptions import ClientDisconnected
+
+from metrics import REGISTRY, Counter, Gauge
+
+OFFLOAD_THREADS = int(os.environ.get(
+    'ML_ASGI_THREADS', len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+))
+OFFLOAD_QUEUE = int(os.environ.get('ML_ASGI_QUEUE', OFFLOAD_THREADS))
+
+# Answered on the event loop: fast, and needed while the pool is busy
+INLINE_PATHS = {'/', '/health', '/ready', '/startup', '/metrics'}
+
+# Also needed while the pool is busy, but they wait on SQLite: run on the loop's default executor
+BLOCKING_INLINE_PATHS = {'/model-info'}
+
+# Read buffer in front of a streamed request body
+BODY_BUFFER_BYTES = 64 * 1024
+
+OFFLOAD_IN_FLIGHT = REGISTRY.register(Gauge(
+    'ml_asgi_offload_in_flight', 'Requests running on or waiting for the ASGI scoring pool'
+))
+OFFLOAD_REJECTED = REGISTRY.register(Counter(
+    'ml_asgi_offload_rejected_total', 'Requests answered with 503 because the ASGI scoring pool was full'
+))
+
+
+class _RequestBody(io.RawIOBase):
+    """Request body read from a pool thread, pulling each ASGI message from the event loop on demand.
+
+    The server only reads more of the body from the socket as the app
+    consumes it, so a large upload is never held in memory as a whole.
+    """
+
+    def __init__(self, receive, loop):
+        self._receive = receive
+        self._loop = loop
+        self._chunk = memoryview(b'')
+        self._more = True
+
+    def readable(self):
+        return True
+
+    def _next_message(self):
+        message = asyncio.run_coroutine_threadsafe(self._receive(), self._loop).result()
+        if message['type'] == 'http.disconnect':
+            self._more = False
+            raise ClientDisconnected()
+        self._chunk = memoryview(message.get('body', b''))
+        self._more = message.get('more_body', False)
+
+    def readinto(self, buffer):
+        while not self._chunk and self._more:
+            self._next_message()
+        size = min(len(buffer), len(self._chunk))
+        buffer[:size] = self._chunk[:size]
+        self._chunk = self._chunk[size:]
+        return size
+
+    def drain(self):
+        """Discard whatever the app left unread, so the server can answer on a clean connection"""
+        self._chunk = memoryview(b'')
+        try:
+            while self._more:
+                self._next_message()
+        except ClientDisconnected:
+            pass
+
+
+def _wsgi_environ(scope, stream):
+    """WSGI environ for an ASGI HTTP scope, with `stream` as its request body"""
+    server = scope.get('server') or ('localhost', 80)
+    client = scope.get('client') or ('', 0)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': str(server[0]),
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': str(client[0]),
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        # The stream ends with the body, so it can be read without a Content-Length (chunked uploads)
+        'wsgi.input_terminated': True,
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name in ('content-type', 'content-length'):
+            key = name.upper().replace('-', '_')
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+def _call_flask(environ):
+    """Run the Flask app on an environ, returns (status code, ASGI headers, body iterable)"""
+    response = {}
+
+    def start_response(status, headers, exc_info=None):
+        if exc_info and response:
+            raise exc_info[1].with_traceback(exc_info[2])
+        response['status'] = int(status.split(' ', 1)[0])
+        response['headers'] = [(name.lower().encode('latin-1'), value.encode('latin-1')) for name, value in headers]
+
+    body = service.app(environ, start_response)
+    return response['status'], response['headers'], body
+
+
+def _call_flask_buffered(environ):
+    """_call_flask with the whole response body joined, for the small responses of inline routes"""
+    status, headers, body = _call_flask(environ)
+    try:
+        return status, headers, b''.join(body)
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+def _serve_offloaded(scope, receive, send, loop):
+    """Pool thread: run the app on the streamed request body and stream its response back, chunk by chunk"""
+    def send_from_thread(message):
+        asyncio.run_coroutine_threadsafe(send(message), loop).result()
+
+    request_body = _RequestBody(receive, loop)
+    environ = _wsgi_environ(scope, io.BufferedReader(request_body, BODY_BUFFER_BYTES))
+    status, headers, body = _call_flask(environ)
+    try:
+        send_from_thread({'type': 'http.response.start', 'status': status, 'headers': headers})
+        for chunk in body:
+            if chunk:
+                send_from_thread({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        request_body.drain()
+        send_from_thread({'type': 'http.response.body', 'body': b'', 'more_body': False})
+    finally:
+        if hasattr(body, 'close'):
+            body.close()
+
+
+async def _read_body(receive):
+    """Read a whole request body, returns it or None if the client disconnected"""
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return None
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+class ScoringApp:
+    """ASGI application in front of app.app"""
+
+    def __init__(self, threads=OFFLOAD_THREADS, queue=OFFLOAD_QUEUE):
+        self.threads = threads
+        self.capacity = threads + queue
+        self.in_flight = 0  # only touched on the event loop, so no lock
+        self.executor = None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self._lifespan(receive, send)
+        elif scope['type'] == 'http':
+            await self._http(scope, receive, send)
+
+    async def _lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='scoring')
+                service.start_model_watcher()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                if self.executor is not None:
+                    self.executor.shutdown(wait=True)
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def _http(self, scope, receive, send):
+        if scope['path'] in INLINE_PATHS or scope['path'] in BLOCKING_INLINE_PATHS:
+            body = await _read_body(receive)
+            if body is None:
+                return
+            environ = _wsgi_environ(scope, io.BytesIO(body))
+            if scope['path'] in BLOCKING_INLINE_PATHS:
+                status, headers, content = await asyncio.get_running_loop().run_in_executor(None, _call_flask_buffered, environ)
+            else:
+                status, headers, content = _call_flask_buffered(environ)
+            await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            await send({'type': 'http.response.body', 'body': content})
+            return
+
+        if self.in_flight >= self.capacity:
+            # Answered without reading the body, which may be large: the server closes the
+            # connection after the response instead of reading what is left of the request
+            OFFLOAD_REJECTED.inc()
+            await send({'type': 'http.response.start', 'status': 503, 'headers': [
+                (b'content-type', b'application/json'), (b'retry-after', b'1'), (b'connection', b'close'),
+            ]})
+            await send({'type': 'http.response.body', 'body': json.dumps(
+                {"error": "Scoring capacity exhausted, retry shortly"}
+            ).encode()})
+            return
+
+        if self.executor is None:
+            # Servers without lifespan support never send lifespan.startup
+            self.executor = ThreadPoolExecutor(self.threads, thread_name_prefix='scoring')
+        self.in_flight += 1
+        OFFLOAD_IN_FLIGHT.set(self.in_flight)
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(self.executor, _serve_offloaded, scope, receive, send, loop)
+        finally:
+            self.in_flight -= 1
+            OFFLOAD_IN_FLIGHT.set(self.in_flight)
+
+
+app = ScoringApp()
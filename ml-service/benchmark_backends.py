@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Homiee ML Service - Model Backend Benchmark
+Trains every model backend on the same training set and compares accuracy with serving cost
+
+Each backend (see model_backends.py) is fitted on the cached synthetic
+training set from retrain_model.py and scored on a held-out split (R², MSE).
+Its model artifact is then exported exactly as retrain_model.py does, and
+the array engine the service would serve is timed on single pairs and on
+1k-pair batches, next to sklearn's own predict for reference, together with
+the artifact's size and load time. Timings are medians over --repeat runs.
+
+Usage:
+    python benchmark_backends.py [--samples 200000] [--backends random_forest linear] [--json results.json]
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import time
+import warnings
+
+import numpy as np
+from sklearn.metrics import mean_squared_error, r2_score
+from sklearn.model_selection import train_test_split
+
+from model_artifact import load_artifact
+from model_backends import BACKENDS
+from retrain_model import TRAINING_DATA_DIR, create_feature_columns, export_model_artifact, load_training_data
+
+logger = logging.getLogger(__name__)
+
+BATCH_PAIRS = 1000
+
+
+def _median_seconds(fn, repeat):
+    """Median wall time of `repeat` calls of fn(i), after one warm-up call"""
+    fn(0)
+    timings = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        fn(i)
+        timings.append(time.perf_counter() - started)
+    return float(np.median(timings))
+
+
+def benchmark_backend(backend, X_train, X_test, y_train, y_test, feature_columns, directory, repeat):
+    """Fit, evaluate and time one backend, returns its result row"""
+    model = backend.create()
+    started = time.perf_counter()
+    model.fit(X_train, y_train)
+    fit_seconds = time.perf_counter() - started
+
+    y_pred = model.predict(X_test)
+    artifact_path = os.path.join(directory, f"{backend.name}.bin")
+    header = export_model_artifact(model, feature_columns, artifact_path)
+    engine, _ = load_artifact(artifact_path)
+
+    singles = X_test[:repeat + 1]
+    batch = X_test[:BATCH_PAIRS]
+    return {
+        'backend': backend.name,
+        'model_type': header['model_type'],
+        'r2': float(r2_score(y_test, y_pred)),
+        'mse': float(mean_squared_error(y_test, y_pred)),
+        'fit_seconds': fit_seconds,
+        'single_pair_ms': _median_seconds(lambda i: engine.predict(singles[i:i + 1]), repeat) * 1000,
+        'batch_1k_ms': _median_seconds(lambda i: engine.predict(batch), repeat) * 1000,
+        'sklearn_single_pair_ms': _median_seconds(lambda i: model.predict(singles[i:i + 1]), repeat) * 1000,
+        'sklearn_batch_1k_ms': _median_seconds(lambda i: model.predict(batch), repeat) * 1000,
+        'artifact_bytes': os.path.getsize(artifact_path),
+        'load_ms': _median_seconds(lambda i: load_artifact(artifact_path), repeat) * 1000,
+    }
+
+
+def format_table(results):
+    columns = [
+        ('backend', '{}'), ('r2', '{:.4f}'), ('mse', '{:.5f}'), ('fit_seconds', '{:.1f}'),
+        ('single_pair_ms', '{:.3f}'), ('batch_1k_ms', '{:.2f}'),
+        ('sklearn_single_pair_ms', '{:.3f}'), ('sklearn_batch_1k_ms', '{:.2f}'),
+        ('artifact_bytes', '{:,}'), ('load_ms', '{:.2f}'),
+    ]
+    rows = [[name for name, _ in columns]] + [[fmt.format(result[name]) for name, fmt in columns] for result in results]
+    widths = [max(len(row[i]) for row in rows) for i in range(len(columns))]
+    return '\n'.join('  '.join(cell.rjust(width) for cell, width in zip(row, widths)) for row in rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare model backends on accuracy and serving cost")
+    parser.add_argument('--samples', type=int, default=200000, help="synthetic training pairs (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=42, help="seed for the synthetic training data")
+    parser.add_argument('--backends', nargs='+', choices=list(BACKENDS), default=list(BACKENDS))
+    parser.add_argument('--dataset-dir', default=TRAINING_DATA_DIR,
+                        help="training dataset cache directory (default: %(default)s)")
+    parser.add_argument('--repeat', type=int, default=50, help="timed runs per measurement (default: %(default)s)")
+    parser.add_argument('--json', metavar='FILE', help="also write the results as JSON")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    warnings.filterwarnings('ignore')
+
+    feature_columns = create_feature_columns()
+    features, scores, _ = load_training_data(args.samples, args.seed, args.dataset_dir)
+    X_train, X_test, y_train, y_test = train_test_split(features, scores, test_size=0.2, random_state=42)
+
+    results = []
+    with tempfile.TemporaryDirectory() as directory:
+        for name in args.backends:
+            logger.info(f"Benchmarking {name}...")
+            results.append(benchmark_backend(
+                BACKENDS[name], X_train, X_test, y_train, y_test, feature_columns, directory, args.repeat
+            ))
+
+    print(format_table(results))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'samples': args.samples, 'seed': args.seed, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
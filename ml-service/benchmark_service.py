@@ -0,0 +1,232 @@
+#!/usr/bin/env python3
+"""
+Homiee ML Service - Scoring Service Benchmark
+Latency and throughput of /predict-enhanced at growing batch sizes, with JSON results and a regression gate
+
+Requests are lists of {"user", "candidate"} pairs built from the synthetic
+profiles of retrain_model.py. Two targets can be driven:
+  - flask: the app in-process through its test client. Per-stage times
+    (json_parse, feature_encode, model_predict, post_process, serialize)
+    come from the service's own ml_stage_duration_seconds histograms.
+  - gunicorn: a local `gunicorn -c gunicorn.conf.py app:app` over HTTP,
+    with --concurrency client threads. Only end-to-end latency and
+    throughput are reported, since stage metrics are per worker.
+
+The score cache is disabled (ML_SCORE_CACHE_SIZE=0) unless --score-cache is
+given, so repeated requests measure the model rather than cache hits.
+
+With --baseline, each (target, pairs) median latency is compared to an
+earlier results file and the run fails when one is slower by more than
+--threshold (relative) and --min-delta-ms (absolute).
+
+Usage:
+    python benchmark_service.py [--targets flask gunicorn] [--json results.json] [--baseline previous.json]
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+SERVICE_DIR = os.path.dirname(os.path.abspath(__file__))
+PAIR_COUNTS = (1, 10, 100, 1000, 10000)
+ENDPOINT_PATH = '/predict-enhanced'
+
+
+def build_bodies(pair_counts, seed):
+    """JSON request body per pair count, every pair drawn from retrain_model's synthetic profiles"""
+    from retrain_model import sample_profiles
+
+    rng = np.random.default_rng(seed)
+    bodies = {}
+    for n_pairs in pair_counts:
+        users, candidates = sample_profiles(rng, n_pairs), sample_profiles(rng, n_pairs)
+        bodies[n_pairs] = json.dumps([{"user": u, "candidate": c} for u, c in zip(users, candidates)]).encode()
+    return bodies
+
+
+def summarize(latencies, elapsed, n_pairs):
+    latencies = np.asarray(latencies)
+    return {
+        'pairs': n_pairs,
+        'requests': len(latencies),
+        'p50_ms': float(np.percentile(latencies, 50) * 1000),
+        'p95_ms': float(np.percentile(latencies, 95) * 1000),
+        'mean_ms': float(latencies.mean() * 1000),
+        'pairs_per_second': float(n_pairs * len(latencies) / elapsed),
+    }
+
+
+def bench_flask(bodies, repeat, warmup):
+    """Drive the app in-process, with per-stage means from the stage histograms"""
+    import app as service
+    from metrics import STAGE_LATENCY
+
+    client = service.app.test_client()
+    endpoint = service.app.url_map.bind('localhost').match(ENDPOINT_PATH, method='POST')[0]
+    results = []
+    for n_pairs, body in bodies.items():
+        for _ in range(warmup):
+            client.post(ENDPOINT_PATH, data=body, content_type='application/json')
+
+        before = STAGE_LATENCY.totals()
+        latencies = []
+        started = time.perf_counter()
+        for _ in range(repeat):
+            request_started = time.perf_counter()
+            response = client.post(ENDPOINT_PATH, data=body, content_type='application/json')
+            latencies.append(time.perf_counter() - request_started)
+            if response.status_code != 200:
+                raise RuntimeError(f"{ENDPOINT_PATH} returned {response.status_code}: {response.get_data(as_text=True)}")
+        elapsed = time.perf_counter() - started
+
+        stages = {}
+        for (series_endpoint, stage), (total, count) in STAGE_LATENCY.totals().items():
+            previous_total, previous_count = before.get((series_endpoint, stage), (0.0, 0))
+            if series_endpoint == endpoint and count > previous_count:
+                stages[stage] = (total - previous_total) / (count - previous_count) * 1000
+
+        results.append({'target': 'flask', **summarize(latencies, elapsed, n_pairs), 'stages_ms': stages})
+        logger.info(f"flask {n_pairs} pairs: p50 {results[-1]['p50_ms']:.2f}ms")
+    return results
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _post(url, body):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': 'application/json'})
+    started = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=120) as response:
+        response.read()
+    return time.perf_counter() - started
+
+
+def bench_gunicorn(bodies, repeat, warmup, workers, concurrency, env):
+    """Start a local gunicorn, then time `repeat` requests per size from `concurrency` client threads"""
+    port = _free_port()
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'app:app'],
+        cwd=SERVICE_DIR,
+        env={**env, 'PORT': str(port), 'WEB_CONCURRENCY': str(workers)},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                urllib.request.urlopen(f"{base_url}/health", timeout=2).read()
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not come up")
+                time.sleep(0.25)
+
+        results = []
+        url = base_url + ENDPOINT_PATH
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            for n_pairs, body in bodies.items():
+                list(pool.map(lambda _: _post(url, body), range(warmup * concurrency)))
+                started = time.perf_counter()
+                latencies = list(pool.map(lambda _: _post(url, body), range(repeat)))
+                elapsed = time.perf_counter() - started
+                results.append({
+                    'target': 'gunicorn', 'workers': workers, 'concurrency': concurrency,
+                    **summarize(latencies, elapsed, n_pairs),
+                })
+                logger.info(f"gunicorn {n_pairs} pairs: p50 {results[-1]['p50_ms']:.2f}ms")
+        return results
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def find_regressions(results, baseline, threshold, min_delta_ms):
+    """(target, pairs, baseline p50, new p50) for every result slower than its baseline entry"""
+    previous = {(entry['target'], entry['pairs']): entry['p50_ms'] for entry in baseline['results']}
+    regressions = []
+    for entry in results:
+        old = previous.get((entry['target'], entry['pairs']))
+        if old is None:
+            continue
+        if entry['p50_ms'] > old * (1 + threshold) and entry['p50_ms'] - old > min_delta_ms:
+            regressions.append((entry['target'], entry['pairs'], old, entry['p50_ms']))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /predict-enhanced latency and throughput")
+    parser.add_argument('--targets', nargs='+', choices=('flask', 'gunicorn'), default=['flask'])
+    parser.add_argument('--pairs', type=int, nargs='+', default=list(PAIR_COUNTS), help="pairs per request")
+    parser.add_argument('--repeat', type=int, default=20, help="timed requests per size (default: %(default)s)")
+    parser.add_argument('--warmup', type=int, default=2, help="untimed requests per size (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="seed for the synthetic profiles")
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers (default: %(default)s)")
+    parser.add_argument('--concurrency', type=int, default=2, help="gunicorn client threads (default: %(default)s)")
+    parser.add_argument('--score-cache', action='store_true', help="leave the score cache enabled")
+    parser.add_argument('--json', metavar='FILE', help="write the results as JSON")
+    parser.add_argument('--baseline', metavar='FILE', help="results JSON of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help="allowed relative p50 slowdown against the baseline (default: %(default)s)")
+    parser.add_argument('--min-delta-ms', type=float, default=0.5,
+                        help="ignore slowdowns smaller than this many ms (default: %(default)s)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+
+    # Settings for the service, applied before the app is imported (flask) or started (gunicorn)
+    service_env = {'LOG_LEVEL': 'WARNING', 'ML_MATCH_INDEX_PATH': ''}
+    if not args.score_cache:
+        service_env['ML_SCORE_CACHE_SIZE'] = '0'
+    os.environ.update(service_env)
+    sys.path.insert(0, SERVICE_DIR)
+
+    bodies = build_bodies(args.pairs, args.seed)
+    results = []
+    if 'flask' in args.targets:
+        results += bench_flask(bodies, args.repeat, args.warmup)
+    if 'gunicorn' in args.targets:
+        results += bench_gunicorn(bodies, args.repeat, args.warmup, args.workers, args.concurrency, dict(os.environ))
+
+    report = {
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'cpu_count': os.cpu_count(),
+        'score_cache': args.score_cache,
+        'results': results,
+    }
+    for entry in results:
+        stages = ', '.join(f"{stage} {ms:.2f}" for stage, ms in entry.get('stages_ms', {}).items())
+        print(f"{entry['target']:>8} {entry['pairs']:>6} pairs  p50 {entry['p50_ms']:9.2f}ms  "
+              f"p95 {entry['p95_ms']:9.2f}ms  {entry['pairs_per_second']:10.0f} pairs/s  {stages}")
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = find_regressions(results, json.load(f), args.threshold, args.min_delta_ms)
+        for target, n_pairs, old, new in regressions:
+            print(f"REGRESSION {target} {n_pairs} pairs: p50 {old:.2f}ms -> {new:.2f}ms")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
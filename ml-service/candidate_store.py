@@ -0,0 +1,132 @@
+"""
+Homiee ML Service - Candidate Feature Store
+Keeps pre-encoded candidate profiles keyed by user id and profile version
+"""
+import threading
+
+import numpy as np
+
+from feature_encoder import CATEGORY_FIELDS, MASK_WORDS, OVERLAP_FEATURES, encode_profiles, take_rows
+
+
+class CandidateLookupError(LookupError):
+    """Raised when requested candidates are missing from the store or out of date"""
+
+    def __init__(self, missing, stale):
+        self.missing = missing
+        self.stale = stale
+        super().__init__(f"{len(missing)} missing and {len(stale)} stale candidate profiles")
+
+
+class CandidateStore:
+    """Columnar store of encoded candidate profiles.
+
+    Each candidate occupies one row in every column (multi-valued fields are
+    vocabulary bitmasks); lookups gather rows with fancy indexing so scoring
+    never re-parses the raw profile strings.
+    """
+
+    def __init__(self, initial_capacity=1024):
+        self._lock = threading.Lock()
+        self._rows = {}
+        self._free_rows = []
+        self._versions = []
+        self._capacity = 0
+        self._size = 0
+        self._columns = None
+        self._grow(initial_capacity)
+
+    def __len__(self):
+        return len(self._rows)
+
+    def _grow(self, capacity):
+        """Resize every column to hold at least `capacity` rows"""
+        old_capacity = self._capacity
+        old = self._columns
+        columns = {
+            'invalid': np.zeros(capacity, dtype=bool),
+            'age': np.zeros(capacity, dtype=np.float64),
+            'cleanliness': np.zeros(capacity, dtype=np.float64),
+            'budget': np.full(capacity, -1, dtype=np.int64),
+            'categories': {field: np.zeros(capacity, dtype=np.int64) for field in CATEGORY_FIELDS},
+            'masks': {field: np.zeros((capacity, MASK_WORDS[field]), dtype=np.uint64) for field in OVERLAP_FEATURES},
+        }
+        if old is not None:
+            for key in ('invalid', 'age', 'cleanliness', 'budget'):
+                columns[key][:old_capacity] = old[key]
+            for field in CATEGORY_FIELDS:
+                columns['categories'][field][:old_capacity] = old['categories'][field]
+            for field in OVERLAP_FEATURES:
+                columns['masks'][field][:old_capacity] = old['masks'][field]
+        self._versions.extend([None] * (capacity - old_capacity))
+        self._columns = columns
+        self._capacity = capacity
+
+    def _allocate_row(self):
+        """Return a free row index, growing the columns when full"""
+        if self._free_rows:
+            return self._free_rows.pop()
+        if self._size == self._capacity:
+            self._grow(self._capacity * 2)
+        row = self._size
+        self._size += 1
+        return row
+
+    def upsert(self, entries):
+        """Encode and store (candidate_id, version, profile) entries, returns the number written"""
+        if not entries:
+            return 0
+
+        encoded = encode_profiles([profile for _, _, profile in entries])
+
+        with self._lock:
+            for i, (candidate_id, version, _) in enumerate(entries):
+                row = self._rows.get(candidate_id)
+                if row is None:
+                    row = self._allocate_row()
+                    self._rows[candidate_id] = row
+                self._versions[row] = version
+
+                columns = self._columns
+                for key in ('invalid', 'age', 'cleanliness', 'budget'):
+                    columns[key][row] = encoded[key][i]
+                for field in CATEGORY_FIELDS:
+                    columns['categories'][field][row] = encoded['categories'][field][i]
+                for field in OVERLAP_FEATURES:
+                    columns['masks'][field][row] = encoded['masks'][field][i]
+
+        return len(entries)
+
+    def remove(self, candidate_id):
+        """Drop a candidate from the store, returns False when it was not stored"""
+        with self._lock:
+            row = self._rows.pop(candidate_id, None)
+            if row is None:
+                return False
+            self._versions[row] = None
+            self._free_rows.append(row)
+            return True
+
+    def gather(self, refs):
+        """Encoded columns for (candidate_id, version) refs, in request order.
+
+        A version of None accepts whatever version is stored. Raises
+        CandidateLookupError listing every missing or stale candidate.
+        """
+        with self._lock:
+            rows = np.empty(len(refs), dtype=np.int64)
+            missing, stale = [], []
+            for i, (candidate_id, version) in enumerate(refs):
+                row = self._rows.get(candidate_id)
+                if row is None:
+                    missing.append(candidate_id)
+                    continue
+                if version is not None and self._versions[row] != version:
+                    stale.append(candidate_id)
+                    continue
+                rows[i] = row
+
+            if missing or stale:
+                raise CandidateLookupError(missing, stale)
+
+            return take_rows(self._columns, rows)
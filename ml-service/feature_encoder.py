@@ -0,0 +1,383 @@
+"""
+Homiee ML Service - Batch Feature Encoding
+Column-wise encoding of many user-candidate pairs into a single feature matrix
+"""
+import functools
+import hashlib
+import numbers
+
+import numpy as np
+
+BUDGET_ORDER = ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+']
+
+_BUDGET_INDEX = {budget: idx for idx, budget in enumerate(BUDGET_ORDER)}
+
+# Profile field -> feature name for the plain equality features
+EQUALITY_FEATURES = {
+    'city': 'same_city',
+    'locality': 'same_locality',
+    'gender': 'same_gender',
+    'sleepPattern': 'sleep_compatibility',
+    'dietaryPrefs': 'dietary_compatibility',
+    'socialStyle': 'social_compatibility',
+    'weekendStyle': 'weekend_compatibility',
+    'personalityType': 'personality_compatibility',
+    'smokingHabits': 'smoking_compatibility',
+    'drinkingHabits': 'drinking_compatibility',
+}
+
+# Profile field -> feature name for the multi-valued overlap features
+OVERLAP_FEATURES = {
+    'hobbies': 'hobbies_overlap',
+    'interests': 'interests_overlap',
+    'musicGenres': 'music_overlap',
+    'sportsActivities': 'sports_overlap',
+    'languagesSpoken': 'language_overlap',
+}
+
+# The options used by retrain_model.generate_training_data, i.e. the items the
+# model was trained on. Fixed: items outside them share the overflow bits below
+OVERLAP_VOCABULARIES = {
+    'hobbies': ['Reading', 'Cooking', 'Gaming', 'Photography', 'Gardening', 'Yoga', 'Meditation'],
+    'interests': ['Technology', 'Arts', 'Science', 'History', 'Politics', 'Business', 'Health'],
+    'musicGenres': ['Pop', 'Rock', 'Classical', 'Jazz', 'Hip-hop', 'Electronic', 'Folk'],
+    'sportsActivities': ['Cricket', 'Football', 'Basketball', 'Tennis', 'Swimming', 'Gym', 'Running'],
+    'languagesSpoken': ['English', 'Hindi', 'Bengali', 'Tamil', 'Telugu', 'Marathi', 'Gujarati'],
+}
+
+_vocabulary_index = {
+    field: {item: bit for bit, item in enumerate(items)} for field, items in OVERLAP_VOCABULARIES.items()
+}
+_WORD_MASK = (1 << 64) - 1
+
+# Items outside a field's vocabulary are hashed into one extra word of overflow
+# bits after it, so mask width is fixed however many distinct items requests send
+OVERFLOW_BITS = 64
+_overflow_shift = {field: 64 * -(-len(items) // 64) for field, items in OVERLAP_VOCABULARIES.items()}
+# uint64 words per encoded mask: the vocabulary's, then the overflow word
+MASK_WORDS = {field: shift // 64 + 1 for field, shift in _overflow_shift.items()}
+
+CATEGORY_FIELDS = list(EQUALITY_FEATURES) + ['hostingStyle', 'petOwnership', 'petPreference']
+
+# Distinct recent values (categories and unseen items) whose codes are kept in memory
+CATEGORY_CACHE_SIZE = 65536
+
+
+def _value_hash(value):
+    """63-bit hash of a JSON value, the same in every process; values that compare equal (1, 1.0, True) hash equal"""
+    if isinstance(value, bool) or (isinstance(value, float) and value.is_integer()):
+        value = int(value)
+    key = f"{type(value).__name__}:{value if isinstance(value, (str, int, float)) else repr(value)}"
+    digest = hashlib.blake2b(key.encode('utf-8', 'surrogatepass'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') >> 1
+
+
+@functools.lru_cache(maxsize=CATEGORY_CACHE_SIZE)
+def _cached_value_code(value):
+    return 0 if value is None else _value_hash(value) or 1
+
+
+def category_code(value):
+    """Integer code for a categorical value (equal values share a code, None is 0).
+
+    Codes are derived from the value itself rather than from a table that
+    grows with every new value, so memory stays bounded and every process
+    agrees on them.
+    """
+    try:
+        return _cached_value_code(value)
+    except TypeError:
+        # Unhashable JSON values (lists, objects) are keyed by their repr
+        return _value_hash(value) or 1
+
+
+HOSTING_EITHER = category_code('Either')
+HOSTING_HOST = category_code('I like hosting')
+HOSTING_GUEST = category_code('I like being guest')
+OWN_PETS = category_code('Own pets')
+NO_PETS = category_code('No pets')
+LOVE_PETS = category_code('Love pets')
+OKAY_WITH_PETS = category_code('Okay with pets')
+NO_PETS_PLEASE = category_code('No pets please')
+
+
+def _item_set(value):
+    """Parse a multi-valued field into a set, or None when it cannot overlap"""
+    if not value:
+        return None
+    try:
+        items = set(str(value).split(';')) if isinstance(value, str) else set(value)
+    except TypeError:
+        return None
+    return items or None
+
+
+def _item_bits(field, items):
+    """Bitmask of a parsed item set over the field's vocabulary, unseen items in its overflow bits"""
+    index = _vocabulary_index[field]
+    mask = 0
+    for item in items:
+        bit = index.get(item)
+        if bit is None:
+            bit = _overflow_shift[field] + _cached_value_code(item) % OVERFLOW_BITS
+        mask |= 1 << bit
+    return mask
+
+
+def _mask_words(masks, field):
+    """Split Python int bitmasks into an (n, n_words) uint64 array"""
+    n_words = MASK_WORDS[field]
+    words = np.zeros((len(masks), n_words), dtype=np.uint64)
+    for w in range(n_words):
+        shift = 64 * w
+        words[:, w] = [(mask >> shift) & _WORD_MASK for mask in masks]
+    return words
+
+
+def encode_item_masks(profiles, field):
+    """Encode a multi-valued field of every profile as vocabulary bitmask words"""
+    masks = []
+    for profile in profiles:
+        items = _item_set(profile.get(field, ''))
+        masks.append(_item_bits(field, items) if items else 0)
+    return _mask_words(masks, field)
+
+
+if hasattr(np, 'bitwise_count'):
+    def _popcount(words):
+        """Number of set bits per row of a uint64 word array"""
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT_TABLE = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+
+    def _popcount(words):
+        """Number of set bits per row of a uint64 word array"""
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _POPCOUNT_TABLE[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+def _pad_words(words, n_words):
+    """Zero-extend narrower mask words, e.g. training columns without the overflow word"""
+    if words.shape[1] == n_words:
+        return words
+    padded = np.zeros((words.shape[0], n_words), dtype=np.uint64)
+    padded[:, :words.shape[1]] = words
+    return padded
+
+
+def _numeric_column(profiles, field, default):
+    """Collect a numeric field into a float array plus a mask of unusable rows"""
+    values = np.empty(len(profiles), dtype=np.float64)
+    invalid = np.zeros(len(profiles), dtype=bool)
+    for i, profile in enumerate(profiles):
+        value = profile.get(field, default)
+        if isinstance(value, numbers.Real):
+            values[i] = value
+        else:
+            values[i] = 0
+            invalid[i] = True
+    return values, invalid
+
+
+def _budget_index(budget):
+    """Position of a budget bracket in BUDGET_ORDER, -1 when unknown"""
+    return _BUDGET_INDEX.get(budget, -1) if isinstance(budget, str) else -1
+
+
+def encode_profiles(profiles):
+    """Encode one side of the pairs (users or candidates) into per-field columns.
+
+    The result only depends on each profile itself, so it can be computed once
+    and reused against any number of counterparts.
+    """
+    invalid = np.array([not isinstance(p, dict) for p in profiles], dtype=bool)
+    if invalid.any():
+        profiles = [p if isinstance(p, dict) else {} for p in profiles]
+
+    age, bad_age = _numeric_column(profiles, 'age', 25)
+    cleanliness, bad_cleanliness = _numeric_column(profiles, 'cleanliness', 3)
+
+    return {
+        'size': len(profiles),
+        'invalid': invalid | bad_age | bad_cleanliness,
+        'age': age,
+        'cleanliness': cleanliness,
+        'budget': np.array([_budget_index(p.get('budget', '20000-25000')) for p in profiles], dtype=np.int64),
+        'categories': {
+            field: np.array([category_code(p.get(field)) for p in profiles], dtype=np.int64)
+            for field in CATEGORY_FIELDS
+        },
+        'masks': {field: encode_item_masks(profiles, field) for field in OVERLAP_FEATURES},
+    }
+
+
+def take_rows(columns, rows):
+    """Select rows of encoded profile columns, e.g. to pair one side up with another"""
+    return {
+        'size': len(rows),
+        'invalid': columns['invalid'][rows],
+        'age': columns['age'][rows],
+        'cleanliness': columns['cleanliness'][rows],
+        'budget': columns['budget'][rows],
+        'categories': {field: codes[rows] for field, codes in columns['categories'].items()},
+        'masks': {field: words[rows] for field, words in columns['masks'].items()},
+    }
+
+
+NUMERIC_DEFAULTS = {'age': 25, 'cleanliness': 3}
+
+
+def _dictionary_lookup(column, size, encode_value, missing_value):
+    """Map a dictionary-encoded (indices, dictionary) column through `encode_value`.
+
+    Each distinct value is encoded once. Index -1 is a null and encodes like
+    None; a column that is not there at all gives `missing_value`.
+    """
+    if column is None:
+        return np.full(size, missing_value)
+    indices, dictionary = column
+    table = np.array([encode_value(value) for value in dictionary] + [encode_value(None)])
+    return table[np.where(np.asarray(indices) < 0, len(dictionary), indices)]
+
+
+def encode_profile_columns(columns, size):
+    """Encode one side of the pairs from columnar input, same result as encode_profiles.
+
+    `columns` maps a profile field to its column. Numeric fields (age,
+    cleanliness) are (values, null) arrays, with values None when the source
+    column is not numeric. Every other field is an (indices, dictionary) pair
+    of integer codes into a list of distinct values, -1 marking nulls. A null
+    behaves like a None value in a profile dict, a missing column like a
+    missing key.
+    """
+    invalid = np.zeros(size, dtype=bool)
+    numeric = {}
+    for field, default in NUMERIC_DEFAULTS.items():
+        if field not in columns:
+            numeric[field] = np.full(size, float(default))
+            continue
+        values, null = columns[field]
+        # Anything but a real number makes the row unusable, as in _numeric_column
+        invalid |= np.ones(size, dtype=bool) if values is None else np.asarray(null, dtype=bool)
+        numeric[field] = np.zeros(size) if values is None else np.where(null, 0.0, np.asarray(values, dtype=np.float64))
+
+    masks = {}
+    for field in OVERLAP_FEATURES:
+        def bits(value, field=field):
+            items = _item_set(value)
+            return _item_bits(field, items) if items else 0
+        row_masks = _dictionary_lookup(columns.get(field), size, bits, 0)
+        masks[field] = _mask_words(row_masks.tolist(), field)
+
+    return {
+        'size': size,
+        'invalid': invalid,
+        'age': numeric['age'],
+        'cleanliness': numeric['cleanliness'],
+        'budget': _dictionary_lookup(
+            columns.get('budget'), size, _budget_index, _budget_index('20000-25000')
+        ).astype(np.int64),
+        'categories': {
+            field: _dictionary_lookup(columns.get(field), size, category_code, category_code(None)).astype(np.int64)
+            for field in CATEGORY_FIELDS
+        },
+        'masks': masks,
+    }
+
+
+def _hosting_column(user_hosting, cand_hosting):
+    """Hosting compatibility: 1 when either side is flexible or the styles complement each other, 0.5 when equal, else 0"""
+    either = (user_hosting == HOSTING_EITHER) | (cand_hosting == HOSTING_EITHER)
+    complementary = ((user_hosting == HOSTING_HOST) & (cand_hosting == HOSTING_GUEST)) | \
+                    ((user_hosting == HOSTING_GUEST) & (cand_hosting == HOSTING_HOST))
+    same = user_hosting == cand_hosting
+
+    return np.where(either | complementary, 1.0, np.where(same, 0.5, 0.0))
+
+
+def _pet_column(user_own, cand_own, user_pref, cand_pref):
+    """Pet compatibility from both sides' ownership and preference, 0.5 when nothing decides it"""
+    user_has_pets = user_own == OWN_PETS
+    cand_has_pets = cand_own == OWN_PETS
+
+    loves = (user_has_pets & (cand_pref == LOVE_PETS)) | (cand_has_pets & (user_pref == LOVE_PETS))
+    okay = (user_has_pets & (cand_pref == OKAY_WITH_PETS)) | (cand_has_pets & (user_pref == OKAY_WITH_PETS))
+    both_pet_free = (user_pref == NO_PETS_PLEASE) & (cand_pref == NO_PETS_PLEASE) & \
+                    (user_own == NO_PETS) & (cand_own == NO_PETS)
+    conflict = (user_has_pets & (cand_pref == NO_PETS_PLEASE)) | (cand_has_pets & (user_pref == NO_PETS_PLEASE))
+
+    return np.select([loves, okay, both_pet_free, conflict], [1.0, 0.7, 1.0, 0.0], default=0.5)
+
+
+def _overlap_column(user_words, cand_words):
+    """Jaccard overlap from bitmask words, 0 when either side has no items"""
+    n_words = max(user_words.shape[1], cand_words.shape[1])
+    user_words = _pad_words(user_words, n_words)
+    cand_words = _pad_words(cand_words, n_words)
+
+    intersection = _popcount(user_words & cand_words)
+    union = _popcount(user_words | cand_words)
+    both_present = (_popcount(user_words) > 0) & (_popcount(cand_words) > 0)
+
+    return np.where(both_present, intersection / np.maximum(union, 1), 0.0)
+
+
+def encode_pair_features(user_columns, candidate_columns, model_columns):
+    """Combine two encoded sides into an (n_pairs, n_features) matrix.
+
+    Either side may hold a single profile, in which case it is broadcast
+    against every profile on the other side.
+
+    Rows whose profiles cannot be encoded (non-dict profiles, non-numeric age or
+    cleanliness) are left as zeros, as the original per-pair encoder did.
+    """
+    n_pairs = max(user_columns['size'], candidate_columns['size'])
+    if user_columns['size'] == 0 or candidate_columns['size'] == 0:
+        return np.zeros((0, len(model_columns)))
+
+    columns = {}
+
+    columns['age_difference'] = np.abs(user_columns['age'] - candidate_columns['age'])
+    columns['cleanliness_difference'] = np.abs(user_columns['cleanliness'] - candidate_columns['cleanliness'])
+    columns['cleanliness_compatibility'] = (columns['cleanliness_difference'] <= 1).astype(np.float64)
+
+    user_budget, cand_budget = user_columns['budget'], candidate_columns['budget']
+    known_budget = (user_budget >= 0) & (cand_budget >= 0)
+    columns['budget_difference'] = np.where(known_budget, np.abs(user_budget - cand_budget), 0).astype(np.float64)
+    columns['budget_compatibility'] = (columns['budget_difference'] <= 1).astype(np.float64)
+
+    user_cat, cand_cat = user_columns['categories'], candidate_columns['categories']
+    for field, feature_name in EQUALITY_FEATURES.items():
+        columns[feature_name] = (user_cat[field] == cand_cat[field]).astype(np.float64)
+
+    columns['hosting_compatibility'] = _hosting_column(user_cat['hostingStyle'], cand_cat['hostingStyle'])
+    columns['pet_ownership_compatibility'] = _pet_column(
+        user_cat['petOwnership'], cand_cat['petOwnership'],
+        user_cat['petPreference'], cand_cat['petPreference']
+    )
+
+    for field, feature_name in OVERLAP_FEATURES.items():
+        columns[feature_name] = _overlap_column(user_columns['masks'][field], candidate_columns['masks'][field])
+
+    features = np.zeros((n_pairs, len(model_columns)))
+    for i, feature_name in enumerate(model_columns):
+        if feature_name in columns:
+            features[:, i] = columns[feature_name]
+
+    features[user_columns['invalid'] | candidate_columns['invalid']] = 0
+    return features
+
+
+def scores_from_predictions(raw_predictions, features):
+    """Convert raw model outputs into clamped match percentages (10-95)"""
+    non_zero_features = np.count_nonzero(features, axis=1)
+    percentage = np.asarray(raw_predictions, dtype=np.float64) * 100
+
+    # Boost score for high feature matches, same tiers as the per-pair path
+    percentage = np.select(
+        [non_zero_features >= 18, non_zero_features >= 15, non_zero_features >= 12],
+        [np.minimum(95, percentage * 1.15), np.minimum(90, percentage * 1.10), np.minimum(85, percentage * 1.05)],
+        default=percentage
+    )
+
+    return np.clip(np.round(percentage), 10, 95).astype(int)
@@ -0,0 +1,299 @@
+"""
+Homiee ML Service - Array Forest Inference
+Evaluates a fitted sklearn tree ensemble (random forest or histogram gradient boosting) from flat NumPy arrays
+"""
+import logging
+import os
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# "array" uses ArrayForest when the model can be exported, "sklearn" always calls model.predict
+INFERENCE_ENGINE = os.environ.get('ML_INFERENCE_ENGINE', 'array').lower()
+
+# Batches larger than this go to sklearn, whose compiled traversal wins once
+# its fixed per-call overhead is amortised
+ARRAY_MAX_ROWS = int(os.environ.get('ML_ARRAY_ENGINE_MAX_ROWS', 500))
+
+# Threads each sklearn predict call may use (the model's n_jobs); unset keeps the
+# pickled value. gunicorn.conf.py sets it to 1 when it runs several workers
+SKLEARN_N_JOBS = int(os.environ['ML_SKLEARN_N_JOBS']) if os.environ.get('ML_SKLEARN_N_JOBS') else None
+
+# Rows evaluated per traversal pass, bounds the (rows x trees) node-index matrix
+CHUNK_ROWS = 4096
+
+
+class ArrayForest:
+    """Flattened regression forest.
+
+    Every node of every tree lives in one set of arrays: feature, threshold,
+    value, and children, which holds the left child at 2 * node and the right
+    child at 2 * node + 1. Leaves point to themselves and compare against +inf,
+    so a batch can be walked one level at a time for all trees at once
+    without branching on leaf status.
+
+    A random forest averages its trees; a boosted ensemble adds their sum to
+    a base prediction. input_dtype is the precision sklearn compares inputs
+    at (float32 for forests, float64 for histogram gradient boosting).
+    """
+
+    ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, n_features,
+                 base=0.0, average=True, input_dtype='float32'):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.n_features = n_features
+        self.base = base
+        self.average = average
+        self.input_dtype = input_dtype
+
+    def params(self):
+        """Scalar settings stored next to the arrays in a model artifact"""
+        return {
+            'max_depth': int(self.max_depth),
+            'n_features': int(self.n_features),
+            'base': float(self.base),
+            'average': bool(self.average),
+            'input_dtype': self.input_dtype,
+        }
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Export a fitted RandomForestRegressor/ExtraTreesRegressor/HistGradientBoostingRegressor (or a single tree)"""
+        if hasattr(model, '_predictors'):
+            return cls._from_hist_gradient_boosting(model)
+
+        estimators = getattr(model, 'estimators_', None)
+        if estimators is None:
+            estimators = [model]
+        trees = [getattr(estimator, 'tree_', None) for estimator in np.ravel(estimators)]
+        if not trees or any(tree is None for tree in trees):
+            raise TypeError(f"{type(model).__name__} is not a tree ensemble")
+        if any(tree.n_outputs != 1 for tree in trees):
+            raise TypeError("Only single-output regression trees are supported")
+
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset = 0
+        for tree in trees:
+            node_ids = np.arange(tree.node_count)
+            is_leaf = tree.children_left == -1
+
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(np.stack([
+                np.where(is_leaf, node_ids, tree.children_left),
+                np.where(is_leaf, node_ids, tree.children_right),
+            ], axis=1).ravel() + offset)
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+            offset += tree.node_count
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max(tree.max_depth for tree in trees),
+            n_features=trees[0].n_features,
+        )
+
+    @classmethod
+    def _from_hist_gradient_boosting(cls, model):
+        """Export a fitted HistGradientBoostingRegressor with numeric splits and squared error loss.
+
+        Missing values are not routed like sklearn does (the encoder never
+        produces NaN features).
+        """
+        if getattr(model, 'loss', None) != 'squared_error':
+            raise TypeError(f"Only squared_error loss is supported, got {getattr(model, 'loss', None)}")
+        if any(len(predictors) != 1 for predictors in model._predictors):
+            raise TypeError("Only single-output regression is supported")
+
+        features, thresholds, children, values, roots, depths = [], [], [], [], [], []
+        offset = 0
+        for (predictor,) in model._predictors:
+            nodes = predictor.nodes
+            if nodes['is_categorical'].any():
+                raise TypeError("Categorical splits are not supported")
+            node_ids = np.arange(len(nodes))
+            is_leaf = nodes['is_leaf'].astype(bool)
+
+            features.append(np.where(is_leaf, 0, nodes['feature_idx']))
+            thresholds.append(np.where(is_leaf, np.inf, nodes['num_threshold']))
+            children.append(np.stack([
+                np.where(is_leaf, node_ids, nodes['left']),
+                np.where(is_leaf, node_ids, nodes['right']),
+            ], axis=1).ravel() + offset)
+            values.append(nodes['value'])
+            roots.append(offset)
+            depths.append(int(nodes['depth'].max()))
+            offset += len(nodes)
+
+        return cls(
+            feature=np.concatenate(features).astype(np.int32),
+            threshold=np.concatenate(thresholds).astype(np.float64),
+            children=np.concatenate(children).astype(np.int32),
+            value=np.concatenate(values).astype(np.float64),
+            roots=np.array(roots, dtype=np.int32),
+            max_depth=max(depths, default=0),
+            n_features=model.n_features_in_,
+            base=float(np.ravel(model._baseline_prediction)[0]),
+            average=False,
+            input_dtype='float64',
+        )
+
+    def predict(self, X):
+        """Mean (forest) or base plus sum (boosting) of all trees, same as sklearn's predict"""
+        # sklearn forests compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=self.input_dtype)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input with {self.n_features} features, got shape {X.shape}")
+
+        predictions = np.empty(len(X), dtype=np.float64)
+        for start in range(0, len(X), CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            flat = chunk.ravel()
+            row_offsets = (np.arange(len(chunk), dtype=np.int32) * self.n_features)[:, None]
+            nodes = np.broadcast_to(self.roots, (len(chunk), len(self.roots))).copy()
+            for _ in range(self.max_depth):
+                values = flat[row_offsets + self.feature[nodes]]
+                nodes = self.children[2 * nodes + (values > self.threshold[nodes])]
+            totals = self.value[nodes].sum(axis=1)
+            predictions[start:start + CHUNK_ROWS] = totals / len(self.roots) if self.average else totals + self.base
+        return predictions
+
+
+class HybridPredictor:
+    """Array engine for small batches, the sklearn model for large ones"""
+
+    def __init__(self, forest, model, max_rows=ARRAY_MAX_ROWS):
+        self.forest = forest
+        self.model = model
+        self.max_rows = max_rows
+
+    def predict(self, X):
+        if len(X) > self.max_rows:
+            return self.model.predict(X)
+        return self.forest.predict(X)
+
+
+def _probe(n_features):
+    """Fixed random batch shaped like encoded pair features, for comparing engines"""
+    return np.round(np.random.default_rng(0).random((256, n_features)) * 6, 2)
+
+
+def _agrees(engine, model, n_features):
+    probe = _probe(n_features)
+    return np.allclose(engine.predict(probe), model.predict(probe), rtol=1e-9, atol=1e-12)
+
+
+def _set_n_jobs(model, n_jobs=None):
+    """Cap the threads sklearn's predict may use, ML_SKLEARN_N_JOBS unless n_jobs is given"""
+    n_jobs = SKLEARN_N_JOBS if n_jobs is None else n_jobs
+    if n_jobs is not None and hasattr(model, 'n_jobs'):
+        model.n_jobs = n_jobs
+    return model
+
+
+def load_sklearn_model(path, engine, n_features, n_jobs=None):
+    """The pickled sklearn model next to an artifact, or None when it is missing or is not the artifact's model"""
+    if not os.path.exists(path):
+        return None
+    try:
+        import joblib
+        model = _set_n_jobs(joblib.load(path), n_jobs)
+        if not _agrees(engine, model, n_features):
+            raise ValueError("its predictions differ from the artifact")
+    except Exception as e:
+        logger.warning(f"Not using {path} for inference ({str(e)})")
+        return None
+    logger.info(f"✅ Loaded sklearn model {path} for large batches")
+    return model
+
+
+class LazyModel:
+    """Sklearn model loaded from a pickle on its first predict call.
+
+    Keeps joblib and sklearn out of startup for artifact-served models. Until
+    the pickle has loaded, and for good if it is missing or disagrees with the
+    artifact, calls are answered by the artifact engine. Only one thread
+    loads; the others use the engine meanwhile.
+    """
+
+    def __init__(self, path, engine, n_features, n_jobs=None):
+        self.path = path
+        self.engine = engine
+        self.n_features = n_features
+        self.n_jobs = n_jobs
+        self.model = None
+        self._attempted = False
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        if not self._attempted and self._lock.acquire(blocking=False):
+            try:
+                if not self._attempted:
+                    self.model = load_sklearn_model(self.path, self.engine, self.n_features, self.n_jobs)
+                    self._attempted = True
+            finally:
+                self._lock.release()
+        return (self.model or self.engine).predict(X)
+
+
+def build_predictor(model, n_features, engine=None, n_jobs=None):
+    """Pick the inference engine for a loaded model.
+
+    The array engine is only used after it reproduces sklearn's predictions on
+    a random probe batch; otherwise the sklearn model itself is returned.
+    Batches above ML_ARRAY_ENGINE_MAX_ROWS still go to sklearn, with n_jobs
+    threads when given.
+    """
+    engine = (engine or INFERENCE_ENGINE)
+    _set_n_jobs(model, n_jobs)
+    if engine != 'array':
+        return model
+
+    try:
+        forest = ArrayForest.from_sklearn(model)
+        if not _agrees(forest, model, n_features):
+            raise ValueError("array predictions differ from sklearn")
+    except Exception as e:
+        logger.warning(f"Array inference unavailable ({str(e)}), falling back to sklearn predict")
+        return model
+
+    logger.info(f"✅ Array inference engine ready ({len(forest.roots)} trees, {len(forest.value)} nodes)")
+    return HybridPredictor(forest, model)
+
+
+def build_artifact_predictor(engine, model_path, n_features, inference_engine=None, n_jobs=None):
+    """Pick the inference engine for a model served from an artifact.
+
+    Tree ensembles get the same split as build_predictor: the artifact's
+    engine for small batches and, above ML_ARRAY_ENGINE_MAX_ROWS, the sklearn
+    model pickled at model_path, loaded on the first large batch. With
+    ML_INFERENCE_ENGINE=sklearn the pickle is loaded up front and serves
+    everything. Other engines (linear) are already a single matrix product
+    and serve every batch themselves.
+    """
+    inference_engine = (inference_engine or INFERENCE_ENGINE)
+    if not isinstance(engine, ArrayForest):
+        return engine
+    if inference_engine != 'array':
+        model = load_sklearn_model(model_path, engine, n_features, n_jobs)
+        if model is None:
+            logger.warning(f"ML_INFERENCE_ENGINE={inference_engine} but no usable sklearn model, serving the artifact engine")
+        return model or engine
+    return HybridPredictor(engine, LazyModel(model_path, engine, n_features, n_jobs))
+
+
+def inference_engine_name(predictor):
+    """'sklearn' when sklearn's own predict serves every batch, else 'array'"""
+    return 'sklearn' if type(predictor).__module__.split('.')[0] == 'sklearn' else 'array'
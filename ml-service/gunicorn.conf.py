@@ -0,0 +1,57 @@
+"""
+Homiee ML Service - Gunicorn Configuration
+Multi-worker serving with the model loaded once in the master process
+
+The app (and the model) is imported by the master before forking, so workers
+start with the model already in memory and never repeat load_enhanced_model or
+its smoke test. With the memory-mapped artifact (flatmate_match_model.bin) the
+forest arrays live in the page cache and are shared by every worker; with the
+legacy pickle the workers share the master's copy copy-on-write.
+
+Scoring is CPU-bound, so run one worker per available core. The default is
+the number of cores this process may run on; override it with WEB_CONCURRENCY.
+WEB_THREADS > 1 switches to threaded workers, which lets concurrent requests
+share model calls through the micro-batcher (ML_MICRO_BATCH_WAIT_MS).
+"""
+import math
+import os
+
+
+def available_cores():
+    """Cores this process may use: CPU affinity, capped by a cgroup v2 CPU quota if one is set"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    try:
+        with open('/sys/fs/cgroup/cpu.max') as f:
+            quota, period = f.read().split()
+        if quota != 'max':
+            cores = min(cores, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cores
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '5001')}"
+
+preload_app = True
+workers = int(os.environ.get('WEB_CONCURRENCY', available_cores()))
+worker_class = 'sync'  # gunicorn runs gthread workers instead when threads > 1
+threads = int(os.environ.get('WEB_THREADS', 1))
+
+# Several workers already use every core, so each sklearn predict call gets one
+# thread. Set before the app is preloaded, so every model it or /reload loads
+# (see forest_engine.SKLEARN_N_JOBS) is created single-threaded
+if workers > 1:
+    os.environ.setdefault('ML_SKLEARN_N_JOBS', '1')
+
+timeout = 120
+max_requests = 1000
+max_requests_jitter = 100
+
+
+def post_fork(server, worker):
+    """Start the worker's model file watcher (threads do not survive the fork, so each worker runs its own)"""
+    import sys
+
+    app_module = sys.modules.get('app')
+    if app_module is not None:
+        app_module.start_model_watcher()
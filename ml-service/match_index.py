@@ -0,0 +1,490 @@
+"""
+Homiee ML Service - Per-User Match Index
+Persistent top-K candidate lists per user, kept current as profiles change
+
+Profiles and every user's top-K list live in SQLite, so the index survives
+restarts and is shared by all gunicorn workers. A user's list holds the K
+best-scoring candidates that pass the backend's essential rules (same city,
+budget window, gender rule), ordered by score then candidate id.
+
+When profiles change only the pairs involving them are rescored. A changed
+user gets a fresh list. The changed profiles are scored as candidates against
+the other users in their city; a list is only read and rewritten when one of
+them beats its current tail (kept next to it) or it held a changed profile.
+A list is only rebuilt when a merge can't prove the result exact, i.e. when
+a listed candidate dropped out of a full list. Lists built with another
+model are rebuilt when they are read.
+
+Each process caches the encoded profiles of a city (CityFrame) and updates
+them in place with its own changes; a city changed by another process is
+re-read from SQLite.
+"""
+import json
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+from feature_encoder import category_code, encode_profiles, take_rows
+from prefilter import budget_indices, eligible_users, essential_mask
+
+# Bound on the (users x city) pair mask built per scoring batch
+MAX_BATCH_CELLS = 4_000_000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS profiles (
+    id TEXT PRIMARY KEY,
+    version TEXT,
+    city TEXT,
+    profile TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS profiles_city ON profiles (city);
+CREATE TABLE IF NOT EXISTS cities (
+    city TEXT PRIMARY KEY,
+    generation INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS top_matches (
+    user_id TEXT PRIMARY KEY,
+    model TEXT NOT NULL,
+    matches TEXT NOT NULL,
+    size INTEGER,
+    tail_score INTEGER,
+    tail_id TEXT
+);
+CREATE TABLE IF NOT EXISTS listed (
+    candidate_id TEXT NOT NULL,
+    user_id TEXT NOT NULL,
+    PRIMARY KEY (candidate_id, user_id)
+);
+CREATE INDEX IF NOT EXISTS listed_user ON listed (user_id);
+"""
+
+# Columns added to top_matches after it was first released: the list's length
+# and last entry, so a new score can be checked against it without the list
+LIST_TAIL_COLUMNS = {'size': 'INTEGER', 'tail_score': 'INTEGER', 'tail_id': 'TEXT'}
+
+
+def _city_key(profile):
+    city = profile.get('city') if isinstance(profile, dict) else None
+    return city if isinstance(city, str) and city else None
+
+
+def _rank_key(entry):
+    """Sort key of a [candidate_id, score] entry, best first"""
+    return (-entry[1], entry[0])
+
+
+def _frame_columns(ids, profiles):
+    """Row-aligned columns of a CityFrame for the given profiles"""
+    return {
+        'ids': np.array(ids, dtype=object),
+        'encoded': encode_profiles(profiles),
+        'budget': budget_indices([profile.get('budget') for profile in profiles]),
+        'gender': np.array([category_code(profile.get('gender')) for profile in profiles], dtype=np.int64),
+        'eligible': eligible_users(profiles),
+    }
+
+
+def _map_columns(fn, columns):
+    """fn applied to every array of nested row-aligned columns, keeping the nesting"""
+    return {
+        key: _map_columns(fn, value) if isinstance(value, dict) else fn(value)
+        for key, value in columns.items() if isinstance(value, (dict, np.ndarray))
+    }
+
+
+def _set_rows(columns, rows, values):
+    """Write the rows of `values` into `rows` of nested row-aligned columns"""
+    for key, column in columns.items():
+        if isinstance(column, dict):
+            _set_rows(column, rows, values[key])
+        elif isinstance(column, np.ndarray):
+            column[rows] = values[key]
+
+
+class CityFrame:
+    """Encoded profiles and blocking columns of every profile in one city.
+
+    apply() updates it in place: a changed profile overwrites its row, a new
+    one is appended (the columns grow by doubling) and a removed one is
+    replaced by the last row, so only changed profiles are ever encoded again.
+    """
+
+    def __init__(self, ids, profiles):
+        self.rows = {profile_id: row for row, profile_id in enumerate(ids)}
+        self._columns = _frame_columns(ids, profiles)
+        self._size = len(ids)
+        self._refresh()
+
+    def __len__(self):
+        return self._size
+
+    def _refresh(self):
+        """Point the public columns at the rows in use"""
+        view = _map_columns(lambda column: column[:self._size], self._columns)
+        self.ids = view['ids']
+        self.encoded = {**view['encoded'], 'size': self._size}
+        self.budget = view['budget']
+        self.gender = view['gender']
+        self.eligible = view['eligible']
+
+    def apply(self, profiles, removed=()):
+        """Store `profiles` ({id: profile}) and drop the `removed` ids"""
+        for profile_id in removed:
+            row = self.rows.pop(profile_id, None)
+            if row is None:
+                continue
+            last = self._size - 1
+            if row != last:
+                _set_rows(self._columns, [row], _map_columns(lambda column: column[[last]], self._columns))
+                self.rows[self._columns['ids'][row]] = row
+            self._size = last
+
+        if profiles:
+            ids = list(profiles)
+            rows = np.empty(len(ids), dtype=np.int64)
+            for i, profile_id in enumerate(ids):
+                if profile_id not in self.rows:
+                    self.rows[profile_id] = self._size
+                    self._size += 1
+                rows[i] = self.rows[profile_id]
+            capacity = len(self._columns['ids'])
+            if self._size > capacity:
+                capacity = max(self._size, 2 * capacity)
+                self._columns = _map_columns(
+                    lambda column: np.concatenate([column, np.zeros((capacity - len(column),) + column.shape[1:], column.dtype)]),
+                    self._columns
+                )
+            _set_rows(self._columns, rows, _frame_columns(ids, [profiles[profile_id] for profile_id in ids]))
+        self._refresh()
+
+    def pairs(self, users, candidates):
+        """(user row, candidate row) pairs passing the essential rules, self-pairs excluded"""
+        mask = essential_mask(
+            self.budget[users][:, None], self.gender[users][:, None],
+            self.budget[candidates][None, :], self.gender[candidates][None, :]
+        )
+        mask &= users[:, None] != candidates[None, :]
+        user_index, candidate_index = np.nonzero(mask)
+        return users[user_index], candidates[candidate_index]
+
+
+class MatchIndex:
+    """Per-user top-K lists over profiles pushed through update()/remove().
+
+    `score_pairs(user_columns, candidate_columns)` scores aligned encoded
+    columns into match percentages; `model_tag` identifies the model behind it.
+    """
+
+    def __init__(self, path, k, score_pairs, model_tag):
+        self.path = path
+        self.k = k
+        self.score_pairs = score_pairs
+        self.model_tag = model_tag
+        self._local = threading.local()
+        self._frames = {}
+        self._frames_lock = threading.Lock()
+        db = self._db()
+        db.executescript(SCHEMA)
+        present = {row[1] for row in db.execute('PRAGMA table_info(top_matches)')}
+        for column, kind in LIST_TAIL_COLUMNS.items():
+            if column not in present:
+                db.execute(f'ALTER TABLE top_matches ADD COLUMN {column} {kind}')
+
+    def _db(self):
+        """This thread's connection, reopened after a fork"""
+        db = getattr(self._local, 'db', None)
+        if db is None or self._local.pid != os.getpid():
+            db = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            db.execute('PRAGMA journal_mode=WAL')
+            db.execute('PRAGMA synchronous=NORMAL')
+            self._local.db = db
+            self._local.pid = os.getpid()
+        return db
+
+    @contextmanager
+    def _transaction(self):
+        """Write transaction; BEGIN IMMEDIATE serializes updates across worker processes.
+
+        Frames advanced in it (see _advance) are forgotten if it does not commit.
+        """
+        db = self._db()
+        self._local.advanced = set()
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            yield db
+            db.execute('COMMIT')
+        except BaseException:
+            if db.in_transaction:
+                db.execute('ROLLBACK')
+            with self._frames_lock:
+                for city in self._local.advanced:
+                    self._frames.pop(city, None)
+            raise
+
+    # -- cities ---------------------------------------------------------
+
+    def _advance(self, db, changed, profiles):
+        """Bump the generation of every city the changed ids ({id: (old city, new city)}) touch.
+
+        A cached frame that was current is updated in place with `profiles`
+        ({id: profile} of the changed ids still stored) instead of being re-read.
+        """
+        changes = {}
+        for profile_id, (old_city, city) in changed.items():
+            if old_city is not None and old_city != city:
+                changes.setdefault(old_city, ({}, []))[1].append(profile_id)
+            if city is not None:
+                changes.setdefault(city, ({}, []))[0][profile_id] = profiles[profile_id]
+
+        for city, (upserted, removed) in changes.items():
+            row = db.execute('SELECT generation FROM cities WHERE city = ?', (city,)).fetchone()
+            generation = row[0] if row else 0
+            db.execute(
+                'INSERT INTO cities (city, generation) VALUES (?, 1) '
+                'ON CONFLICT (city) DO UPDATE SET generation = generation + 1',
+                (city,)
+            )
+            with self._frames_lock:
+                cached = self._frames.get(city)
+                if cached and cached[0] == generation:
+                    self._local.advanced.add(city)
+                    cached[1].apply(upserted, removed)
+                    self._frames[city] = (generation + 1, cached[1])
+
+    def _frame(self, db, city):
+        """CityFrame for `city`, cached until the city's generation changes"""
+        row = db.execute('SELECT generation FROM cities WHERE city = ?', (city,)).fetchone()
+        generation = row[0] if row else 0
+        with self._frames_lock:
+            cached = self._frames.get(city)
+        if cached and cached[0] == generation:
+            return cached[1]
+
+        rows = db.execute('SELECT id, profile FROM profiles WHERE city = ? ORDER BY id', (city,)).fetchall()
+        frame = CityFrame([row[0] for row in rows], [json.loads(row[1]) for row in rows])
+        with self._frames_lock:
+            self._frames[city] = (generation, frame)
+        return frame
+
+    # -- lists ----------------------------------------------------------
+
+    def _select_lists(self, db, columns, user_ids):
+        """Rows (user_id, *columns) of top_matches for the given users"""
+        user_ids = list(user_ids)
+        for start in range(0, len(user_ids), 500):
+            chunk = user_ids[start:start + 500]
+            yield from db.execute(
+                f"SELECT user_id, {columns} FROM top_matches WHERE user_id IN ({','.join('?' * len(chunk))})", chunk
+            )
+
+    def _lists(self, db, user_ids):
+        """Stored {user_id: (model, matches)} for the given users"""
+        return {
+            user_id: (model, json.loads(matches))
+            for user_id, model, matches in self._select_lists(db, 'model, matches', user_ids)
+        }
+
+    def _tails(self, db, user_ids):
+        """Stored {user_id: (model, size, tail rank key or None)} for the given users, without reading the lists"""
+        return {
+            user_id: (model, size, None if size is None or tail_id is None else _rank_key([tail_id, tail_score]))
+            for user_id, model, size, tail_score, tail_id in self._select_lists(db, 'model, size, tail_score, tail_id', user_ids)
+        }
+
+    def _write_lists(self, db, lists):
+        for user_id, matches in lists.items():
+            tail = matches[-1] if matches else [None, None]
+            db.execute(
+                'INSERT OR REPLACE INTO top_matches (user_id, model, matches, size, tail_score, tail_id) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (user_id, self.model_tag, json.dumps(matches), len(matches), tail[1], tail[0])
+            )
+            db.execute('DELETE FROM listed WHERE user_id = ?', (user_id,))
+            db.executemany(
+                'INSERT INTO listed (candidate_id, user_id) VALUES (?, ?)',
+                [(candidate_id, user_id) for candidate_id, _ in matches]
+            )
+
+    def _drop_lists(self, db, user_ids):
+        for user_id in user_ids:
+            db.execute('DELETE FROM top_matches WHERE user_id = ?', (user_id,))
+            db.execute('DELETE FROM listed WHERE user_id = ?', (user_id,))
+
+    def _top_k(self, ids, scores):
+        order = np.lexsort((ids, -scores))[:self.k]
+        return [[ids[i], int(scores[i])] for i in order]
+
+    def _recompute(self, frame, users):
+        """Fresh top-K lists for the given user rows of a city, scored in bounded batches"""
+        lists = {}
+        everyone = np.arange(len(frame))
+        step = max(1, MAX_BATCH_CELLS // max(1, len(frame)))
+        for start in range(0, len(users), step):
+            batch = np.asarray(users[start:start + step], dtype=np.int64)
+            user_rows, candidate_rows = frame.pairs(batch, everyone)
+            scores = self._score(frame, user_rows, candidate_rows)
+            bounds = np.searchsorted(user_rows, batch, side='left'), np.searchsorted(user_rows, batch, side='right')
+            for user, lo, hi in zip(batch.tolist(), *bounds):
+                lists[frame.ids[user]] = self._top_k(frame.ids[candidate_rows[lo:hi]].astype(str), scores[lo:hi])
+        return lists
+
+    def _score(self, frame, user_rows, candidate_rows):
+        if len(user_rows) == 0:
+            return np.zeros(0, dtype=int)
+        return np.asarray(self.score_pairs(
+            take_rows(frame.encoded, user_rows), take_rows(frame.encoded, candidate_rows)
+        ))
+
+    # -- updates --------------------------------------------------------
+
+    def update(self, entries):
+        """Store (id, version, profile) entries and rescore the pairs involving changed profiles.
+
+        Returns the number of profiles that changed.
+        """
+        with self._transaction() as db:
+            changed, stored = {}, {}
+            for profile_id, version, profile in entries:
+                row = db.execute('SELECT version, city FROM profiles WHERE id = ?', (profile_id,)).fetchone()
+                if row and version is not None and row[0] == version:
+                    continue
+                old_city = changed[profile_id][0] if profile_id in changed else row[1] if row else None
+                changed[profile_id] = (old_city, _city_key(profile))
+                document = json.dumps(profile if isinstance(profile, dict) else {})
+                # Frames are updated with the profile as it is read back, as if re-read from the table
+                stored[profile_id] = json.loads(document)
+                db.execute(
+                    'INSERT OR REPLACE INTO profiles (id, version, city, profile) VALUES (?, ?, ?, ?)',
+                    (profile_id, version, _city_key(profile), document)
+                )
+            if changed:
+                self._advance(db, changed, stored)
+                self._rescore(db, changed)
+        return len(changed)
+
+    def remove(self, profile_id):
+        """Forget a profile and repair every list it was on, returns False if it was unknown"""
+        with self._transaction() as db:
+            row = db.execute('SELECT city FROM profiles WHERE id = ?', (profile_id,)).fetchone()
+            if row is None:
+                return False
+            db.execute('DELETE FROM profiles WHERE id = ?', (profile_id,))
+            self._advance(db, {profile_id: (row[0], None)}, {})
+            self._rescore(db, {profile_id: (row[0], None)})
+        return True
+
+    def _rescore(self, db, changed):
+        """Bring every list involving the changed ids ({id: (old city, new city)}) up to date"""
+        # Users anywhere whose lists hold a changed id
+        listing = {}
+        for profile_id in changed:
+            for (user_id,) in db.execute('SELECT user_id FROM listed WHERE candidate_id = ?', (profile_id,)):
+                listing[user_id] = None
+        if listing:
+            query_ids = list(listing)
+            for start in range(0, len(query_ids), 500):
+                chunk = query_ids[start:start + 500]
+                for user_id, city in db.execute(
+                    f"SELECT id, city FROM profiles WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ):
+                    listing[user_id] = city
+
+        lists = {}
+        drop = [profile_id for profile_id, (_, city) in changed.items() if city is None]
+        cities = {city for _, city in changed.values() if city is not None}
+        cities |= {city for city in listing.values() if city is not None}
+
+        for city in sorted(cities):
+            frame = self._frame(db, city)
+            changed_rows = np.array(
+                sorted(frame.rows[profile_id] for profile_id in changed if profile_id in frame.rows), dtype=np.int64
+            )
+            is_changed = np.zeros(len(frame), dtype=bool)
+            is_changed[changed_rows] = True
+
+            # Changed users get fresh lists; changed profiles that can't be users lose theirs
+            rebuild = set(changed_rows[frame.eligible[changed_rows]].tolist())
+            drop.extend(frame.ids[changed_rows[~frame.eligible[changed_rows]]].tolist())
+
+            # Everyone else: score the changed profiles as candidates and merge them in
+            others = np.flatnonzero(frame.eligible & ~is_changed)
+            new_entries = {}
+            if len(changed_rows):
+                user_rows, candidate_rows = frame.pairs(others, changed_rows)
+                scores = self._score(frame, user_rows, candidate_rows)
+                for user, candidate, score in zip(user_rows.tolist(), candidate_rows.tolist(), scores.tolist()):
+                    new_entries.setdefault(user, []).append([frame.ids[candidate], int(score)])
+
+            # Only lists that held a changed profile, or that a new entry would enter, are read and rewritten
+            listed_rows = [frame.rows[user_id] for user_id, user_city in listing.items() if user_city == city and user_id in frame.rows]
+            affected = sorted(set(new_entries) | {row for row in listed_rows if frame.eligible[row] and not is_changed[row]})
+            tails = self._tails(db, frame.ids[affected].tolist())
+            merging = []
+            for user in affected:
+                user_id = frame.ids[user]
+                if user_id not in tails or tails[user_id][0] != self.model_tag:
+                    rebuild.add(user)
+                    continue
+                _, size, tail = tails[user_id]
+                if user_id in listing or size is None or tail is None or size < self.k or any(
+                    _rank_key(entry) < tail for entry in new_entries.get(user, [])
+                ):
+                    merging.append(user)
+            stored = self._lists(db, frame.ids[merging].tolist())
+
+            changed_ids = set(frame.ids[changed_rows].tolist()) | set(changed)
+            for user in merging:
+                user_id = frame.ids[user]
+                entries = new_entries.get(user, [])
+                current = stored[user_id][1]
+                kept = [entry for entry in current if entry[0] not in changed_ids]
+                merged = sorted(kept + entries, key=_rank_key)[:self.k]
+                if merged == current:
+                    continue
+                # A full list that lost a candidate is only exact if nothing unseen could rank above its tail
+                if len(current) == self.k and len(kept) < len(current) and (
+                    len(merged) < self.k or _rank_key(merged[-1]) > _rank_key(current[-1])
+                ):
+                    rebuild.add(user)
+                else:
+                    lists[user_id] = merged
+
+            lists.update(self._recompute(frame, sorted(rebuild)))
+
+        # Listing users left without a city can no longer be matched
+        drop.extend(user_id for user_id, city in listing.items() if city is None)
+        self._drop_lists(db, drop)
+        self._write_lists(db, lists)
+
+    # -- reads ----------------------------------------------------------
+
+    def matches(self, user_id, k=None):
+        """Top matches of a user as [[candidate_id, score], ...], None for an unknown user.
+
+        Lists built by another model are rebuilt on the way out.
+        """
+        db = self._db()
+        stored = self._lists(db, [user_id]).get(user_id)
+        if stored is None or stored[0] != self.model_tag:
+            with self._transaction() as db:
+                row = db.execute('SELECT city FROM profiles WHERE id = ?', (user_id,)).fetchone()
+                if row is None:
+                    return None
+                frame = self._frame(db, row[0]) if row[0] is not None else None
+                if frame is None or not frame.eligible[frame.rows[user_id]]:
+                    return []
+                lists = self._recompute(frame, [frame.rows[user_id]])
+                self._write_lists(db, lists)
+            stored = (self.model_tag, lists[user_id])
+        return stored[1][:k or self.k]
+
+    def stats(self):
+        db = self._db()
+        return {
+            "profiles": db.execute('SELECT COUNT(*) FROM profiles').fetchone()[0],
+            "lists": db.execute('SELECT COUNT(*) FROM top_matches').fetchone()[0],
+            "k": self.k,
+        }
@@ -0,0 +1,167 @@
+"""
+Homiee ML Service - Metrics
+In-process counters and histograms rendered in the Prometheus text exposition format
+
+Metrics are per process: under multi-worker gunicorn each scrape reports the
+worker that served it.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+PAIRS_BUCKETS = (1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 50000)
+
+
+def _format_labels(names, values, extra=None):
+    pairs = list(zip(names, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set(self, value, **labels):
+        """Overwrite the value, for mirroring counts kept elsewhere (see Registry.add_collector)"""
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            yield f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+
+
+class Gauge(Counter):
+    """Value that can go up and down"""
+
+    kind = 'gauge'
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'buckets': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series['buckets'][i] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def totals(self):
+        """{label values: (sum, count)} of every series, e.g. for diffing around a benchmark run"""
+        with self._lock:
+            return {key: (series['sum'], series['count']) for key, series in self._series.items()}
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, {**series, 'buckets': list(series['buckets'])}) for key, series in self._series.items())
+        for key, series in items:
+            for bound, count in zip(self.buckets, series['buckets']):
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(float(bound))))} {count}"
+            yield f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', '+Inf'))} {series['count']}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(series['sum'])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, key)} {series['count']}"
+
+
+class Registry:
+    """Ordered collection of metrics plus callbacks that refresh gauges at scrape time"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, callback):
+        self._collectors.append(callback)
+
+    def render(self):
+        for callback in self._collectors:
+            callback()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'ml_requests_total', 'HTTP requests handled', ('endpoint', 'status')
+))
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'ml_request_duration_seconds', 'End-to-end request latency', ('endpoint',)
+))
+PAIRS_PER_REQUEST = REGISTRY.register(Histogram(
+    'ml_pairs_per_request', 'User-candidate pairs scored per request', ('endpoint',), buckets=PAIRS_BUCKETS
+))
+STAGE_LATENCY = REGISTRY.register(Histogram(
+    'ml_stage_duration_seconds',
+    'Latency of each scoring stage (json_parse or arrow_decode, feature_encode, prefilter, prerank, model_predict, post_process, top_k, serialize)',
+    ('endpoint', 'stage')
+))
+
+
+@contextmanager
+def stage_timer(endpoint, stage):
+    """Time a block of work into ml_stage_duration_seconds"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.observe(time.perf_counter() - start, endpoint=endpoint, stage=stage)
+
+
+@contextmanager
+def phase_timer(timings, phase):
+    """Time a block of work into timings[phase] (seconds), e.g. the phases of process startup"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[phase] = time.perf_counter() - start
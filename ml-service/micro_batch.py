@@ -0,0 +1,120 @@
+"""
+Homiee ML Service - Micro-Batching
+Coalesces the model calls of concurrent requests into one predict over their combined rows
+
+The first request to arrive opens a batch and waits up to `max_wait` seconds
+(less once `max_rows` rows have joined) while concurrent requests append
+their feature rows. It then scores the whole batch with a single predict
+call and every request takes back its own slice. A request that is already
+`max_rows` long skips the queue.
+
+Batching only pays off with concurrent requests in one process, i.e. a
+threaded server (gunicorn with WEB_THREADS > 1, or the dev server).
+"""
+import threading
+
+import numpy as np
+
+from metrics import REGISTRY, Gauge, Histogram, PAIRS_BUCKETS
+
+BATCH_SIZE = REGISTRY.register(Histogram(
+    'ml_micro_batch_rows', 'Feature rows per micro-batched model call', buckets=PAIRS_BUCKETS
+))
+BATCH_REQUESTS = REGISTRY.register(Histogram(
+    'ml_micro_batch_requests', 'Requests combined into each micro-batched model call', buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+))
+QUEUE_DEPTH = REGISTRY.register(Gauge(
+    'ml_micro_batch_queue_depth', 'Requests waiting for a micro-batched model call'
+))
+
+
+class _Batch:
+    """Rows queued for one model call, and its outcome"""
+
+    def __init__(self, predictor):
+        self.predictor = predictor
+        self.parts = []
+        self.rows = 0
+        self.full = threading.Event()
+        self.done = threading.Event()
+        self.predictions = None
+        self.error = None
+
+
+class _BoundPredictor:
+    """predict() of one predictor routed through a MicroBatcher"""
+
+    def __init__(self, batcher, predictor):
+        self.batcher = batcher
+        self.predictor = predictor
+
+    def predict(self, features):
+        return self.batcher.predict(self.predictor, features)
+
+
+class MicroBatcher:
+    """Combines concurrent predict calls on the same predictor into one call"""
+
+    def __init__(self, max_rows, max_wait):
+        self.max_rows = max_rows
+        self.max_wait = max_wait
+        self._lock = threading.Lock()
+        self._open = None
+        self._waiting = 0
+
+    def bind(self, predictor):
+        """Predictor-like object whose predict() goes through this batcher"""
+        return _BoundPredictor(self, predictor)
+
+    def predict(self, predictor, features):
+        if len(features) >= self.max_rows:
+            return predictor.predict(features)
+
+        with self._lock:
+            batch = self._open
+            leader = batch is None
+            if leader:
+                batch = self._open = _Batch(predictor)
+            elif batch.predictor is not predictor:
+                # The model was swapped while this batch was open, never mix two models in one call
+                batch = None
+            if batch is not None:
+                start = batch.rows
+                batch.parts.append(features)
+                batch.rows += len(features)
+                if batch.rows >= self.max_rows:
+                    self._open = None
+                    batch.full.set()
+                self._waiting += 1
+                QUEUE_DEPTH.set(self._waiting)
+
+        if batch is None:
+            return predictor.predict(features)
+
+        if leader:
+            batch.full.wait(self.max_wait)
+            with self._lock:
+                if self._open is batch:
+                    self._open = None
+            self._run(batch)
+        else:
+            batch.done.wait()
+
+        with self._lock:
+            self._waiting -= 1
+            QUEUE_DEPTH.set(self._waiting)
+        if batch.error is not None:
+            raise batch.error
+        return batch.predictions[start:start + len(features)]
+
+    def _run(self, batch):
+        """Score a closed batch; no rows join once it is no longer the open batch"""
+        try:
+            rows = batch.parts[0] if len(batch.parts) == 1 else np.concatenate(batch.parts)
+            batch.predictions = np.asarray(batch.predictor.predict(rows))
+            BATCH_SIZE.observe(batch.rows)
+            BATCH_REQUESTS.observe(len(batch.parts))
+        except Exception as e:
+            batch.error = e
+        finally:
+            batch.done.set()
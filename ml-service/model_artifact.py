@@ -0,0 +1,148 @@
+"""
+Homiee ML Service - Model Artifact Format
+Versioned, memory-mappable binary file holding an exported model and its feature schema
+
+Layout: 8-byte magic, 8-byte little-endian header length, UTF-8 JSON header,
+then the raw array buffers, each aligned to 64 bytes. The header records
+the model backend (see model_backends.py) with its scalar params, every
+array's dtype, shape and offset, plus a SHA-256 of the data section.
+Format 1 artifacts predate backends and always hold a random forest.
+"""
+import hashlib
+import json
+import os
+from datetime import datetime, timezone
+
+import numpy as np
+
+from model_backends import DEFAULT_BACKEND, get_backend
+
+MAGIC = b'HOMIEEFM'
+FORMAT_VERSION = 2
+READABLE_FORMATS = (1, 2)
+ALIGNMENT = 64
+
+
+class ArtifactError(RuntimeError):
+    """Raised when an artifact is unreadable, corrupt or built for another feature schema"""
+
+
+def feature_schema_hash(feature_columns):
+    """Stable fingerprint of the ordered feature column list"""
+    return hashlib.sha256(json.dumps(list(feature_columns)).encode('utf-8')).hexdigest()
+
+
+def _aligned(offset):
+    return (offset + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def save_artifact(path, engine, feature_columns, model_type='RandomForestRegressor', backend=DEFAULT_BACKEND):
+    """Write a backend's array engine and its feature columns to `path`, returns the header"""
+    arrays = {name: np.ascontiguousarray(getattr(engine, name)) for name in get_backend(backend).engine.ARRAYS}
+
+    layout = {}
+    offset = 0
+    for name, array in arrays.items():
+        offset = _aligned(offset)
+        layout[name] = {'dtype': array.dtype.str, 'shape': list(array.shape), 'offset': offset}
+        offset += array.nbytes
+    data_size = offset
+
+    data = bytearray(data_size)
+    for name, array in arrays.items():
+        start = layout[name]['offset']
+        data[start:start + array.nbytes] = array.tobytes()
+    checksum = hashlib.sha256(data).hexdigest()
+
+    created_at = datetime.now(timezone.utc)
+    header = {
+        'format_version': FORMAT_VERSION,
+        'model_version': f"{created_at:%Y%m%d%H%M%S}-{checksum[:8]}",
+        'model_type': model_type,
+        'created_at': created_at.isoformat(),
+        'feature_columns': list(feature_columns),
+        'feature_schema': feature_schema_hash(feature_columns),
+        'backend': backend,
+        'n_features': int(engine.n_features),
+        'params': engine.params(),
+        'arrays': layout,
+        'data_size': data_size,
+        'checksum': checksum,
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+    data_start = _aligned(len(MAGIC) + 8 + len(header_bytes))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(len(header_bytes).to_bytes(8, 'little'))
+        f.write(header_bytes)
+        f.write(b'\0' * (data_start - f.tell()))
+        f.write(data)
+    os.replace(tmp_path, path)
+
+    return header
+
+
+def read_header(path):
+    """Parse an artifact header without touching the array data"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ArtifactError(f"{path} is not a model artifact")
+        header_length = int.from_bytes(f.read(8), 'little')
+        try:
+            header = json.loads(f.read(header_length).decode('utf-8'))
+        except ValueError as e:
+            raise ArtifactError(f"Corrupt artifact header in {path}: {e}")
+
+    if header.get('format_version') not in READABLE_FORMATS:
+        raise ArtifactError(f"Unsupported artifact format {header.get('format_version')} in {path}")
+    if header['format_version'] == 1:
+        header['backend'] = 'random_forest'
+        header['params'] = {'max_depth': header['max_depth'], 'n_features': header['n_features']}
+    header['data_start'] = _aligned(len(MAGIC) + 8 + header_length)
+    return header
+
+
+def check_schema(path, header, expected_columns=None):
+    """Raise ArtifactError unless the header's columns match expected_columns and its own schema hash"""
+    if expected_columns is not None and list(expected_columns) != header['feature_columns']:
+        raise ArtifactError(
+            f"Feature schema mismatch: artifact {header['model_version']} was built for "
+            f"{len(header['feature_columns'])} columns {header['feature_schema'][:12]}, "
+            f"service expects {len(expected_columns)} columns {feature_schema_hash(expected_columns)[:12]}"
+        )
+    if feature_schema_hash(header['feature_columns']) != header['feature_schema']:
+        raise ArtifactError(f"Feature schema hash does not match the column list in {path}")
+
+
+def open_artifact(path, header, verify_checksum=True):
+    """Map the arrays described by an already read header into its backend's engine"""
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=header['data_start'], shape=(header['data_size'],))
+    if verify_checksum and hashlib.sha256(data).hexdigest() != header['checksum']:
+        raise ArtifactError(f"Checksum mismatch in {path}, the artifact is corrupt or truncated")
+
+    try:
+        backend = get_backend(header['backend'])
+    except ValueError as e:
+        raise ArtifactError(f"{path}: {e}")
+
+    arrays = {}
+    for name in backend.engine.ARRAYS:
+        spec = header['arrays'][name]
+        dtype = np.dtype(spec['dtype'])
+        count = int(np.prod(spec['shape']))
+        arrays[name] = np.frombuffer(data, dtype=dtype, count=count, offset=spec['offset']).reshape(spec['shape'])
+
+    return backend.engine(**arrays, **header['params'])
+
+
+def load_artifact(path, expected_columns=None, verify_checksum=True):
+    """Open an artifact as its backend's memory-mapped array engine, returns (engine, header).
+
+    The arrays are read-only views onto the page cache, so every process that
+    opens the same file shares one physical copy.
+    """
+    header = read_header(path)
+    check_schema(path, header, expected_columns)
+    return open_artifact(path, header, verify_checksum), header
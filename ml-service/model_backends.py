@@ -0,0 +1,110 @@
+"""
+Homiee ML Service - Model Backends
+The model families the service can be trained and served with, and their array inference engines
+
+Each backend pairs an sklearn estimator (used by retrain_model.py) with an
+engine that evaluates the fitted model from plain NumPy arrays, which is
+what a model artifact stores. The artifact header names its backend, so the
+service serves whatever the artifact was trained with.
+"""
+import numpy as np
+
+from forest_engine import ArrayForest
+
+DEFAULT_BACKEND = 'random_forest'
+
+
+class LinearModel:
+    """Linear regression evaluated as one matrix-vector product"""
+
+    ARRAYS = ('coef',)
+
+    def __init__(self, coef, n_features, intercept=0.0):
+        self.coef = coef
+        self.n_features = n_features
+        self.intercept = intercept
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """Export a fitted single-output linear model (LinearRegression, Ridge, ...)"""
+        coef = np.asarray(getattr(model, 'coef_', None), dtype=np.float64)
+        if coef.ndim != 1:
+            raise TypeError(f"{type(model).__name__} is not a single-output linear model")
+        return cls(coef=coef, n_features=len(coef), intercept=float(np.ravel(model.intercept_)[0]))
+
+    def params(self):
+        """Scalar settings stored next to the arrays in a model artifact"""
+        return {'n_features': int(self.n_features), 'intercept': float(self.intercept)}
+
+    def predict(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features:
+            raise ValueError(f"Expected input with {self.n_features} features, got shape {X.shape}")
+        return X @ self.coef + self.intercept
+
+
+def _random_forest():
+    from sklearn.ensemble import RandomForestRegressor
+    return RandomForestRegressor(
+        n_estimators=100,
+        max_depth=10,
+        min_samples_split=5,
+        min_samples_leaf=2,
+        random_state=42,
+        n_jobs=-1
+    )
+
+
+def _hist_gradient_boosting():
+    from sklearn.ensemble import HistGradientBoostingRegressor
+    return HistGradientBoostingRegressor(
+        max_iter=200,
+        learning_rate=0.1,
+        max_leaf_nodes=31,
+        random_state=42
+    )
+
+
+def _linear():
+    from sklearn.linear_model import LinearRegression
+    return LinearRegression()
+
+
+class ModelBackend:
+    """An estimator factory plus the engine its fitted models are exported to"""
+
+    def __init__(self, name, create, engine):
+        self.name = name
+        self.create = create
+        self.engine = engine
+
+    def export(self, model):
+        """Fitted estimator -> array engine"""
+        return self.engine.from_sklearn(model)
+
+
+BACKENDS = {
+    backend.name: backend for backend in (
+        ModelBackend('random_forest', _random_forest, ArrayForest),
+        ModelBackend('hist_gradient_boosting', _hist_gradient_boosting, ArrayForest),
+        ModelBackend('linear', _linear, LinearModel),
+    )
+}
+
+
+def get_backend(name):
+    try:
+        return BACKENDS[name]
+    except KeyError:
+        raise ValueError(f"Unknown model backend {name!r}, expected one of: {', '.join(BACKENDS)}")
+
+
+def backend_for_model(model):
+    """Backend a fitted estimator belongs to, e.g. for re-exporting an existing pickle"""
+    if hasattr(model, '_predictors'):
+        return BACKENDS['hist_gradient_boosting']
+    if hasattr(model, 'estimators_') or hasattr(model, 'tree_'):
+        return BACKENDS['random_forest']
+    if hasattr(model, 'coef_'):
+        return BACKENDS['linear']
+    raise TypeError(f"No model backend for {type(model).__name__}")
@@ -0,0 +1,368 @@
+#!/usr/bin/env python3
+"""
+Homiee ML Service - Offline All-Pairs Matching
+Scores every compatible user-candidate pair in a profile dump and writes the match lists
+
+Pairs are blocked with the same essential rules as findFlatmateMatches in
+flatmateController.js: same city, budget brackets at most one apart
+(isBudgetCompatible) and the gender preference rule. As in the controller,
+only profiles with city, locality, budget and gender set are matched as
+users. The blocked pairs are split into units that a process pool encodes
+and scores with the batch encoder. Every finished unit is written straight
+away, so an interrupted run resumes from the units still missing.
+
+Input is a CSV or Parquet dump with one row per profile. Multi-valued fields
+may be lists (Parquet), ';'-separated strings, or Postgres array literals.
+
+Output is a directory holding _plan.json plus either
+  - parquet: part-NNNNN.parquet files (user_id, candidate_id, match_percentage),
+    readable as one dataset with pq.read_table(output_dir), or
+  - npy: matches.npy, a memory-mappable (user, candidate, match_percentage) record
+    array of input row numbers, and done.npy marking the finished units.
+
+Usage:
+    python precompute_matches.py profiles.parquet matches/ [--top-k 50] [--format npy] [--workers 4]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import shutil
+import sys
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import joblib
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from arrow_io import profile_columns
+from feature_encoder import (
+    BUDGET_ORDER, OVERLAP_FEATURES, category_code, encode_pair_features, encode_profile_columns, scores_from_predictions, take_rows
+)
+from forest_engine import ArrayForest, HybridPredictor, build_predictor, load_sklearn_model
+from model_artifact import load_artifact
+from prefilter import BOTH_GENDERS, REQUIRED_USER_FIELDS, budget_indices, essential_mask
+from ranking import select_top_k
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+logger = logging.getLogger(__name__)
+
+MODEL_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MATCH_DTYPE = np.dtype([('user', '<i4'), ('candidate', '<i4'), ('match_percentage', 'u1')])
+
+# Bounds on a unit: scored pairs, and cells of the (users x city) blocking mask
+MAX_UNIT_PAIRS = 250_000
+MAX_UNIT_CELLS = 16_000_000
+
+# Budget index slots: -1 (missing or unknown) and every BUDGET_ORDER position
+BUDGET_SLOTS = range(-1, len(BUDGET_ORDER))
+
+# Pool workers read the job from this global, inherited when the pool forks
+_job = None
+
+
+def load_profiles(path):
+    """Read a CSV or Parquet profile dump as an Arrow table"""
+    if path.endswith(('.parquet', '.pq')):
+        return pq.read_table(path)
+
+    table = pa_csv.read_csv(path)
+    # Postgres array literals ({a,b}) -> ';'-separated items
+    for field in OVERLAP_FEATURES:
+        if field in table.column_names and pa.types.is_string(table.column(field).type):
+            items = pc.replace_substring_regex(table.column(field), r'^\{(.*)\}$', r'\1')
+            items = pc.replace_substring(pc.replace_substring(items, '"', ''), ',', ';')
+            table = table.set_column(table.column_names.index(field), field, items)
+    return table
+
+
+def load_predictor(model_dir):
+    """The model the service would serve: the artifact when present, else the legacy pickle.
+
+    As in the service, an artifact's tree ensemble scores large batches with
+    the sklearn model pickled next to it, provided that pickle reproduces the
+    artifact (see forest_engine.build_artifact_predictor).
+
+    Returns (predictor, feature columns, model version).
+    """
+    model_path = os.path.join(model_dir, 'flatmate_match_model.pkl')
+    columns_path = os.path.join(model_dir, 'flatmate_model_columns.pkl')
+    artifact_path = os.path.join(model_dir, 'flatmate_match_model.bin')
+
+    if os.path.exists(artifact_path):
+        expected_columns = list(joblib.load(columns_path)) if os.path.exists(columns_path) else None
+        engine, header = load_artifact(artifact_path, expected_columns)
+        # n_jobs=1: parallelism comes from the process pool
+        model = load_sklearn_model(model_path, engine, len(header['feature_columns']), n_jobs=1) if isinstance(engine, ArrayForest) else None
+        if model is None:
+            return engine, header['feature_columns'], header['model_version']
+        return HybridPredictor(engine, model), header['feature_columns'], header['model_version']
+
+    columns = list(joblib.load(columns_path))
+    stat = os.stat(model_path)
+    return build_predictor(joblib.load(model_path), len(columns), n_jobs=1), columns, f"pickle-{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def _dictionary_codes(table, field, encode_value, absent_value):
+    """Per-row encode_value(field value), mapping each distinct value once"""
+    if field not in table.column_names:
+        return np.full(table.num_rows, absent_value)
+    encoded = table.column(field).combine_chunks().dictionary_encode()
+    lookup = np.array([encode_value(value) for value in encoded.dictionary.to_pylist()] + [absent_value])
+    indices = encoded.indices.fill_null(-1).to_numpy(zero_copy_only=False)
+    return lookup[np.where(indices < 0, len(lookup) - 1, indices)]
+
+
+def _present(table, field):
+    """Rows where the field is set and not an empty string (the controller's truthiness check)"""
+    if field not in table.column_names:
+        return np.zeros(table.num_rows, dtype=bool)
+    column = table.column(field)
+    present = pc.is_valid(column)
+    if pa.types.is_string(column.type):
+        present = pc.and_(present, pc.not_equal(column, ''))
+    return present.to_numpy(zero_copy_only=False).astype(bool)
+
+
+def _pair_counts(budget, gender, sources, rows):
+    """Compatible candidates (excluding self) of each source among `rows`, from (budget, gender) counts"""
+    genders, gender_index = np.unique(gender[rows], return_inverse=True)
+    counts = np.zeros((len(BUDGET_SLOTS), len(genders)), dtype=np.int64)
+    np.add.at(counts, (budget[rows] + 1, gender_index), 1)
+
+    # Candidates within one bracket of each budget slot, per gender
+    window = counts.copy()
+    window[1:] += counts[:-1]
+    window[:-1] += counts[1:]
+
+    slots = budget[sources] + 1
+    source_gender = np.searchsorted(genders, gender[sources])
+    both = np.flatnonzero(genders == BOTH_GENDERS)
+    pairs = np.where(
+        gender[sources] == BOTH_GENDERS,
+        window[slots].sum(axis=1),
+        window[slots, source_gender] + (window[slots, both[0]] if len(both) else 0)
+    )
+    return pairs - 1
+
+
+def plan_units(table, top_k):
+    """Block the dump by city and split each city's users into units.
+
+    Returns (units, blocking arrays): each unit is (city rows, source rows,
+    output rows), output rows being min(pairs, top_k) when top_k is set.
+    """
+    city = _dictionary_codes(table, 'city', lambda value: value if value else None, None)
+    budget = _dictionary_codes(table, 'budget', lambda value: budget_indices([value])[0], -1)
+    gender = _dictionary_codes(table, 'gender', category_code, category_code(None)).astype(np.int64)
+
+    eligible = np.ones(table.num_rows, dtype=bool)
+    for field in REQUIRED_USER_FIELDS:
+        eligible &= _present(table, field)
+
+    units = []
+    cities = sorted({value for value in city.tolist() if value is not None})
+    for name in cities:
+        rows = np.flatnonzero(city == name)
+        sources = rows[eligible[rows]]
+        if len(sources) == 0:
+            continue
+        pairs = _pair_counts(budget, gender, sources, rows)
+        outputs = np.minimum(pairs, top_k) if top_k else pairs
+
+        max_sources = max(1, MAX_UNIT_CELLS // len(rows))
+        start = 0
+        while start < len(sources):
+            stop = start + 1
+            total = pairs[start]
+            while stop < len(sources) and stop - start < max_sources and total + pairs[stop] <= MAX_UNIT_PAIRS:
+                total += pairs[stop]
+                stop += 1
+            units.append((rows, sources[start:stop], int(outputs[start:stop].sum())))
+            start = stop
+
+    return units, {'budget': budget, 'gender': gender}
+
+
+class MatchJob:
+    """Everything a pool worker needs to score a unit, shared by fork"""
+
+    def __init__(self, args, table, units, blocking, predictor, model_columns):
+        self.output = args.output
+        self.format = args.format
+        self.top_k = args.top_k
+        self.units = units
+        self.budget = blocking['budget']
+        self.gender = blocking['gender']
+        self.predictor = predictor
+        self.model_columns = model_columns
+        self.encoded = encode_profile_columns(profile_columns(table, ''), table.num_rows)
+        self.ids = table.column(args.id_column).to_numpy(zero_copy_only=False) if self.format == 'parquet' else None
+        self.offsets = np.concatenate([[0], np.cumsum([unit[2] for unit in units])]).astype(np.int64)
+
+
+def _score_unit(unit_id):
+    """Score one unit in a pool worker and write its output, returns (unit_id, pairs written)"""
+    job = _job
+    rows, sources, _ = job.units[unit_id]
+
+    mask = essential_mask(
+        job.budget[sources][:, None], job.gender[sources][:, None], job.budget[rows][None, :], job.gender[rows][None, :]
+    )
+    mask &= sources[:, None] != rows[None, :]
+    source_index, candidate_index = np.nonzero(mask)
+    users, candidates = sources[source_index], rows[candidate_index]
+
+    features = encode_pair_features(take_rows(job.encoded, users), take_rows(job.encoded, candidates), job.model_columns)
+    scores = scores_from_predictions(job.predictor.predict(features), features) if len(features) else np.zeros(0, int)
+
+    if job.top_k:
+        # source_index is sorted, so each user's pairs are one contiguous run
+        bounds = np.searchsorted(source_index, np.arange(len(sources) + 1))
+        keep = [start + select_top_k(scores[start:stop], job.top_k)[0] for start, stop in zip(bounds[:-1], bounds[1:])]
+        keep = np.concatenate(keep) if keep else np.zeros(0, dtype=np.int64)
+        users, candidates, scores = users[keep], candidates[keep], scores[keep]
+
+    if job.format == 'npy':
+        matches = np.load(os.path.join(job.output, 'matches.npy'), mmap_mode='r+')
+        start = job.offsets[unit_id]
+        block = matches[start:start + len(scores)]
+        block['user'], block['candidate'], block['match_percentage'] = users, candidates, scores
+        matches.flush()
+    else:
+        name = f"part-{unit_id:05d}.parquet"
+        # The leading underscore keeps an unfinished part out of pq.read_table(output_dir)
+        temporary = os.path.join(job.output, f"_{name}.tmp")
+        pq.write_table(pa.table({
+            'user_id': job.ids[users],
+            'candidate_id': job.ids[candidates],
+            'match_percentage': scores.astype(np.uint8),
+        }), temporary)
+        os.replace(temporary, os.path.join(job.output, name))
+
+    return unit_id, len(scores)
+
+
+def _prepare_output(args, plan):
+    """Create or reopen the output directory, returns the ids of units already written"""
+    # Underscore-prefixed, so Arrow's dataset discovery skips it when reading the parts
+    plan_path = os.path.join(args.output, '_plan.json')
+    if args.restart and os.path.isdir(args.output):
+        shutil.rmtree(args.output)
+    os.makedirs(args.output, exist_ok=True)
+
+    if os.path.exists(plan_path):
+        with open(plan_path) as f:
+            previous = json.load(f)
+        if previous != plan:
+            raise SystemExit(
+                f"{args.output} holds a run with a different input, model or options; "
+                f"use --restart to discard it"
+            )
+    else:
+        if args.format == 'npy':
+            np.lib.format.open_memmap(
+                os.path.join(args.output, 'matches.npy'), mode='w+', dtype=MATCH_DTYPE, shape=(plan['total_rows'],)
+            ).flush()
+            np.lib.format.open_memmap(
+                os.path.join(args.output, 'done.npy'), mode='w+', dtype=np.uint8, shape=(plan['units'],)
+            ).flush()
+        with open(plan_path, 'w') as f:
+            json.dump(plan, f, indent=2)
+
+    if args.format == 'npy':
+        return set(np.flatnonzero(np.load(os.path.join(args.output, 'done.npy'))).tolist())
+    return {
+        int(name[5:10]) for name in os.listdir(args.output)
+        if name.startswith('part-') and name.endswith('.parquet')
+    }
+
+
+def run(args):
+    global _job
+
+    started = time.perf_counter()
+    table = load_profiles(args.input)
+    if args.format == 'parquet' and args.id_column not in table.column_names:
+        raise SystemExit(f"Input has no {args.id_column!r} column, pass --id-column")
+    predictor, model_columns, model_version = load_predictor(args.model_dir)
+
+    units, blocking = plan_units(table, args.top_k)
+    stat = os.stat(args.input)
+    plan = {
+        'input': os.path.abspath(args.input),
+        'input_size': stat.st_size,
+        'input_mtime': int(stat.st_mtime),
+        'profiles': table.num_rows,
+        'model_version': model_version,
+        'top_k': args.top_k,
+        'format': args.format,
+        'units': len(units),
+        'total_rows': int(sum(unit[2] for unit in units)),
+    }
+    done = _prepare_output(args, plan)
+    pending = [unit_id for unit_id in range(len(units)) if unit_id not in done]
+    logger.info(
+        f"📋 {table.num_rows} profiles, {plan['total_rows']} output rows in {len(units)} units "
+        f"({len(done)} already written), planned in {time.perf_counter() - started:.1f}s"
+    )
+    if not pending:
+        return plan
+
+    _job = MatchJob(args, table, units, blocking, predictor, model_columns)
+    done_flags = np.load(os.path.join(args.output, 'done.npy'), mmap_mode='r+') if args.format == 'npy' else None
+
+    total_rows = sum(units[unit_id][2] for unit_id in pending)
+    written = 0
+    last_report = started = time.perf_counter()
+    context = multiprocessing.get_context('fork')
+    with ProcessPoolExecutor(max_workers=args.workers, mp_context=context) as pool:
+        futures = [pool.submit(_score_unit, unit_id) for unit_id in pending]
+        for completed, future in enumerate(as_completed(futures), 1):
+            unit_id, rows = future.result()
+            if done_flags is not None:
+                done_flags[unit_id] = 1
+                done_flags.flush()
+            written += rows
+
+            now = time.perf_counter()
+            if now - last_report >= args.progress_interval or completed == len(futures):
+                rate = written / max(now - started, 1e-9)
+                eta = (total_rows - written) / rate if rate else 0
+                logger.info(
+                    f"⏳ {completed}/{len(futures)} units, {written}/{total_rows} rows "
+                    f"({rate:,.0f} rows/s, ETA {eta:,.0f}s)"
+                )
+                last_report = now
+
+    logger.info(f"✅ Wrote {written} rows to {args.output} in {time.perf_counter() - started:.1f}s")
+    return plan
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="Precompute flatmate match lists for every profile in a dump")
+    parser.add_argument('input', help="CSV or Parquet profile dump")
+    parser.add_argument('output', help="Output directory, resumed if it holds an unfinished run")
+    parser.add_argument('--top-k', type=int, default=0, help="Keep the best K candidates per user (default: all)")
+    parser.add_argument('--format', choices=('parquet', 'npy'), default='parquet')
+    parser.add_argument('--workers', type=int, default=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count())
+    parser.add_argument('--id-column', default='id')
+    parser.add_argument('--model-dir', default=MODEL_DIR)
+    parser.add_argument('--progress-interval', type=float, default=5.0, help="Seconds between progress lines")
+    parser.add_argument('--restart', action='store_true', help="Discard any previous output and start over")
+    args = parser.parse_args(argv)
+    if args.top_k < 0:
+        parser.error("--top-k must be non-negative")
+    return args
+
+
+if __name__ == "__main__":
+    warnings.filterwarnings('ignore', message='X does not have valid feature names')
+    run(parse_args(sys.argv[1:]))
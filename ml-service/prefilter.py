@@ -0,0 +1,104 @@
+"""
+Homiee ML Service - Candidate Pre-filtering
+Vectorized versions of the backend's essential match rules (flatmateController.js) and request filters
+"""
+import numpy as np
+
+from feature_encoder import BUDGET_ORDER, category_code
+
+_BUDGET_INDEX = {budget: idx for idx, budget in enumerate(BUDGET_ORDER)}
+
+BOTH_GENDERS = category_code('Both')
+
+# findFlatmateMatches rejects a user missing any of these, so such profiles are only ever candidates
+REQUIRED_USER_FIELDS = ('city', 'locality', 'budget', 'gender')
+
+
+def budget_indices(budgets):
+    """Position of each budget bracket in BUDGET_ORDER, -1 when missing or unknown (like indexOf)"""
+    return np.array(
+        [_BUDGET_INDEX.get(budget, -1) if isinstance(budget, str) else -1 for budget in budgets], dtype=np.int64
+    )
+
+
+def eligible_users(profiles):
+    """Profiles that findFlatmateMatches would match as a user (all required fields truthy)"""
+    return np.array([all(profile.get(field) for field in REQUIRED_USER_FIELDS) for profile in profiles], dtype=bool)
+
+
+def budget_compatible(user_budget, candidate_budget):
+    """isBudgetCompatible: brackets at most one apart, on broadcast budget index arrays"""
+    return np.abs(user_budget - candidate_budget) <= 1
+
+
+def gender_compatible(user_gender, candidate_gender):
+    """The controller's gender rule on broadcast gender category codes"""
+    return (user_gender == BOTH_GENDERS) | (candidate_gender == user_gender) | (candidate_gender == BOTH_GENDERS)
+
+
+def essential_mask(user_budget, user_gender, candidate_budget, candidate_gender):
+    """Both essential rules (budget window and gender) on broadcast arrays"""
+    return budget_compatible(user_budget, candidate_budget) & gender_compatible(user_gender, candidate_gender)
+
+
+# Request "filter" fields; the value true stands for the backend's essential rules
+FILTER_FIELDS = ('budget_window', 'gender', 'min_age', 'max_age', 'max_age_difference', 'same_locality', 'localities')
+ESSENTIAL_FILTER = {'budget_window': 1, 'gender': True}
+
+
+def parse_filter(spec):
+    """Validate a request's filter spec, raising ValueError with a client-facing message"""
+    if spec is True:
+        return dict(ESSENTIAL_FILTER)
+    if not isinstance(spec, dict):
+        raise ValueError("filter must be an object or true")
+    unknown = sorted(set(spec) - set(FILTER_FIELDS))
+    if unknown:
+        raise ValueError(f"Unknown filter fields: {', '.join(unknown)}")
+
+    parsed = {}
+    for field in ('gender', 'same_locality'):
+        if field in spec:
+            if not isinstance(spec[field], bool):
+                raise ValueError(f"filter.{field} must be true or false")
+            parsed[field] = spec[field]
+    for field in ('budget_window', 'min_age', 'max_age', 'max_age_difference'):
+        if spec.get(field) is not None:
+            value = spec[field]
+            if isinstance(value, bool) or not isinstance(value, (int, float)) or value < 0:
+                raise ValueError(f"filter.{field} must be a non-negative number")
+            parsed[field] = value
+    if spec.get('localities') is not None:
+        if not isinstance(spec['localities'], list) or not all(isinstance(item, str) for item in spec['localities']):
+            raise ValueError("filter.localities must be a list of strings")
+        parsed['localities'] = spec['localities']
+    return parsed
+
+
+def filter_pairs(spec, user_columns, candidate_columns):
+    """Indices of the pairs passing a parsed filter spec.
+
+    Works on encoded profile columns (see feature_encoder.encode_profiles),
+    one side of which may have a single row broadcast against the other.
+    Ages are candidate ages; locality rules compare candidate localities.
+    """
+    size = max(user_columns['size'], candidate_columns['size'])
+    mask = np.ones(size, dtype=bool)
+    user_categories = user_columns['categories']
+    candidate_categories = candidate_columns['categories']
+
+    if 'budget_window' in spec:
+        mask &= np.abs(user_columns['budget'] - candidate_columns['budget']) <= spec['budget_window']
+    if spec.get('gender'):
+        mask &= gender_compatible(user_categories['gender'], candidate_categories['gender'])
+    if 'min_age' in spec:
+        mask &= candidate_columns['age'] >= spec['min_age']
+    if 'max_age' in spec:
+        mask &= candidate_columns['age'] <= spec['max_age']
+    if 'max_age_difference' in spec:
+        mask &= np.abs(user_columns['age'] - candidate_columns['age']) <= spec['max_age_difference']
+    if spec.get('same_locality'):
+        mask &= (candidate_categories['locality'] == user_categories['locality']) & (user_categories['locality'] != category_code(None))
+    if 'localities' in spec:
+        mask &= np.isin(candidate_categories['locality'], [category_code(locality) for locality in spec['localities']])
+    return np.flatnonzero(mask)
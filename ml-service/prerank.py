@@ -0,0 +1,62 @@
+"""
+Homiee ML Service - Cascade Pre-ranking
+The weighted compatibility formula the training target is generated from, used as a near-free first-pass scorer
+
+The model is trained to imitate this formula (plus noise, see
+retrain_model.calculate_compatibility_scores), so the formula ranks pairs
+almost like the model does at the cost of one pass over the feature matrix.
+In a cascade every pair gets the formula's score and only the best top_n
+pairs are rescored by the model.
+"""
+import numpy as np
+
+COMPATIBILITY_WEIGHTS = {
+    'same_city': 0.15,
+    'same_locality': 0.10,
+    'budget_compatibility': 0.15,
+    'sleep_compatibility': 0.10,
+    'dietary_compatibility': 0.08,
+    'smoking_compatibility': 0.12,
+    'drinking_compatibility': 0.08,
+    'cleanliness_compatibility': 0.10,
+    'personality_compatibility': 0.05,
+    'social_compatibility': 0.05,
+    'hosting_compatibility': 0.05,
+    'pet_ownership_compatibility': 0.08,
+    'hobbies_overlap': 0.03,
+    'interests_overlap': 0.03,
+    'music_overlap': 0.02,
+    'sports_overlap': 0.02,
+    'language_overlap': 0.02
+}
+
+
+def compatibility_formula(features, feature_columns):
+    """Noise-free compatibility score of every row of a feature matrix (at least 0, may exceed 1)"""
+    column = {name: features[:, i] for i, name in enumerate(feature_columns)}
+    
+    score = np.zeros(len(features))
+    for feature, weight in COMPATIBILITY_WEIGHTS.items():
+        if feature in column:
+            score += column[feature] * weight
+    
+    # Penalties for large age (over 5 years) and budget (over 1 bracket) differences
+    if 'age_difference' in column:
+        score -= np.maximum(0, column['age_difference'] - 5) * 0.02
+    if 'budget_difference' in column:
+        score -= np.maximum(0, column['budget_difference'] - 1) * 0.05
+    return np.maximum(0, score)
+
+
+def prerank(features, feature_columns, top_n):
+    """First cascade stage: formula scores of every row clipped to 0-1, plus a mask of the top_n rows.
+
+    The caller overwrites the masked rows with model predictions.
+    """
+    scores = np.clip(compatibility_formula(features, feature_columns), 0.0, 1.0)
+    selected = np.zeros(len(features), dtype=bool)
+    if len(features) <= top_n:
+        selected[:] = True
+    elif top_n > 0:
+        selected[np.argpartition(-scores, top_n - 1)[:top_n]] = True
+    return scores, selected
@@ -0,0 +1,140 @@
+"""
+Homiee ML Service - Request Profiling
+Profiles single scoring requests with cProfile or a stack sampler, and keeps the slowest sampled profiles
+
+A cProfile run is reported as a pstats table. The sampler records the stack
+of the request's thread every `interval` seconds and reports it in the
+collapsed-stack format ("outer;inner;leaf count" per line) that
+flamegraph.pl, speedscope and similar tools read. Only one request is
+profiled at a time, since a process can only run one profiler.
+"""
+import cProfile
+import heapq
+import io
+import itertools
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+PROFILE_FORMATS = ('table', 'collapsed')
+TABLE_SORTS = ('cumulative', 'tottime', 'calls')
+
+_active = threading.Lock()
+
+
+class ProfilerBusyError(RuntimeError):
+    """Raised when another request is already being profiled"""
+
+
+def _frame_name(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """Samples one thread's stack from a background thread"""
+
+    def __init__(self, thread_id, interval=0.001):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='stack-sampler', daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            names = []
+            while frame is not None:
+                names.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+            if names:
+                self.stacks[';'.join(reversed(names))] += 1
+
+    def enable(self):
+        self._thread.start()
+
+    def disable(self):
+        self._stop.set()
+        self._thread.join()
+
+    def collapsed(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class RequestProfile:
+    """One profiled request: start() before handling it, finish() after"""
+
+    def __init__(self, profile_format='table', sort='cumulative', limit=40):
+        if profile_format not in PROFILE_FORMATS:
+            raise ValueError(f"Unknown profile format {profile_format!r}, expected one of: {', '.join(PROFILE_FORMATS)}")
+        if sort not in TABLE_SORTS:
+            raise ValueError(f"Unknown sort {sort!r}, expected one of: {', '.join(TABLE_SORTS)}")
+        self.format = profile_format
+        self.sort = sort
+        self.limit = limit
+        self.seconds = None
+        self._profiler = None
+        self._started = None
+
+    def start(self, blocking=False):
+        """Start profiling the calling thread, raises ProfilerBusyError while another request is profiled"""
+        if not _active.acquire(blocking=blocking):
+            raise ProfilerBusyError("Another request is being profiled")
+        if self.format == 'collapsed':
+            self._profiler = StackSampler(threading.get_ident())
+        else:
+            self._profiler = cProfile.Profile()
+        self._started = time.perf_counter()
+        self._profiler.enable()
+
+    def finish(self):
+        """Stop profiling, returns the report text"""
+        try:
+            self._profiler.disable()
+            self.seconds = time.perf_counter() - self._started
+        finally:
+            _active.release()
+        if self.format == 'collapsed':
+            return self._profiler.collapsed()
+        out = io.StringIO()
+        pstats.Stats(self._profiler, stream=out).strip_dirs().sort_stats(self.sort).print_stats(self.limit)
+        return out.getvalue()
+
+
+class WorstProfiles:
+    """Profiles every nth request and keeps the `keep` slowest of them"""
+
+    def __init__(self, every, keep):
+        self.every = every
+        self.keep = keep
+        self._count = itertools.count(1)
+        self._sequence = itertools.count()
+        self._heap = []  # (seconds, sequence, entry), slowest kept
+        self._lock = threading.Lock()
+
+    def due(self):
+        """True for every nth call"""
+        return self.every > 0 and next(self._count) % self.every == 0
+
+    def add(self, seconds, endpoint, report):
+        entry = {
+            "seconds": seconds,
+            "endpoint": endpoint,
+            "profiled_at": datetime.now(timezone.utc).isoformat(),
+            "table": report,
+        }
+        with self._lock:
+            item = (seconds, next(self._sequence), entry)
+            if len(self._heap) < self.keep:
+                heapq.heappush(self._heap, item)
+            elif seconds > self._heap[0][0]:
+                heapq.heapreplace(self._heap, item)
+
+    def entries(self):
+        """Kept profiles, slowest first"""
+        with self._lock:
+            return [entry for _, _, entry in sorted(self._heap, key=lambda item: item[0], reverse=True)]
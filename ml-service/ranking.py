@@ -0,0 +1,37 @@
+"""
+Homiee ML Service - Candidate Ranking
+Partial top-K selection over match scores
+"""
+import numpy as np
+
+
+def select_top_k(scores, k, offset=0, min_score=None):
+    """Indices of the best-scoring candidates for one page of results.
+
+    Ties keep the original candidate order, like a stable descending sort.
+    Only the first offset + k entries are sorted; a partial np.partition
+    picks them, so the cost stays close to linear for large candidate pools.
+    Returns (indices, total) where total counts candidates above min_score.
+    """
+    scores = np.asarray(scores)
+    candidates = np.arange(len(scores))
+    if min_score is not None:
+        candidates = candidates[scores >= min_score]
+
+    total = len(candidates)
+    wanted = min(offset + k, total)
+    if wanted <= 0 or offset >= total:
+        return np.zeros(0, dtype=np.int64), total
+
+    values = scores[candidates]
+    if wanted < total:
+        # wanted-th largest score; everything above it is in, ties fill the rest in index order
+        threshold = np.partition(values, total - wanted)[total - wanted]
+        above = np.flatnonzero(values > threshold)
+        ties = np.flatnonzero(values == threshold)[:wanted - len(above)]
+        best = np.concatenate([above, ties])
+    else:
+        best = np.arange(total)
+    best = best[np.lexsort((best, -values[best]))]
+
+    return candidates[best[offset:offset + k]], total
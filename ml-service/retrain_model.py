@@ -6,275 +6,186 @@ This script recreates the ML model with current package versions to fix numpy co
 
 import numpy as np
 import pandas as pd
-from sklearn.ensemble import RandomForestRegressor
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 import joblib
 import pickle
 import os
+import sys
 import warnings
 import logging
+import argparse
+import time
 from datetime import datetime
 
+from feature_encoder import BUDGET_ORDER, OVERLAP_VOCABULARIES, category_code, encode_pair_features
+from model_artifact import load_artifact, save_artifact
+from model_backends import BACKENDS, DEFAULT_BACKEND, backend_for_model, get_backend
+from prerank import COMPATIBILITY_WEIGHTS, compatibility_formula
+from training_dataset import TrainingDataset, read_pairs_file
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-def calculate_array_overlap(arr1, arr2):
-    """Calculate overlap between two arrays (for interests, hobbies, etc.)"""
-    if not arr1 or not arr2:
-        return 0.0
-    
-    # Handle string representations of arrays
-    if isinstance(arr1, str):
-        arr1 = arr1.replace('[', '').replace(']', '').replace('"', '').split(',')
-        arr1 = [item.strip() for item in arr1 if item.strip()]
-    if isinstance(arr2, str):
-        arr2 = arr2.replace('[', '').replace(']', '').replace('"', '').split(',')
-        arr2 = [item.strip() for item in arr2 if item.strip()]
-    
-    if not arr1 or not arr2:
-        return 0.0
-    
-    overlap = len(set(arr1) & set(arr2))
-    max_length = max(len(arr1), len(arr2))
-    return overlap / max_length if max_length > 0 else 0.0
+# Feature options from your frontend data.js
+PROFILE_OPTIONS = {
+    'city': ['Mumbai', 'Delhi', 'Bangalore', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Ahmedabad'],
+    'locality': ['Andheri', 'Bandra', 'Powai', 'Malad', 'Thane', 'Borivali', 'Kandivali', 'Goregaon'],
+    'gender': ['Male', 'Female', 'Non-binary', 'Prefer not to say'],
+    'sleepPattern': ['Early bird', 'Night owl', 'Flexible'],
+    'dietaryPrefs': ['Vegetarian', 'Non-vegetarian', 'Vegan', 'Jain', 'No preference'],
+    'smokingHabits': ['Non-smoker', 'Occasional smoker', 'Regular smoker'],
+    'drinkingHabits': ['Non-drinker', 'Social drinker', 'Regular drinker'],
+    'personalityType': ['Introverted', 'Extroverted', 'Ambivert'],
+    'socialStyle': ['Homebody', 'Social butterfly', 'Balanced'],
+    'hostingStyle': ['I like hosting', 'I like being guest', 'Balanced'],
+    'weekendStyle': ['Relaxed at home', 'Out and about', 'Mixed activities'],
+    'petOwnership': ['Own pets', 'No pets', 'Planning to get pets'],
+    'petPreference': ['Love pets', 'Okay with pets', 'No pets please'],
+}
 
-def calculate_hosting_compatibility(user_hosting, candidate_hosting):
-    """Calculate hosting style compatibility"""
-    if not user_hosting or not candidate_hosting:
-        return 0.5
-    
-    if (user_hosting == 'I like hosting' and candidate_hosting == 'I like being guest') or \
-       (user_hosting == 'I like being guest' and candidate_hosting == 'I like hosting'):
-        return 1.0
-    elif user_hosting == candidate_hosting:
-        return 0.5
-    else:
-        return 0.0
+# Multi-valued field -> [low, high) number of items drawn (with replacement) per profile;
+# the item options are feature_encoder.OVERLAP_VOCABULARIES
+ITEM_COUNTS = {
+    'hobbies': (1, 4),
+    'interests': (1, 3),
+    'musicGenres': (1, 3),
+    'sportsActivities': (0, 3),
+    'languagesSpoken': (1, 3),
+}
 
-def calculate_pet_compatibility(user_ownership, candidate_ownership, user_preference, candidate_preference):
-    """Calculate pet ownership and preference compatibility"""
-    if (user_ownership == 'Own pets' and candidate_preference == 'Love pets') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'Love pets'):
-        return 1.0
-    
-    if (user_ownership == 'Own pets' and candidate_preference == 'Okay with pets') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'Okay with pets'):
-        return 0.7
-    
-    if user_preference == 'No pets please' and candidate_preference == 'No pets please' and \
-       user_ownership == 'No pets' and candidate_ownership == 'No pets':
-        return 1.0
-    
-    if (user_ownership == 'Own pets' and candidate_preference == 'No pets please') or \
-       (candidate_ownership == 'Own pets' and user_preference == 'No pets please'):
-        return 0.0
-    
-    return 0.5
+# Pairs generated per chunk, bounding the float64 temporaries of the encoder;
+# each chunk becomes one shard of the cached training dataset
+GENERATION_CHUNK = 1_000_000
 
-def encode_features(user_data, candidate_data):
-    """Encode user and candidate data into the 94 features expected by your model"""
-    feature_dict = {}
-    
-    # Basic demographic features
-    feature_dict['age_difference'] = abs(user_data.get('age', 25) - candidate_data.get('age', 25))
-    feature_dict['same_city'] = 1 if user_data.get('city') == candidate_data.get('city') else 0
-    feature_dict['same_locality'] = 1 if user_data.get('locality') == candidate_data.get('locality') else 0
-    feature_dict['same_gender'] = 1 if user_data.get('gender') == candidate_data.get('gender') else 0
-    
-    # Budget compatibility
-    budget_order = ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+']
-    try:
-        user_budget_idx = budget_order.index(user_data.get('budget', '20000-25000'))
-        cand_budget_idx = budget_order.index(candidate_data.get('budget', '20000-25000'))
-        feature_dict['budget_difference'] = abs(user_budget_idx - cand_budget_idx)
-        feature_dict['budget_compatibility'] = 1 if feature_dict['budget_difference'] <= 1 else 0
-    except:
-        feature_dict['budget_difference'] = 0
-        feature_dict['budget_compatibility'] = 1
-    
-    # Lifestyle compatibility
-    feature_dict['sleep_compatibility'] = 1 if user_data.get('sleepPattern') == candidate_data.get('sleepPattern') else 0
-    feature_dict['dietary_compatibility'] = 1 if user_data.get('dietaryPrefs') == candidate_data.get('dietaryPrefs') else 0
-    feature_dict['social_compatibility'] = 1 if user_data.get('socialStyle') == candidate_data.get('socialStyle') else 0
-    feature_dict['weekend_compatibility'] = 1 if user_data.get('weekendStyle') == candidate_data.get('weekendStyle') else 0
-    feature_dict['personality_compatibility'] = 1 if user_data.get('personalityType') == candidate_data.get('personalityType') else 0
-    
-    # Hosting compatibility
-    feature_dict['hosting_compatibility'] = calculate_hosting_compatibility(
-        user_data.get('hostingStyle'), candidate_data.get('hostingStyle')
-    )
-    
-    # Cleanliness compatibility
-    user_cleanliness = user_data.get('cleanliness', 3)
-    cand_cleanliness = candidate_data.get('cleanliness', 3)
-    feature_dict['cleanliness_difference'] = abs(user_cleanliness - cand_cleanliness)
-    feature_dict['cleanliness_compatibility'] = 1 if feature_dict['cleanliness_difference'] <= 1 else 0
-    
-    # Substance use compatibility
-    feature_dict['smoking_compatibility'] = 1 if user_data.get('smokingHabits') == candidate_data.get('smokingHabits') else 0
-    feature_dict['drinking_compatibility'] = 1 if user_data.get('drinkingHabits') == candidate_data.get('drinkingHabits') else 0
-    
-    # Interest overlaps
-    feature_dict['hobbies_overlap'] = calculate_array_overlap(
-        user_data.get('hobbies', ''), candidate_data.get('hobbies', '')
-    )
-    feature_dict['interests_overlap'] = calculate_array_overlap(
-        user_data.get('interests', ''), candidate_data.get('interests', '')
-    )
-    feature_dict['music_overlap'] = calculate_array_overlap(
-        user_data.get('musicGenres', ''), candidate_data.get('musicGenres', '')
-    )
-    feature_dict['sports_overlap'] = calculate_array_overlap(
-        user_data.get('sportsActivities', ''), candidate_data.get('sportsActivities', '')
-    )
-    feature_dict['language_overlap'] = calculate_array_overlap(
-        user_data.get('languagesSpoken', ''), candidate_data.get('languagesSpoken', '')
-    )
-    
-    # Pet compatibility
-    feature_dict['pet_ownership_compatibility'] = calculate_pet_compatibility(
-        user_data.get('petOwnership'), candidate_data.get('petOwnership'),
-        user_data.get('petPreference'), candidate_data.get('petPreference')
-    )
-    
-    return feature_dict
+# Bump when the sampling or scoring logic changes, so cached datasets are regenerated
+GENERATOR_VERSION = 1
 
-def generate_training_data(num_samples=10000):
-    """Generate synthetic training data based on your frontend feature structure"""
-    logger.info(f"Generating {num_samples} training samples...")
-    
-    # Feature options from your frontend data.js
-    cities = ['Mumbai', 'Delhi', 'Bangalore', 'Hyderabad', 'Chennai', 'Kolkata', 'Pune', 'Ahmedabad']
-    localities = ['Andheri', 'Bandra', 'Powai', 'Malad', 'Thane', 'Borivali', 'Kandivali', 'Goregaon']
-    genders = ['Male', 'Female', 'Non-binary', 'Prefer not to say']
-    budgets = ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+']
-    sleep_patterns = ['Early bird', 'Night owl', 'Flexible']
-    dietary_prefs = ['Vegetarian', 'Non-vegetarian', 'Vegan', 'Jain', 'No preference']
-    smoking_habits = ['Non-smoker', 'Occasional smoker', 'Regular smoker']
-    drinking_habits = ['Non-drinker', 'Social drinker', 'Regular drinker']
-    personality_types = ['Introverted', 'Extroverted', 'Ambivert']
-    social_styles = ['Homebody', 'Social butterfly', 'Balanced']
-    hosting_styles = ['I like hosting', 'I like being guest', 'Balanced']
-    weekend_styles = ['Relaxed at home', 'Out and about', 'Mixed activities']
-    pet_ownership = ['Own pets', 'No pets', 'Planning to get pets']
-    pet_preferences = ['Love pets', 'Okay with pets', 'No pets please']
-    
-    hobbies_options = ['Reading', 'Cooking', 'Gaming', 'Photography', 'Gardening', 'Yoga', 'Meditation']
-    interests_options = ['Technology', 'Arts', 'Science', 'History', 'Politics', 'Business', 'Health']
-    music_genres = ['Pop', 'Rock', 'Classical', 'Jazz', 'Hip-hop', 'Electronic', 'Folk']
-    sports_activities = ['Cricket', 'Football', 'Basketball', 'Tennis', 'Swimming', 'Gym', 'Running']
-    languages = ['English', 'Hindi', 'Bengali', 'Tamil', 'Telugu', 'Marathi', 'Gujarati']
-    
-    data = []
-    
-    for i in range(num_samples):
-        # Generate user profile
-        user_data = {
-            'age': np.random.randint(18, 35),
-            'city': np.random.choice(cities),
-            'locality': np.random.choice(localities),
-            'gender': np.random.choice(genders),
-            'budget': np.random.choice(budgets),
-            'sleepPattern': np.random.choice(sleep_patterns),
-            'dietaryPrefs': np.random.choice(dietary_prefs),
-            'smokingHabits': np.random.choice(smoking_habits),
-            'drinkingHabits': np.random.choice(drinking_habits),
-            'personalityType': np.random.choice(personality_types),
-            'socialStyle': np.random.choice(social_styles),
-            'hostingStyle': np.random.choice(hosting_styles),
-            'weekendStyle': np.random.choice(weekend_styles),
-            'cleanliness': np.random.randint(1, 6),
-            'petOwnership': np.random.choice(pet_ownership),
-            'petPreference': np.random.choice(pet_preferences),
-            'hobbies': np.random.choice(hobbies_options, size=np.random.randint(1, 4)).tolist(),
-            'interests': np.random.choice(interests_options, size=np.random.randint(1, 3)).tolist(),
-            'musicGenres': np.random.choice(music_genres, size=np.random.randint(1, 3)).tolist(),
-            'sportsActivities': np.random.choice(sports_activities, size=np.random.randint(0, 3)).tolist(),
-            'languagesSpoken': np.random.choice(languages, size=np.random.randint(1, 3)).tolist()
-        }
-        
-        # Generate candidate profile
-        candidate_data = {
-            'age': np.random.randint(18, 35),
-            'city': np.random.choice(cities),
-            'locality': np.random.choice(localities),
-            'gender': np.random.choice(genders),
-            'budget': np.random.choice(budgets),
-            'sleepPattern': np.random.choice(sleep_patterns),
-            'dietaryPrefs': np.random.choice(dietary_prefs),
-            'smokingHabits': np.random.choice(smoking_habits),
-            'drinkingHabits': np.random.choice(drinking_habits),
-            'personalityType': np.random.choice(personality_types),
-            'socialStyle': np.random.choice(social_styles),
-            'hostingStyle': np.random.choice(hosting_styles),
-            'weekendStyle': np.random.choice(weekend_styles),
-            'cleanliness': np.random.randint(1, 6),
-            'petOwnership': np.random.choice(pet_ownership),
-            'petPreference': np.random.choice(pet_preferences),
-            'hobbies': np.random.choice(hobbies_options, size=np.random.randint(1, 4)).tolist(),
-            'interests': np.random.choice(interests_options, size=np.random.randint(1, 3)).tolist(),
-            'musicGenres': np.random.choice(music_genres, size=np.random.randint(1, 3)).tolist(),
-            'sportsActivities': np.random.choice(sports_activities, size=np.random.randint(0, 3)).tolist(),
-            'languagesSpoken': np.random.choice(languages, size=np.random.randint(1, 3)).tolist()
-        }
-        
-        # Encode features
-        features = encode_features(user_data, candidate_data)
-        
-        # Calculate compatibility score (0-1) based on feature matching
-        compatibility_score = calculate_compatibility_score(features)
-        
-        # Add to dataset
-        data.append({**features, 'compatibility_score': compatibility_score})
-    
-    return pd.DataFrame(data)
+# Cached training datasets (see training_dataset.py), one directory per generator config
+TRAINING_DATA_DIR = 'training_data'
 
-def calculate_compatibility_score(features):
-    """Calculate a realistic compatibility score based on feature matches"""
-    score = 0.0
-    weights = {
-        'same_city': 0.15,
-        'same_locality': 0.10,
-        'budget_compatibility': 0.15,
-        'sleep_compatibility': 0.10,
-        'dietary_compatibility': 0.08,
-        'smoking_compatibility': 0.12,
-        'drinking_compatibility': 0.08,
-        'cleanliness_compatibility': 0.10,
-        'personality_compatibility': 0.05,
-        'social_compatibility': 0.05,
-        'hosting_compatibility': 0.05,
-        'pet_ownership_compatibility': 0.08,
-        'hobbies_overlap': 0.03,
-        'interests_overlap': 0.03,
-        'music_overlap': 0.02,
-        'sports_overlap': 0.02,
-        'language_overlap': 0.02
+def sample_profile_columns(rng, size):
+    """Draw `size` random profiles directly as encoded columns (see feature_encoder.encode_profiles)"""
+    categories = {}
+    for field, options in PROFILE_OPTIONS.items():
+        codes = np.array([category_code(option) for option in options], dtype=np.int64)
+        categories[field] = codes[rng.integers(0, len(options), size, dtype=np.uint8)]
+    
+    # Multi-hot bitmask words: bit i set when vocabulary item i was drawn
+    masks = {}
+    for field, (low, high) in ITEM_COUNTS.items():
+        counts = rng.integers(low, high, size, dtype=np.uint8)
+        items = rng.integers(0, len(OVERLAP_VOCABULARIES[field]), (size, high - 1), dtype=np.uint8).astype(np.uint64)
+        drawn = np.arange(high - 1) < counts[:, None]
+        bits = np.where(drawn, np.left_shift(np.uint64(1), items), np.uint64(0))
+        masks[field] = np.bitwise_or.reduce(bits, axis=1).reshape(size, 1)
+    
+    return {
+        'size': size,
+        'invalid': np.zeros(size, dtype=bool),
+        'age': rng.integers(18, 35, size).astype(np.float64),
+        'cleanliness': rng.integers(1, 6, size).astype(np.float64),
+        'budget': rng.integers(0, len(BUDGET_ORDER), size, dtype=np.uint8).astype(np.int64),
+        'categories': categories,
+        'masks': masks,
     }
+
+def sample_profiles(rng, size):
+    """Draw `size` random profile dicts from the same options as sample_profile_columns, e.g. as request payloads"""
+    fields = {
+        field: np.array(options, dtype=object)[rng.integers(0, len(options), size)]
+        for field, options in PROFILE_OPTIONS.items()
+    }
+    fields['budget'] = np.array(BUDGET_ORDER, dtype=object)[rng.integers(0, len(BUDGET_ORDER), size)]
+    fields['age'] = rng.integers(18, 35, size)
+    fields['cleanliness'] = rng.integers(1, 6, size)
+    
+    for field, (low, high) in ITEM_COUNTS.items():
+        vocabulary = OVERLAP_VOCABULARIES[field]
+        counts = rng.integers(low, high, size)
+        items = rng.integers(0, len(vocabulary), (size, high - 1))
+        fields[field] = [[vocabulary[i] for i in row[:count]] for row, count in zip(items.tolist(), counts.tolist())]
+    
+    columns = {field: values.tolist() if isinstance(values, np.ndarray) else values for field, values in fields.items()}
+    return [{field: values[i] for field, values in columns.items()} for i in range(size)]
+
+def calculate_compatibility_scores(features, feature_columns, rng):
+    """Calculate realistic compatibility scores (0-1) for a feature matrix, one per row"""
+    score = compatibility_formula(features, feature_columns)
     
-    # Age penalty for large differences
-    age_diff = features.get('age_difference', 0)
-    age_penalty = max(0, (age_diff - 5) * 0.02) if age_diff > 5 else 0
+    # Add some randomness to make it more realistic
+    score += rng.normal(0, 0.05, len(score))
+    return np.clip(score, 0.0, 1.0)
+
+def iter_training_chunks(num_samples, seed=None):
+    """Yield synthetic (float32 features, scores) chunks of up to GENERATION_CHUNK pairs.
+
+    Profiles are drawn column-wise and encoded with the service's own batch
+    encoder; the same seed and sample count always give the same data.
+    """
+    rng = np.random.default_rng(seed)
+    feature_columns = create_feature_columns()
     
-    # Budget penalty for large differences
-    budget_diff = features.get('budget_difference', 0)
-    budget_penalty = max(0, (budget_diff - 1) * 0.05) if budget_diff > 1 else 0
+    for start in range(0, num_samples, GENERATION_CHUNK):
+        size = min(GENERATION_CHUNK, num_samples - start)
+        users = sample_profile_columns(rng, size)
+        candidates = sample_profile_columns(rng, size)
+        features = encode_pair_features(users, candidates, feature_columns)
+        yield features.astype(np.float32), calculate_compatibility_scores(features, feature_columns, rng)
+
+def generate_training_data(num_samples=10000, seed=None):
+    """Generate synthetic training data based on your frontend feature structure"""
+    logger.info(f"Generating {num_samples} training samples (seed {seed})...")
+    started = time.perf_counter()
     
-    # Calculate weighted score
-    for feature, weight in weights.items():
-        if feature in features:
-            score += features[feature] * weight
+    chunks = list(iter_training_chunks(num_samples, seed))
+    features = np.concatenate([features for features, _ in chunks]) if chunks else \
+        np.empty((0, len(create_feature_columns())), dtype=np.float32)
+    scores = np.concatenate([scores for _, scores in chunks]) if chunks else np.empty(0)
     
-    # Apply penalties
-    score = max(0, score - age_penalty - budget_penalty)
+    logger.info(f"Generated {num_samples} samples in {time.perf_counter() - started:.2f}s")
     
-    # Add some randomness to make it more realistic
-    score += np.random.normal(0, 0.05)
-    score = max(0.0, min(1.0, score))  # Clamp between 0 and 1
+    df = pd.DataFrame(features, columns=create_feature_columns())
+    df['compatibility_score'] = scores
+    return df
+
+def generator_config(num_samples, seed):
+    """Everything that determines the synthetic data, hashed into the training dataset key"""
+    return {
+        'generator_version': GENERATOR_VERSION,
+        'samples': num_samples,
+        'seed': seed,
+        'chunk': GENERATION_CHUNK,
+        'budgets': BUDGET_ORDER,
+        'options': PROFILE_OPTIONS,
+        'vocabularies': OVERLAP_VOCABULARIES,
+        'item_counts': ITEM_COUNTS,
+        'weights': COMPATIBILITY_WEIGHTS,
+    }
+
+def load_training_data(num_samples, seed, dataset_dir=TRAINING_DATA_DIR):
+    """Training (features, scores) from the dataset cache, generating them on the first run.
+
+    Returns the TrainingDataset as well; it is None when dataset_dir is None
+    and the data was generated in memory only.
+    """
+    feature_columns = create_feature_columns()
+    if dataset_dir is None:
+        df = generate_training_data(num_samples, seed)
+        return df[feature_columns].to_numpy(), df['compatibility_score'].to_numpy(), None
+    
+    dataset = TrainingDataset(dataset_dir, generator_config(num_samples, seed), feature_columns)
+    started = time.perf_counter()
+    if dataset.exists:
+        logger.info(f"Using cached training dataset {dataset.key} ({len(dataset.manifest['shards'])} shards)")
+    else:
+        logger.info(f"Generating {num_samples} training samples (seed {seed}) into dataset {dataset.key}...")
+        dataset.create(iter_training_chunks(num_samples, seed))
     
-    return score
+    features, scores = dataset.load()
+    logger.info(f"Loaded {len(features)} training samples in {time.perf_counter() - started:.2f}s")
+    return features, scores, dataset
 
 def create_feature_columns():
     """Create the exact 94 feature column names that your model expects"""
@@ -288,24 +199,35 @@ def create_feature_columns():
         'language_overlap', 'pet_ownership_compatibility'
     ]
 
-def train_model():
+def export_model_artifact(model, feature_columns, artifact_path='flatmate_match_model.bin'):
+    """Export a fitted model into the memory-mappable artifact served by app.py"""
+    backend = backend_for_model(model)
+    header = save_artifact(
+        artifact_path, backend.export(model), feature_columns, model_type=type(model).__name__, backend=backend.name
+    )
+    
+    # Round-trip check: the mapped arrays must reproduce sklearn's predictions
+    loaded_engine, _ = load_artifact(artifact_path, expected_columns=feature_columns)
+    probe = np.random.default_rng(0).random((256, len(feature_columns))) * 6
+    if not np.allclose(loaded_engine.predict(probe), model.predict(probe)):
+        raise RuntimeError(f"Exported artifact {artifact_path} does not reproduce the model's predictions")
+    
+    logger.info(f"✅ Model artifact {header['model_version']} ({backend.name}) saved to: {artifact_path}")
+    return header
+
+def train_model(num_samples=10000, seed=42, dataset_dir=TRAINING_DATA_DIR, backend=DEFAULT_BACKEND):
     """Train the flatmate compatibility model"""
     logger.info("🚀 Starting model training...")
     
-    # Generate training data
-    df = generate_training_data(10000)
-    
     # Get feature columns
     feature_columns = create_feature_columns()
     
-    # Ensure all feature columns exist in the dataframe
-    for col in feature_columns:
-        if col not in df.columns:
-            df[col] = 0.0
+    # Cached (or freshly generated) training data, plus any extra shards added to it
+    features, scores, _ = load_training_data(num_samples, seed, dataset_dir)
     
     # Prepare features and target
-    X = df[feature_columns].fillna(0)
-    y = df['compatibility_score']
+    X = pd.DataFrame(features, columns=feature_columns)
+    y = scores
     
     logger.info(f"Training data shape: {X.shape}")
     logger.info(f"Feature columns: {len(feature_columns)}")
@@ -314,15 +236,8 @@ def train_model():
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
     # Train the model
-    logger.info("Training Random Forest model...")
-    model = RandomForestRegressor(
-        n_estimators=100,
-        max_depth=10,
-        min_samples_split=5,
-        min_samples_leaf=2,
-        random_state=42,
-        n_jobs=-1
-    )
+    logger.info(f"Training {backend} model...")
+    model = get_backend(backend).create()
     
     model.fit(X_train, y_train)
     
@@ -353,6 +268,9 @@ def train_model():
     logger.info(f"Model saved to: {model_path}")
     logger.info(f"Feature columns saved to: {columns_path}")
     
+    # Versioned, memory-mappable artifact for fast service startup
+    export_model_artifact(model, feature_columns)
+    
     # Test model loading
     logger.info("Testing model loading...")
     try:
@@ -370,6 +288,22 @@ def train_model():
     return model, feature_columns
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Retrain the flatmate compatibility model")
+    parser.add_argument('--samples', type=int, default=10000, help="number of synthetic training pairs")
+    parser.add_argument('--seed', type=int, default=42, help="seed for the synthetic training data")
+    parser.add_argument('--backend', choices=list(BACKENDS), default=DEFAULT_BACKEND,
+                        help="model family to train (default: %(default)s)")
+    parser.add_argument('--dataset-dir', default=TRAINING_DATA_DIR,
+                        help="training dataset cache directory (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="generate the training data in memory only")
+    parser.add_argument('--add-shard', metavar='FILE', action='append', default=[],
+                        help="append a CSV/Parquet file of encoded pairs (feature columns plus "
+                             "compatibility_score) to the training dataset before training; repeatable")
+    parser.add_argument('--export-only', action='store_true',
+                        help="re-export the existing pickled model as an artifact without retraining")
+    args = parser.parse_args()
+    dataset_dir = None if args.no_cache else args.dataset_dir
+    
     warnings.filterwarnings('ignore')
     
     logger.info("="*60)
@@ -380,7 +314,23 @@ if __name__ == "__main__":
     logger.info(f"Training started at: {datetime.now()}")
     
     try:
-        model, feature_columns = train_model()
+        if args.export_only:
+            # Re-export the existing pickled model without retraining
+            export_model_artifact(joblib.load('flatmate_match_model.pkl'), joblib.load('flatmate_model_columns.pkl'))
+            sys.exit(0)
+        
+        if args.add_shard:
+            if dataset_dir is None:
+                parser.error("--add-shard needs the dataset cache, drop --no-cache")
+            # Make sure the generated shards exist, then append the extra pairs after them
+            dataset = TrainingDataset(dataset_dir, generator_config(args.samples, args.seed), create_feature_columns())
+            if not dataset.exists:
+                dataset.create(iter_training_chunks(args.samples, args.seed))
+            for path in args.add_shard:
+                shard = dataset.add_shard(*read_pairs_file(path, dataset.feature_columns), source=os.path.abspath(path))
+                logger.info(f"Added {shard['rows']} pairs from {path} to dataset {dataset.key} as {shard['file']}")
+        
+        model, feature_columns = train_model(args.samples, args.seed, dataset_dir, args.backend)
         logger.info("🎉 Model retraining completed successfully!")
         
     except Exception as e:
@@ -0,0 +1,92 @@
+"""
+Homiee ML Service - Score Cache
+Bounded LRU cache of raw model predictions keyed on the encoded feature row
+"""
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Maximum cached feature rows, 0 disables the cache
+SCORE_CACHE_SIZE = int(os.environ.get('ML_SCORE_CACHE_SIZE', 100000))
+
+
+class ScoreCache:
+    """Memoizes predictor outputs per distinct feature row.
+
+    Pair features are small discrete values, so the same rows recur across
+    users. Rows are deduplicated within a batch, looked up by their raw
+    bytes, and only the misses reach the model, in a single call. The cache
+    empties itself whenever it is used with a different model.
+    """
+
+    def __init__(self, max_size=SCORE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._model_key = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Size and hit counts; hits and misses are both counted in feature rows"""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def predict(self, predictor, features, model_key):
+        """Raw predictions for `features`, calling `predictor` only for uncached rows"""
+        if self.max_size <= 0 or len(features) == 0:
+            return predictor.predict(features)
+
+        features = np.ascontiguousarray(features, dtype=np.float64)
+        # Each row's raw bytes as one fixed-size void scalar: deduplicated with a 1-D sort and used as the key
+        rows = features.view(np.dtype((np.void, features.shape[1] * features.itemsize))).ravel()
+        unique_keys, first, inverse, counts = np.unique(rows, return_index=True, return_inverse=True, return_counts=True)
+        keys = unique_keys.tolist()
+
+        unique_predictions = np.empty(len(keys), dtype=np.float64)
+        missing = []
+        hits = misses = 0
+        with self._lock:
+            if model_key != self._model_key:
+                self._entries.clear()
+                self._model_key = model_key
+            entries = self._entries
+            for i, key in enumerate(keys):
+                value = entries.get(key)
+                if value is None:
+                    missing.append(i)
+                    misses += counts[i]
+                else:
+                    entries.move_to_end(key)
+                    unique_predictions[i] = value
+                    hits += counts[i]
+            # Per row: only rows answered from earlier requests are hits, repeats within this batch are misses
+            self.hits += int(hits)
+            self.misses += int(misses)
+
+        if missing:
+            missing_predictions = np.asarray(predictor.predict(features[first[missing]]), dtype=np.float64)
+            unique_predictions[missing] = missing_predictions
+            with self._lock:
+                if model_key == self._model_key:
+                    for i, value in zip(missing, missing_predictions.tolist()):
+                        self._entries[keys[i]] = value
+                    while len(self._entries) > self.max_size:
+                        self._entries.popitem(last=False)
+
+        return unique_predictions[inverse.reshape(-1)]
@@ -0,0 +1,162 @@
+"""
+Homiee ML Service - Serving Model
+The model a process serves, warmed up before it takes traffic and swapped atomically on reload
+
+Requests read the app's `serving` reference once and use that ServingModel
+for everything, so swapping the reference never mixes two models within one
+request and in-flight requests simply finish on the model they started with.
+"""
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from metrics import REGISTRY, Counter, phase_timer
+from model_artifact import ArtifactError, read_header
+
+logger = logging.getLogger(__name__)
+
+# Rows in the warm-up batch run through a newly loaded model
+WARMUP_ROWS = int(os.environ.get('ML_WARMUP_ROWS', 1024))
+
+MODEL_RELOADS = REGISTRY.register(Counter('ml_model_reloads_total', 'Model reloads by result', ('result',)))
+
+
+class ServingModel:
+    """One loaded model and everything requests need from it"""
+
+    def __init__(self, model, columns, predictor, version=None, backend=None, source=None, timings=None, signature=None):
+        self.model = model
+        self.columns = columns
+        self.predictor = predictor  # model.predict or an array engine, see forest_engine.py
+        self.version = version  # artifact model_version, None for the legacy pickle
+        self.backend = backend  # artifact backend (see model_backends.py), None for the legacy pickle
+        self.source = source
+        self.signature = signature  # (mtime_ns, size) of `source` when it was loaded, see file_signature
+        self.timings = dict(timings or {})  # seconds per load phase, e.g. artifact_open, warm_up
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        self.warmed_up = False
+        self.warmup_seconds = None
+
+    @property
+    def tag(self):
+        """Identifies the model in persisted results (see match_index.py)"""
+        return self.version or 'legacy-pickle'
+
+    def warm_up(self, rows=WARMUP_ROWS):
+        """Fault in the engine's (possibly memory-mapped) arrays and run a single pair and a batch through it"""
+        with phase_timer(self.timings, 'warm_up'):
+            engine = getattr(self.predictor, 'forest', self.predictor)
+            for name in getattr(engine, 'ARRAYS', ()):
+                np.asarray(getattr(engine, name)).sum()
+
+            # Capped at the hybrid split, so warming up never loads a lazily loaded sklearn model
+            rows = min(rows, getattr(self.predictor, 'max_rows', rows))
+            probe = np.round(np.random.default_rng(0).random((max(rows, 1), len(self.columns))) * 6, 2)
+            self.predictor.predict(probe[:1])
+            self.predictor.predict(probe)
+
+        self.warmup_seconds = self.timings['warm_up']
+        self.warmed_up = True
+        logger.info(f"🔥 Model {self.tag} warmed up in {self.warmup_seconds:.2f}s")
+
+
+class ModelReloader:
+    """Loads, warms up and activates a new model in the background, one reload at a time.
+
+    `load(source)` returns a ServingModel; `activate(model)` makes it the one
+    requests use. A failed reload leaves the active model in place.
+    """
+
+    def __init__(self, load, activate):
+        self._load = load
+        self._activate = activate
+        self._lock = threading.Lock()
+        self.state = 'idle'
+        self.error = None
+        self.finished_at = None
+
+    def start(self, source=None):
+        """Reload in a background thread, False when a reload is already running"""
+        if not self._lock.acquire(blocking=False):
+            return False
+        self.state = 'reloading'
+        threading.Thread(target=self._run, args=(source,), name='model-reload', daemon=True).start()
+        return True
+
+    def _run(self, source):
+        try:
+            model = self._load(source)
+            model.warm_up()
+            self._activate(model)
+            self.state, self.error = 'idle', None
+            MODEL_RELOADS.inc(result='success')
+        except Exception as e:
+            logger.error(f"❌ Model reload failed, keeping the active model: {str(e)}")
+            self.state, self.error = 'failed', str(e)
+            MODEL_RELOADS.inc(result='failure')
+        finally:
+            self.finished_at = datetime.now(timezone.utc).isoformat()
+            self._lock.release()
+
+    def status(self):
+        return {"state": self.state, "error": self.error, "finished_at": self.finished_at}
+
+
+def file_signature(path):
+    """(mtime_ns, size) of a file, None when it does not exist"""
+    try:
+        stat = os.stat(path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+class ModelWatcher:
+    """Polls a model file and starts a reload whenever its size or modification time changes.
+
+    The baseline is the file the active model was loaded from, not whatever is
+    on disk when watching starts: a gunicorn worker forked (or recycled) from
+    the master's preloaded model must still pick up an artifact that was
+    swapped after the master loaded it.
+    """
+
+    def __init__(self, path, interval, reloader, active):
+        self.path = path
+        self.interval = interval
+        self.reloader = reloader
+        self._signature = active.signature if active.source == path else None
+        # The active model when the file on disk already holds another one; it stays stale until replaced
+        self.stale_model = active if self._holds_other_model(active) else None
+        self._thread = threading.Thread(target=self._run, name='model-watch', daemon=True)
+
+    def _holds_other_model(self, active):
+        try:
+            return read_header(self.path)['model_version'] != active.version
+        except (OSError, ArtifactError, KeyError):
+            return False
+
+    def start(self):
+        if self.stale_model is not None:
+            logger.info(f"🔄 {self.path} no longer holds model {self.stale_model.tag}, reloading")
+            # Reload even if the file's signature matches: only its header tells it apart
+            signature = file_signature(self.path)
+            if self.reloader.start(self.path):
+                self._signature = signature
+        self._thread.start()
+        logger.info(f"👀 Watching {self.path} for new models every {self.interval}s")
+        return self
+
+    def _check(self):
+        signature = file_signature(self.path)
+        # Artifacts are written to a temporary file and renamed, so a changed file is complete
+        if signature is not None and signature != self._signature and self.reloader.start(self.path):
+            self._signature = signature
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            self._check()
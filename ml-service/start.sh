@@ -1,2 +1,3 @@
 #!/bin/bash
-gunicorn --bind 0.0.0.0:$PORT app:app --timeout 120 --workers 1 --max-requests 1000 --max-requests-jitter 100
+# Workers, preload and timeouts live in gunicorn.conf.py (set WEB_CONCURRENCY to override the worker count)
+gunicorn -c gunicorn.conf.py app:app
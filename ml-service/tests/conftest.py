@@ -0,0 +1,81 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+
+# The service modules are top-level scripts in ml-service/, not a package
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVICE_DIR)
+
+PROFILE_OPTIONS = {
+    'city': ['Mumbai', 'Delhi', 'Bangalore', 'Pune'],
+    'locality': ['Andheri', 'Bandra', 'Powai', 'Thane'],
+    'gender': ['Male', 'Female', 'Non-binary', 'Both'],
+    'budget': ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+'],
+    'sleepPattern': ['Early bird', 'Night owl', 'Flexible'],
+    'dietaryPrefs': ['Vegetarian', 'Non-vegetarian', 'Vegan'],
+    'smokingHabits': ['Non-smoker', 'Occasional smoker', 'Regular smoker'],
+    'drinkingHabits': ['Non-drinker', 'Social drinker', 'Regular drinker'],
+    'personalityType': ['Introverted', 'Extroverted', 'Ambivert'],
+    'socialStyle': ['Homebody', 'Social butterfly', 'Balanced'],
+    'hostingStyle': ['I like hosting', 'I like being guest', 'Either', 'Balanced'],
+    'weekendStyle': ['Relaxed at home', 'Out and about', 'Mixed activities'],
+    'petOwnership': ['Own pets', 'No pets', 'Planning to get pets'],
+    'petPreference': ['Love pets', 'Okay with pets', 'No pets please'],
+}
+ITEM_OPTIONS = {
+    'hobbies': ['Reading', 'Cooking', 'Gaming', 'Photography', 'Gardening', 'Yoga'],
+    'interests': ['Technology', 'Arts', 'Science', 'History', 'Business'],
+    'musicGenres': ['Pop', 'Rock', 'Classical', 'Jazz', 'Hip-hop'],
+    'sportsActivities': ['Cricket', 'Football', 'Tennis', 'Swimming', 'Gym'],
+    'languagesSpoken': ['English', 'Hindi', 'Tamil', 'Marathi'],
+}
+
+
+def make_profiles(rng, size):
+    """Random registration profiles; multi-valued fields alternate between lists and ';'-joined strings"""
+    profiles = []
+    for i in range(size):
+        profile = {field: str(rng.choice(options)) for field, options in PROFILE_OPTIONS.items()}
+        profile['age'] = int(rng.integers(18, 35))
+        profile['cleanliness'] = int(rng.integers(1, 6))
+        for field, options in ITEM_OPTIONS.items():
+            items = [str(item) for item in rng.choice(options, size=rng.integers(0, 4))]
+            profile[field] = items if i % 2 else ';'.join(items)
+        profiles.append(profile)
+    return profiles
+
+
+@pytest.fixture(scope='session')
+def model_columns():
+    import joblib
+    return list(joblib.load(os.path.join(SERVICE_DIR, 'flatmate_model_columns.pkl')))
+
+
+@pytest.fixture(scope='session')
+def random_profiles():
+    """make_profiles, for tests that need more or differently seeded profiles"""
+    return make_profiles
+
+
+@pytest.fixture(scope='session')
+def profiles():
+    return make_profiles(np.random.default_rng(7), 200)
+
+
+@pytest.fixture(scope='session')
+def service(tmp_path_factory):
+    """The Flask service module, loaded once with the pickled model and a throwaway match index"""
+    if not os.path.exists(os.path.join(SERVICE_DIR, 'flatmate_match_model.pkl')):
+        pytest.skip('flatmate_match_model.pkl is not available (run retrain_model.py)')
+    state = tmp_path_factory.mktemp('service')
+    os.environ['ML_MODEL_ARTIFACT'] = str(state / 'absent.bin')
+    os.environ['ML_MATCH_INDEX_PATH'] = str(state / 'match_index.sqlite3')
+    return importlib.import_module('app')
+
+
+@pytest.fixture
+def client(service):
+    return service.app.test_client()
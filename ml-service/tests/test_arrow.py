@@ -0,0 +1,70 @@
+"""Arrow IPC requests and responses"""
+import json
+
+import numpy as np
+import pyarrow as pa
+
+from arrow_io import ARROW_STREAM_MIMETYPE, read_table, write_table
+
+ITEM_FIELDS = ('hobbies', 'interests', 'musicGenres', 'sportsActivities', 'languagesSpoken')
+
+
+def _items(value):
+    return value if isinstance(value, list) else [item for item in value.split(';') if item]
+
+
+def _side(profiles, prefix):
+    columns = {}
+    for field in profiles[0]:
+        values = [profile[field] for profile in profiles]
+        columns[prefix + field] = [_items(value) for value in values] if field in ITEM_FIELDS else values
+    return columns
+
+
+def _stream(columns, metadata=None):
+    table = pa.table(columns, metadata=metadata)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def _post(client, path, body, query=''):
+    return client.post(path + query, data=body, content_type=ARROW_STREAM_MIMETYPE)
+
+
+def test_write_table_round_trip():
+    body = write_table({'index': np.arange(3), 'score': np.array([10, 50, 95], dtype=np.int32)}, {'total': 3})
+    table = read_table(body)
+    assert table.column('score').to_pylist() == [10, 50, 95]
+    assert table.schema.metadata[b'total'] == b'3'
+
+
+def test_pair_table_scores_like_json(client, profiles):
+    users, candidates = profiles[:40], profiles[40:80]
+    expected = client.post('/predict-enhanced', json=[
+        {'user': user, 'candidate': candidate} for user, candidate in zip(users, candidates)
+    ]).get_json()['match_percentages']
+
+    response = _post(client, '/predict-enhanced', _stream({**_side(users, 'user.'), **_side(candidates, 'candidate.')}))
+
+    assert response.status_code == 200
+    assert response.mimetype == ARROW_STREAM_MIMETYPE
+    assert read_table(response.get_data()).column('match_percentage').to_pylist() == expected
+
+
+def test_shared_user_in_metadata_ranks_like_json(client, profiles):
+    user, candidates = profiles[0], profiles[1:60]
+    expected = client.post('/rank', json={'user': user, 'candidates': candidates, 'k': 5}).get_json()
+
+    table = read_table(_post(
+        client, '/rank', _stream(_side(candidates, 'candidate.'), {'user': json.dumps(user)}), '?k=5'
+    ).get_data())
+
+    assert table.column('index').to_pylist() == [match['index'] for match in expected['matches']]
+    assert table.column('match_percentage').to_pylist() == [match['match_percentage'] for match in expected['matches']]
+    assert int(table.schema.metadata[b'total']) == expected['total']
+
+
+def test_unreadable_body_is_rejected(client):
+    assert _post(client, '/predict-enhanced', b'not arrow').status_code == 400
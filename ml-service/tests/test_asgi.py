@@ -0,0 +1,106 @@
+"""ASGI entry point: offloaded scoring, inline routes and backpressure"""
+import asyncio
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture(scope='module')
+def asgi(service):
+    import asgi
+    return asgi
+
+
+def _call(app, path, body=b'', chunks=1, method='POST', content_type='application/json'):
+    """Run one HTTP request through an ASGI app, the body split into `chunks` messages.
+
+    Returns (status, headers dict, body bytes).
+    """
+    size = -(-len(body) // chunks) if body else 0
+    parts = [body[i:i + size] for i in range(0, len(body), size)] if body else [b'']
+    messages = [
+        {'type': 'http.request', 'body': part, 'more_body': i < len(parts) - 1} for i, part in enumerate(parts)
+    ]
+    sent = []
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.Event().wait()  # the client keeps the connection open
+
+    async def send(message):
+        sent.append(message)
+
+    scope = {
+        'type': 'http', 'method': method, 'path': path, 'query_string': b'', 'http_version': '1.1',
+        'headers': [(b'content-type', content_type.encode())], 'server': ('test', 80), 'client': ('127.0.0.1', 1),
+    }
+    asyncio.run(asyncio.wait_for(app(scope, receive, send), 30))
+    start = sent[0]
+    return (
+        start['status'], {name.decode(): value.decode() for name, value in start['headers']},
+        b''.join(message.get('body', b'') for message in sent[1:])
+    )
+
+
+def test_offloaded_request_reads_a_chunked_body(asgi, client, profiles):
+    pairs = [{'user': user, 'candidate': candidate} for user, candidate in zip(profiles[:50], profiles[50:100])]
+    app = asgi.ScoringApp(threads=2, queue=0)
+    try:
+        status, _, body = _call(app, '/predict-enhanced', json.dumps(pairs).encode(), chunks=7)
+    finally:
+        app.executor.shutdown()
+
+    assert status == 200
+    assert json.loads(body) == client.post('/predict-enhanced', json=pairs).get_json()
+
+
+def test_ndjson_streams_through_the_pool(asgi, profiles):
+    lines = ''.join(json.dumps({'user': profiles[0], 'candidate': candidate}) + '\n' for candidate in profiles[1:30])
+    app = asgi.ScoringApp(threads=1, queue=0)
+    try:
+        status, _, body = _call(app, '/predict-enhanced', lines.encode(), chunks=5, content_type='application/x-ndjson')
+    finally:
+        app.executor.shutdown()
+
+    assert status == 200
+    assert [json.loads(line)['index'] for line in body.decode().splitlines()] == list(range(29))
+
+
+def test_cheap_routes_are_answered_inline(asgi):
+    app = asgi.ScoringApp(threads=1, queue=0)
+    status, _, body = _call(app, '/health', method='GET')
+    assert status == 200
+    assert app.executor is None
+
+
+def test_model_info_counts_off_the_event_loop(asgi, service, monkeypatch):
+    threads = []
+
+    class Index:
+        def stats(self):
+            threads.append(threading.current_thread())
+            return {'profiles': 0, 'lists': 0, 'k': 20}
+
+    monkeypatch.setattr(service, 'match_index', Index())
+    app = asgi.ScoringApp(threads=1, queue=0)
+    app.in_flight = app.capacity
+
+    status, _, body = _call(app, '/model-info', method='GET')
+
+    assert status == 200 and json.loads(body)['match_index']['k'] == 20
+    assert threads and threads[0] is not threading.main_thread()
+    assert app.executor is None
+
+
+def test_full_pool_answers_503(asgi, profiles):
+    app = asgi.ScoringApp(threads=1, queue=1)
+    app.in_flight = app.capacity
+
+    status, headers, body = _call(app, '/rank', json.dumps({'user': profiles[0], 'candidates': profiles[1:5]}).encode(), chunks=3)
+
+    assert status == 503
+    assert headers['retry-after'] == '1' and headers['connection'] == 'close'
+    assert 'error' in json.loads(body)
+    assert app.executor is None
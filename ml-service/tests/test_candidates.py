@@ -0,0 +1,92 @@
+"""Candidate store and id-based scoring through /candidates"""
+import numpy as np
+import pytest
+
+from candidate_store import CandidateLookupError, CandidateStore
+from feature_encoder import encode_pair_features, encode_profiles
+
+
+def _entries(profiles, prefix, version='1'):
+    return [{'id': f"{prefix}{i}", 'version': version, 'profile': profile} for i, profile in enumerate(profiles)]
+
+
+def test_store_gathers_what_was_upserted(profiles, model_columns):
+    store = CandidateStore(initial_capacity=4)
+    store.upsert([(f"c{i}", '1', profile) for i, profile in enumerate(profiles[:50])])
+    store.upsert([('c3', '2', profiles[60])])
+    assert store.remove('c7') and not store.remove('c7')
+    store.upsert([('c50', '1', profiles[61])])  # reuses the freed row
+
+    ids = ['c3', 'c50', 'c0', 'c49', 'c10']
+    expected = [profiles[60], profiles[61], profiles[0], profiles[49], profiles[10]]
+    user = encode_profiles([profiles[100]])
+    np.testing.assert_array_equal(
+        encode_pair_features(user, store.gather([(i, None) for i in ids]), model_columns),
+        encode_pair_features(user, encode_profiles(expected), model_columns)
+    )
+    assert len(store) == 50
+
+
+def test_store_reports_missing_and_stale():
+    store = CandidateStore()
+    store.upsert([('a', '1', {}), ('b', '1', {})])
+    with pytest.raises(CandidateLookupError) as error:
+        store.gather([('a', '1'), ('b', '2'), ('c', None)])
+    assert error.value.missing == ['c']
+    assert error.value.stale == ['b']
+
+
+def test_refs_score_like_inline_profiles(client, profiles):
+    user, candidates = profiles[0], profiles[1:30]
+    entries = _entries(candidates, 'refs-')
+    assert client.post('/candidates', json=entries).get_json()['stored'] == len(entries)
+
+    response = client.post('/predict-enhanced', json={
+        'user': user, 'candidate_refs': [{'id': e['id'], 'version': e['version']} for e in entries]
+    })
+    inline = client.post('/predict-enhanced', json={'user': user, 'candidates': candidates})
+    assert response.status_code == 200
+    assert response.get_json()['match_percentages'] == inline.get_json()['match_percentages']
+
+
+def test_missing_or_stale_refs_get_409_until_upserted(client, profiles):
+    client.post('/candidates', json=_entries(profiles[:2], 'retry-'))
+    body = {'user': profiles[5], 'candidate_refs': [
+        {'id': 'retry-0', 'version': '1'}, {'id': 'retry-1', 'version': '2'}, {'id': 'retry-2', 'version': '1'}
+    ]}
+
+    response = client.post('/predict-enhanced', json=body)
+    assert response.status_code == 409
+    assert response.get_json()['missing'] == ['retry-2']
+    assert response.get_json()['stale'] == ['retry-1']
+
+    client.post('/candidates', json=[
+        {'id': 'retry-1', 'version': '2', 'profile': profiles[1]}, {'id': 'retry-2', 'version': '1', 'profile': profiles[2]}
+    ])
+    response = client.post('/predict-enhanced', json=body)
+    assert response.status_code == 200
+    assert len(response.get_json()['match_percentages']) == 3
+
+
+def test_candidate_profiles_in_the_request_satisfy_its_refs(client, profiles):
+    entries = _entries(profiles[10:13], 'inline-')
+    response = client.post('/predict-enhanced', json={
+        'user': profiles[0],
+        'candidate_refs': [{'id': e['id'], 'version': e['version']} for e in entries],
+        'candidate_profiles': entries
+    })
+    assert response.status_code == 200
+    assert len(response.get_json()['match_percentages']) == 3
+
+
+def test_invalid_entries_and_unknown_deletes(client):
+    assert client.post('/candidates', json={'id': 'x'}).status_code == 400
+    assert client.post('/candidates', json=[{'id': 'x'}]).status_code == 400
+    assert client.delete('/candidates/never-stored').status_code == 404
+
+
+def test_malformed_refs_get_400(client, profiles):
+    for refs in (['c1'], [{'version': '1'}], [None]):
+        response = client.post('/predict-enhanced', json={'user': profiles[0], 'candidate_refs': refs})
+        assert response.status_code == 400, refs
+        assert response.get_json()['error'] == 'Every candidate ref needs an id'
@@ -0,0 +1,148 @@
+"""Batch encoder parity with the original per-pair encoder"""
+import numpy as np
+
+from feature_encoder import BUDGET_ORDER, category_code, encode_pair_features, encode_profiles
+
+
+def _overlap(user_array, candidate_array):
+    try:
+        if not user_array or not candidate_array:
+            return 0
+        user_items = set(str(user_array).split(';')) if isinstance(user_array, str) else set(user_array)
+        candidate_items = set(str(candidate_array).split(';')) if isinstance(candidate_array, str) else set(candidate_array)
+        if len(user_items) == 0 or len(candidate_items) == 0:
+            return 0
+        total_unique = len(user_items.union(candidate_items))
+        return len(user_items.intersection(candidate_items)) / total_unique if total_unique > 0 else 0
+    except Exception:
+        return 0
+
+
+def _hosting(user_hosting, candidate_hosting):
+    if user_hosting == 'Either' or candidate_hosting == 'Either':
+        return 1.0
+    if {user_hosting, candidate_hosting} == {'I like hosting', 'I like being guest'}:
+        return 1.0
+    return 0.5 if user_hosting == candidate_hosting else 0.0
+
+
+def _pets(user_ownership, candidate_ownership, user_preference, candidate_preference):
+    if (user_ownership == 'Own pets' and candidate_preference == 'Love pets') or \
+       (candidate_ownership == 'Own pets' and user_preference == 'Love pets'):
+        return 1.0
+    if (user_ownership == 'Own pets' and candidate_preference == 'Okay with pets') or \
+       (candidate_ownership == 'Own pets' and user_preference == 'Okay with pets'):
+        return 0.7
+    if user_preference == 'No pets please' and candidate_preference == 'No pets please' and \
+       user_ownership == 'No pets' and candidate_ownership == 'No pets':
+        return 1.0
+    if (user_ownership == 'Own pets' and candidate_preference == 'No pets please') or \
+       (candidate_ownership == 'Own pets' and user_preference == 'No pets please'):
+        return 0.0
+    return 0.5
+
+
+def legacy_encode_pair(user, candidate, model_columns):
+    """The per-pair encoder the service used before batch encoding, kept as the reference"""
+    try:
+        features = {
+            'age_difference': abs(user.get('age', 25) - candidate.get('age', 25)),
+            'same_city': 1 if user.get('city') == candidate.get('city') else 0,
+            'same_locality': 1 if user.get('locality') == candidate.get('locality') else 0,
+            'same_gender': 1 if user.get('gender') == candidate.get('gender') else 0,
+        }
+        try:
+            budget_difference = abs(
+                BUDGET_ORDER.index(user.get('budget', '20000-25000'))
+                - BUDGET_ORDER.index(candidate.get('budget', '20000-25000'))
+            )
+            features['budget_difference'] = budget_difference
+            features['budget_compatibility'] = 1 if budget_difference <= 1 else 0
+        except ValueError:
+            features['budget_difference'] = 0
+            features['budget_compatibility'] = 1
+        for field, name in [
+            ('sleepPattern', 'sleep_compatibility'), ('dietaryPrefs', 'dietary_compatibility'),
+            ('socialStyle', 'social_compatibility'), ('weekendStyle', 'weekend_compatibility'),
+            ('personalityType', 'personality_compatibility'), ('smokingHabits', 'smoking_compatibility'),
+            ('drinkingHabits', 'drinking_compatibility'),
+        ]:
+            features[name] = 1 if user.get(field) == candidate.get(field) else 0
+        features['hosting_compatibility'] = _hosting(user.get('hostingStyle'), candidate.get('hostingStyle'))
+        cleanliness_difference = abs(user.get('cleanliness', 3) - candidate.get('cleanliness', 3))
+        features['cleanliness_difference'] = cleanliness_difference
+        features['cleanliness_compatibility'] = 1 if cleanliness_difference <= 1 else 0
+        for field, name in [
+            ('hobbies', 'hobbies_overlap'), ('interests', 'interests_overlap'), ('musicGenres', 'music_overlap'),
+            ('sportsActivities', 'sports_overlap'), ('languagesSpoken', 'language_overlap'),
+        ]:
+            features[name] = _overlap(user.get(field, ''), candidate.get(field, ''))
+        features['pet_ownership_compatibility'] = _pets(
+            user.get('petOwnership'), candidate.get('petOwnership'),
+            user.get('petPreference'), candidate.get('petPreference')
+        )
+        return np.array([features.get(name, 0) for name in model_columns], dtype=np.float64)
+    except Exception:
+        return np.zeros(len(model_columns))
+
+
+EDGE_PROFILES = [
+    {},
+    {'budget': 'unknown', 'hostingStyle': 'Either', 'petOwnership': 'Own pets', 'petPreference': 'Love pets'},
+    {'hobbies': 'Reading;Cooking', 'interests': '', 'languagesSpoken': 'Hindi;Klingon', 'age': 22},
+    {'hobbies': ['Reading', 'Unlisted hobby'], 'musicGenres': [], 'cleanliness': 5},
+    {'age': 'twenty', 'city': 'Pune'},
+    None,
+    {'hostingStyle': 'I like hosting', 'petOwnership': 'No pets', 'petPreference': 'No pets please'},
+    {'hostingStyle': 'I like being guest', 'petOwnership': 'No pets', 'petPreference': 'No pets please'},
+]
+
+
+def test_aligned_pairs_match_legacy_encoder(profiles, model_columns):
+    pool = profiles + EDGE_PROFILES
+    rng = np.random.default_rng(11)
+    users = [pool[i] for i in rng.integers(0, len(pool), 500)]
+    candidates = [pool[i] for i in rng.integers(0, len(pool), 500)]
+
+    features = encode_pair_features(encode_profiles(users), encode_profiles(candidates), model_columns)
+    expected = np.array([legacy_encode_pair(u, c, model_columns) for u, c in zip(users, candidates)])
+
+    np.testing.assert_allclose(features, expected)
+
+
+def test_shared_user_matches_legacy_encoder(profiles, model_columns):
+    pool = profiles + EDGE_PROFILES
+    for user in profiles[:5] + EDGE_PROFILES:
+        features = encode_pair_features(encode_profiles([user]), encode_profiles(pool), model_columns)
+        expected = np.array([legacy_encode_pair(user, candidate, model_columns) for candidate in pool])
+        np.testing.assert_allclose(features, expected)
+
+
+def test_unknown_items_do_not_widen_the_masks(model_columns):
+    known = encode_profiles([{'hobbies': 'Reading;Cooking'}])['masks']['hobbies']
+    # Far more distinct items than the vocabulary and its overflow word hold
+    unknown = encode_profiles([{'hobbies': [f"Hobby {i}" for i in range(i, i + 20)]} for i in range(0, 300, 20)])
+
+    assert unknown['masks']['hobbies'].shape[1] == known.shape[1]
+    assert not (unknown['masks']['hobbies'][:, :known.shape[1] - 1]).any()  # vocabulary bits stay clear
+
+    # An unknown item both sides share still counts towards the overlap
+    overlap = encode_pair_features(
+        encode_profiles([{'hobbies': ['Reading', 'Surfing']}]), encode_profiles([{'hobbies': 'Surfing'}]), model_columns
+    )[0, model_columns.index('hobbies_overlap')]
+    assert overlap == 0.5
+
+
+def test_unknown_categories_get_stable_distinct_codes():
+    cities = [f"City {i}" for i in range(5000)]
+    codes = [category_code(city) for city in cities]
+
+    assert len(set(codes)) == len(cities)
+    assert codes == [category_code(city) for city in cities]
+    assert category_code(1) == category_code(1.0) != category_code('1')
+    assert category_code(['a']) == category_code(['a']) != category_code(None) == 0
+
+
+def test_empty_side_gives_no_rows(profiles, model_columns):
+    features = encode_pair_features(encode_profiles([]), encode_profiles(profiles), model_columns)
+    assert features.shape == (0, len(model_columns))
@@ -0,0 +1,100 @@
+"""Array inference engine against sklearn"""
+import joblib
+import numpy as np
+import pytest
+from sklearn.ensemble import HistGradientBoostingRegressor, RandomForestRegressor
+
+import forest_engine
+from forest_engine import ArrayForest, HybridPredictor, LazyModel, build_artifact_predictor, build_predictor, load_sklearn_model
+
+N_FEATURES = 22
+
+
+def _data(seed, rows=2000):
+    rng = np.random.default_rng(seed)
+    X = np.round(rng.random((rows, N_FEATURES)) * 6, 2)
+    y = X[:, :4].sum(axis=1) * 10 + rng.random(rows)
+    return X, y
+
+
+@pytest.fixture(scope='module')
+def forest():
+    return RandomForestRegressor(n_estimators=20, max_depth=10, random_state=0).fit(*_data(0))
+
+
+@pytest.fixture(scope='module')
+def boosted():
+    return HistGradientBoostingRegressor(max_iter=30, random_state=0).fit(*_data(1))
+
+
+@pytest.mark.parametrize('model_name', ['forest', 'boosted'])
+def test_array_forest_matches_sklearn(model_name, request):
+    model = request.getfixturevalue(model_name)
+    X, _ = _data(2, rows=5000)
+    np.testing.assert_allclose(ArrayForest.from_sklearn(model).predict(X), model.predict(X), rtol=1e-9, atol=1e-12)
+
+
+def test_predictor_sends_large_batches_to_sklearn(forest):
+    predictor = build_predictor(forest, N_FEATURES, engine='array')
+    assert isinstance(predictor, HybridPredictor)
+
+    X, _ = _data(3, rows=predictor.max_rows + 1)
+    predictor.forest = None  # a large batch must not touch the array engine
+    np.testing.assert_allclose(predictor.predict(X), forest.predict(X))
+
+
+def test_sklearn_engine_serves_the_model_itself(forest):
+    assert build_predictor(forest, N_FEATURES, engine='sklearn') is forest
+
+
+def test_artifact_predictor_sends_large_batches_to_matching_pickle(forest, tmp_path):
+    engine = ArrayForest.from_sklearn(forest)
+    model_path = str(tmp_path / 'model.pkl')
+    joblib.dump(forest, model_path)
+
+    predictor = build_artifact_predictor(engine, model_path, N_FEATURES, inference_engine='array')
+    assert isinstance(predictor, HybridPredictor)
+    assert isinstance(predictor.model, LazyModel) and predictor.model.model is None
+
+    X, _ = _data(4, rows=predictor.max_rows + 1)
+    predictor.predict(X[:10])
+    assert predictor.model.model is None  # small batches never load the pickle
+    np.testing.assert_allclose(predictor.predict(X), forest.predict(X), rtol=1e-9, atol=1e-12)
+    assert isinstance(predictor.model.model, RandomForestRegressor)
+
+
+def test_artifact_predictor_ignores_a_pickle_of_another_model(forest, boosted, tmp_path):
+    engine = ArrayForest.from_sklearn(forest)
+    model_path = str(tmp_path / 'model.pkl')
+    joblib.dump(boosted, model_path)
+
+    assert build_artifact_predictor(engine, model_path, N_FEATURES, inference_engine='sklearn') is engine
+
+    predictor = build_artifact_predictor(engine, model_path, N_FEATURES, inference_engine='array')
+    X, _ = _data(5, rows=predictor.max_rows + 1)
+    np.testing.assert_allclose(predictor.predict(X), engine.predict(X))
+    assert predictor.model.model is None
+
+
+def test_loaded_model_gets_the_requested_n_jobs(tmp_path):
+    model = RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0, n_jobs=-1).fit(*_data(6))
+    model_path = str(tmp_path / 'model.pkl')
+    joblib.dump(model, model_path)
+    engine = ArrayForest.from_sklearn(model)
+
+    assert load_sklearn_model(model_path, engine, N_FEATURES).n_jobs == -1
+    assert load_sklearn_model(model_path, engine, N_FEATURES, n_jobs=1).n_jobs == 1
+    assert build_predictor(joblib.load(model_path), N_FEATURES, engine='sklearn', n_jobs=1).n_jobs == 1
+
+
+def test_lazily_loaded_model_follows_the_thread_setting(monkeypatch, tmp_path):
+    model = RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0, n_jobs=-1).fit(*_data(7))
+    model_path = str(tmp_path / 'model.pkl')
+    joblib.dump(model, model_path)
+    monkeypatch.setattr(forest_engine, 'SKLEARN_N_JOBS', 1)
+
+    predictor = build_artifact_predictor(ArrayForest.from_sklearn(model), model_path, N_FEATURES, inference_engine='array')
+    X, _ = _data(8, rows=predictor.max_rows + 1)
+    predictor.predict(X)
+    assert predictor.model.model.n_jobs == 1
+    assert build_predictor(joblib.load(model_path), N_FEATURES, engine='sklearn').n_jobs == 1
@@ -0,0 +1,139 @@
+"""Match index: incremental updates against a full rebuild, and /matches"""
+import numpy as np
+import pytest
+
+from feature_encoder import encode_pair_features, scores_from_predictions, take_rows
+from match_index import CityFrame, MatchIndex
+
+
+@pytest.fixture
+def make_index(tmp_path, model_columns):
+    weights = np.random.default_rng(0).random(len(model_columns)) / 4
+
+    def score_pairs(user_columns, candidate_columns):
+        """Stands in for the model: a fixed linear score of the pair features"""
+        features = encode_pair_features(user_columns, candidate_columns, model_columns)
+        return scores_from_predictions(features @ weights, features)
+
+    def make(name, k=5):
+        return MatchIndex(str(tmp_path / f"{name}.sqlite3"), k, score_pairs, 'test-model')
+    return make
+
+
+def _profiles(random_profiles, seed, size):
+    profiles = random_profiles(np.random.default_rng(seed), size)
+    for i, profile in enumerate(profiles):
+        # Few cities, so every city holds enough pairs to fill and overflow the lists
+        profile['city'] = ['Pune', 'Mumbai'][(i + seed) % 2]
+    return profiles
+
+
+def _all_matches(index, ids):
+    return {profile_id: index.matches(profile_id) for profile_id in ids}
+
+
+def test_incremental_updates_match_full_rebuild(make_index, random_profiles):
+    profiles = {f"u{i}": profile for i, profile in enumerate(_profiles(random_profiles, 0, 120))}
+    incremental = make_index('incremental')
+    ids = list(profiles)
+    for start in range(0, len(ids), 25):
+        incremental.update([(profile_id, '1', profiles[profile_id]) for profile_id in ids[start:start + 25]])
+
+    # Edits: new versions of existing profiles (including city moves), and removals
+    edits = _profiles(random_profiles, 1, 30)
+    for i, profile_id in enumerate(ids[::4]):
+        profiles[profile_id] = edits[i]
+        incremental.update([(profile_id, '2', edits[i])])
+    for profile_id in ids[1:40:7]:
+        del profiles[profile_id]
+        assert incremental.remove(profile_id)
+
+    rebuilt = make_index('rebuilt')
+    rebuilt.update([(profile_id, '1', profile) for profile_id, profile in profiles.items()])
+
+    assert _all_matches(incremental, profiles) == _all_matches(rebuilt, profiles)
+
+
+def test_frames_updated_in_place_match_a_fresh_read(make_index, random_profiles):
+    profiles = {f"u{i}": profile for i, profile in enumerate(_profiles(random_profiles, 2, 60))}
+    index = make_index('frames')
+    index.update([(profile_id, '1', profile) for profile_id, profile in profiles.items()])
+    frame = index._frame(index._db(), 'Pune')
+
+    edits = _profiles(random_profiles, 3, 20)
+    for i, profile_id in enumerate(list(profiles)[::3]):
+        profiles[profile_id] = edits[i]
+        index.update([(profile_id, '2', edits[i])])
+    index.update([('new', '1', {**edits[0], 'city': 'Pune'})])
+    profiles['new'] = {**edits[0], 'city': 'Pune'}
+    assert index.remove('u4')
+    del profiles['u4']
+
+    assert index._frame(index._db(), 'Pune') is frame
+    ids = sorted(profile_id for profile_id, profile in profiles.items() if profile['city'] == 'Pune')
+    fresh = CityFrame(ids, [profiles[profile_id] for profile_id in ids])
+    rows = [frame.rows[profile_id] for profile_id in ids]
+    assert frame.ids[rows].tolist() == ids
+    np.testing.assert_array_equal(frame.eligible[rows], fresh.eligible)
+    np.testing.assert_array_equal(
+        encode_pair_features(take_rows(frame.encoded, rows), take_rows(frame.encoded, rows[::-1]), ['age_difference', 'same_gender', 'hobbies_overlap']),
+        encode_pair_features(fresh.encoded, take_rows(fresh.encoded, np.arange(len(ids))[::-1]), ['age_difference', 'same_gender', 'hobbies_overlap'])
+    )
+
+
+def test_changes_from_another_process_are_read_back(make_index, random_profiles):
+    profiles = {f"u{i}": profile for i, profile in enumerate(_profiles(random_profiles, 4, 80))}
+    ids = list(profiles)
+    first, second = make_index('shared'), make_index('shared')  # two workers on one index
+    first.update([(profile_id, '1', profiles[profile_id]) for profile_id in ids[:40]])
+    second.update([(profile_id, '1', profiles[profile_id]) for profile_id in ids[40:]])
+    first.update([(ids[0], '2', profiles[ids[50]])])
+    profiles[ids[0]] = profiles[ids[50]]
+
+    rebuilt = make_index('shared-rebuilt')
+    rebuilt.update([(profile_id, '1', profile) for profile_id, profile in profiles.items()])
+    assert _all_matches(first, profiles) == _all_matches(rebuilt, profiles)
+
+
+def test_only_lists_a_change_enters_are_rewritten(make_index, random_profiles, monkeypatch):
+    profiles = {f"u{i}": profile for i, profile in enumerate(_profiles(random_profiles, 5, 100))}
+    index = make_index('writes')
+    index.update([(profile_id, '1', profile) for profile_id, profile in profiles.items()])
+    before = index._lists(index._db(), profiles)
+
+    written = []
+    write_lists = index._write_lists
+    monkeypatch.setattr(index, '_write_lists', lambda db, lists: (written.extend(lists), write_lists(db, lists)))
+    index.update([('new', '1', {**profiles['u0'], 'city': 'Pune'})])
+
+    after = index._lists(index._db(), profiles)
+    assert set(written) == {'new'} | {user_id for user_id in profiles if after[user_id] != before[user_id]}
+
+
+def test_unchanged_version_is_skipped(make_index, profiles):
+    index = make_index('skip')
+    assert index.update([('u0', '1', profiles[0])]) == 1
+    assert index.update([('u0', '1', profiles[0])]) == 0
+    assert index.remove('missing') is False
+    assert index.matches('missing') is None
+
+
+def test_matches_endpoint_serves_model_scores(client, random_profiles):
+    profiles = random_profiles(np.random.default_rng(3), 30)
+    for profile in profiles:
+        profile['city'] = 'Testville'
+    client.post('/candidates', json=[{'id': f"mi-{i}", 'version': '1', 'profile': p} for i, p in enumerate(profiles)])
+
+    body = client.get('/matches/mi-0?k=5').get_json()
+
+    scores = client.post('/predict-enhanced', json={'user': profiles[0], 'candidates': profiles}).get_json()['match_percentages']
+    matches = body['matches']
+    assert 0 < len(matches) <= 5
+    assert all(match['id'] != 'mi-0' for match in matches)
+    assert [match['match_percentage'] for match in matches] == sorted((m['match_percentage'] for m in matches), reverse=True)
+    assert all(match['match_percentage'] == scores[int(match['id'][3:])] for match in matches)
+
+
+def test_matches_endpoint_errors(client):
+    assert client.get('/matches/never-stored').status_code == 404
+    assert client.get('/matches/mi-0?k=0').status_code == 400
@@ -0,0 +1,49 @@
+"""Prometheus metrics"""
+from metrics import Counter, Histogram, Registry
+
+
+def _sample(text, prefix):
+    """Value of the sample line starting with `prefix`, 0 when absent"""
+    for line in text.splitlines():
+        if line.startswith(prefix + ' '):
+            return float(line.rsplit(' ', 1)[1])
+    return 0
+
+
+def test_render_uses_the_exposition_format():
+    registry = Registry()
+    counter = registry.register(Counter('jobs_total', 'Jobs run', ('result',)))
+    histogram = registry.register(Histogram('job_seconds', 'Job duration', buckets=(0.1, 1.0)))
+    counter.inc(result='ok')
+    counter.inc(2, result='ok')
+    counter.inc(result='say "hi"')
+    histogram.observe(0.5)
+    histogram.observe(2.0)
+
+    assert registry.render().splitlines() == [
+        '# HELP jobs_total Jobs run',
+        '# TYPE jobs_total counter',
+        'jobs_total{result="ok"} 3',
+        'jobs_total{result="say \\"hi\\""} 1',
+        '# HELP job_seconds Job duration',
+        '# TYPE job_seconds histogram',
+        'job_seconds_bucket{le="0.1"} 0',
+        'job_seconds_bucket{le="1.0"} 1',
+        'job_seconds_bucket{le="+Inf"} 2',
+        'job_seconds_sum 2.5',
+        'job_seconds_count 2',
+    ]
+
+
+def test_requests_are_counted_per_endpoint_and_status(client, profiles):
+    requests = 'ml_requests_total{endpoint="predict_enhanced",status="%s"}'
+    stages = 'ml_stage_duration_seconds_count{endpoint="predict_enhanced",stage="model_predict"}'
+    before = client.get('/metrics').get_data(as_text=True)
+
+    client.post('/predict-enhanced', json=[{'user': profiles[0], 'candidate': profiles[1]}])
+    client.post('/predict-enhanced', json={'pairs': []})
+
+    after = client.get('/metrics').get_data(as_text=True)
+    assert _sample(after, requests % 200) == _sample(before, requests % 200) + 1
+    assert _sample(after, requests % 400) == _sample(before, requests % 400) + 1
+    assert _sample(after, stages) == _sample(before, stages) + 1
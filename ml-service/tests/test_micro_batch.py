@@ -0,0 +1,89 @@
+"""Micro-batching of concurrent model calls"""
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+
+from micro_batch import MicroBatcher
+
+
+class RecordingModel:
+    def __init__(self, error=None):
+        self.batches = []
+        self.error = error
+        self._lock = threading.Lock()
+
+    def predict(self, X):
+        with self._lock:
+            self.batches.append(len(X))
+        if self.error:
+            raise self.error
+        return np.asarray(X)[:, 0] * 2
+
+
+def _requests(count, rows=3):
+    return [np.arange(rows * i, rows * (i + 1), dtype=np.float64).reshape(rows, 1) for i in range(count)]
+
+
+def _concurrently(batcher, model, requests):
+    barrier = threading.Barrier(len(requests))
+
+    def call(features):
+        barrier.wait()
+        return batcher.predict(model, features)
+
+    with ThreadPoolExecutor(len(requests)) as pool:
+        return list(pool.map(call, requests))
+
+
+def test_concurrent_calls_share_one_predict():
+    model = RecordingModel()
+    requests = _requests(6)
+    results = _concurrently(MicroBatcher(max_rows=1000, max_wait=1.0), model, requests)
+
+    for features, result in zip(requests, results):
+        np.testing.assert_array_equal(result, features[:, 0] * 2)
+    assert sum(model.batches) == 18
+    assert len(model.batches) < 6
+
+
+def test_a_full_batch_is_scored_without_waiting():
+    model = RecordingModel()
+    batcher = MicroBatcher(max_rows=6, max_wait=30.0)
+    requests = _requests(2)
+    results = _concurrently(batcher, model, requests)  # would time the test out if the leader waited max_wait
+    assert model.batches == [6]
+    np.testing.assert_array_equal(np.concatenate(results), np.arange(6) * 2)
+
+
+def test_large_requests_skip_the_queue():
+    model = RecordingModel()
+    MicroBatcher(max_rows=4, max_wait=30.0).predict(model, np.zeros((4, 1)))
+    assert model.batches == [4]
+
+
+def test_errors_reach_every_request_in_the_batch():
+    model = RecordingModel(error=RuntimeError('model failed'))
+    batcher = MicroBatcher(max_rows=1000, max_wait=0.5)
+
+    def call(features):
+        with pytest.raises(RuntimeError, match='model failed'):
+            batcher.predict(model, features)
+
+    with ThreadPoolExecutor(4) as pool:
+        list(pool.map(call, _requests(4)))
+
+
+def test_bound_predictor_scores_requests_like_the_model(client, service, monkeypatch, profiles):
+    body = {'user': profiles[0], 'candidates': profiles[1:50]}
+    expected = client.post('/predict-enhanced', json=body).get_json()['match_percentages']
+
+    batcher, calls = MicroBatcher(max_rows=2048, max_wait=0.001), []
+    batch_predict = batcher.predict
+    monkeypatch.setattr(batcher, 'predict', lambda predictor, features: calls.append(len(features)) or batch_predict(predictor, features))
+    monkeypatch.setattr(service, 'micro_batcher', batcher)
+    service.score_cache.clear()
+
+    assert client.post('/predict-enhanced', json=body).get_json()['match_percentages'] == expected
+    assert calls
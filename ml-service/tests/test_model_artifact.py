@@ -0,0 +1,52 @@
+"""Memory-mapped model artifacts"""
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from forest_engine import ArrayForest
+from model_artifact import ArtifactError, load_artifact, save_artifact
+
+COLUMNS = [f"f{i}" for i in range(8)]
+
+
+@pytest.fixture(scope='module')
+def forest():
+    rng = np.random.default_rng(0)
+    X = np.round(rng.random((500, len(COLUMNS))) * 6, 2)
+    return RandomForestRegressor(n_estimators=5, max_depth=6, random_state=0).fit(X, X.sum(axis=1))
+
+
+@pytest.fixture
+def artifact(forest, tmp_path):
+    path = str(tmp_path / 'model.bin')
+    save_artifact(path, ArrayForest.from_sklearn(forest), COLUMNS)
+    return path
+
+
+def test_round_trip_matches_sklearn(forest, artifact):
+    engine, header = load_artifact(artifact, COLUMNS)
+    X = np.round(np.random.default_rng(1).random((1000, len(COLUMNS))) * 6, 2)
+    np.testing.assert_allclose(engine.predict(X), forest.predict(X), rtol=1e-9, atol=1e-12)
+    assert header['feature_columns'] == COLUMNS
+
+
+def test_feature_schema_mismatch_is_rejected(artifact):
+    with pytest.raises(ArtifactError, match='schema mismatch'):
+        load_artifact(artifact, COLUMNS[::-1])
+
+
+def test_corrupt_data_is_rejected(artifact):
+    with open(artifact, 'r+b') as f:
+        f.seek(-1, 2)
+        last = f.read(1)
+        f.seek(-1, 2)
+        f.write(bytes([last[0] ^ 0xFF]))
+    with pytest.raises(ArtifactError, match='Checksum'):
+        load_artifact(artifact)
+
+
+def test_other_files_are_rejected(tmp_path):
+    path = tmp_path / 'model.pkl'
+    path.write_bytes(b'not an artifact')
+    with pytest.raises(ArtifactError):
+        load_artifact(str(path))
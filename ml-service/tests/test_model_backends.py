@@ -0,0 +1,29 @@
+"""Model backends export an array engine that predicts like the trained model"""
+import numpy as np
+import pytest
+
+from model_artifact import load_artifact, save_artifact
+from model_backends import BACKENDS, backend_for_model, get_backend
+
+COLUMNS = [f"f{i}" for i in range(6)]
+
+
+@pytest.mark.parametrize('name', sorted(BACKENDS))
+def test_exported_artifact_predicts_like_the_model(name, tmp_path):
+    rng = np.random.default_rng(0)
+    X = np.round(rng.random((400, len(COLUMNS))) * 6, 2)
+    backend = get_backend(name)
+    model = backend.create().fit(X, X[:, 0] * 3 + X[:, 1] + rng.random(len(X)))
+    assert backend_for_model(model) is backend
+
+    path = str(tmp_path / 'model.bin')
+    save_artifact(path, backend.export(model), COLUMNS, backend=name)
+    engine, header = load_artifact(path, COLUMNS)
+
+    assert header['backend'] == name
+    np.testing.assert_allclose(engine.predict(X), model.predict(X), rtol=1e-9, atol=1e-9)
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        get_backend('nope')
@@ -0,0 +1,24 @@
+"""NDJSON streaming through /predict-enhanced"""
+import json
+
+
+def test_stream_scores_like_a_batch_across_chunks(client, service, profiles, monkeypatch):
+    monkeypatch.setattr(service, 'STREAM_CHUNK_PAIRS', 7)
+    pairs = [{'user': user, 'candidate': candidate} for user, candidate in zip(profiles[:30], profiles[30:60])]
+    batch = client.post('/predict-enhanced', json=pairs).get_json()['match_percentages']
+
+    lines = [json.dumps(pair) for pair in pairs]
+    lines[4] = '{"user": '
+    lines[11] = '[1, 2]'
+    lines[15] = '{"user": 1, "candidate": 2}'
+    lines.insert(20, '')
+    response = client.post('/predict-enhanced', data='\n'.join(lines) + '\n', content_type='application/x-ndjson')
+
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert [result['index'] for result in results] == list(range(len(pairs)))
+    for i, result in enumerate(results):
+        if i in (4, 11, 15):
+            assert 'error' in result
+        else:
+            assert result['match_percentage'] == batch[i]
@@ -0,0 +1,110 @@
+"""Offline all-pairs match job against direct scoring"""
+import os
+
+import joblib
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from feature_encoder import encode_pair_features, encode_profiles, scores_from_predictions
+from precompute_matches import parse_args, run
+
+ITEM_FIELDS = ('hobbies', 'interests', 'musicGenres', 'sportsActivities', 'languagesSpoken')
+
+
+@pytest.fixture(scope='module')
+def dump(tmp_path_factory, model_columns, random_profiles):
+    """(profile dump path, model dir, profiles, model)"""
+    root = tmp_path_factory.mktemp('precompute')
+    rng = np.random.default_rng(0)
+    X = rng.random((2000, len(model_columns)))
+    model = RandomForestRegressor(n_estimators=10, max_depth=6, random_state=0).fit(X, X[:, :6].sum(axis=1) / 6)
+    joblib.dump(model, root / 'flatmate_match_model.pkl')
+    joblib.dump(model_columns, root / 'flatmate_model_columns.pkl')
+
+    profiles = random_profiles(np.random.default_rng(1), 150)
+    for i, profile in enumerate(profiles):
+        profile['id'] = f"p{i}"
+        profile['city'] = ['Pune', 'Mumbai', 'Delhi'][i % 3]
+        for field in ITEM_FIELDS:
+            if isinstance(profile[field], str):
+                profile[field] = [item for item in profile[field].split(';') if item]
+        if i % 10 == 0:
+            profile['locality'] = None  # never matched as a user, still a candidate
+    pq.write_table(pa.Table.from_pylist(profiles), root / 'profiles.parquet')
+    return str(root / 'profiles.parquet'), str(root), profiles, model
+
+
+def _expected(profiles, model, model_columns, top_k=0):
+    """{(user id, candidate id): match percentage} scored pair by pair with the controller's rules"""
+    budgets = ['<15000', '15000-20000', '20000-25000', '25000-30000', '30000-40000', '40000+']
+    expected = {}
+    for user in profiles:
+        if not all(user.get(field) for field in ('city', 'locality', 'budget', 'gender')):
+            continue
+        candidates = [
+            candidate for candidate in profiles
+            if candidate is not user and candidate['city'] == user['city']
+            and abs(budgets.index(candidate['budget']) - budgets.index(user['budget'])) <= 1
+            and (user['gender'] == 'Both' or candidate['gender'] in (user['gender'], 'Both'))
+        ]
+        if not candidates:
+            continue
+        features = encode_pair_features(encode_profiles([user]), encode_profiles(candidates), model_columns)
+        scores = scores_from_predictions(model.predict(features), features)
+        order = np.argsort(-scores, kind='stable')[:top_k or len(candidates)]
+        expected.update({(user['id'], candidates[i]['id']): int(scores[i]) for i in order})
+    return expected
+
+
+def _read_parts(output):
+    table = pq.read_table(output)
+    return {
+        (user, candidate): score for user, candidate, score in zip(
+            table.column('user_id').to_pylist(), table.column('candidate_id').to_pylist(),
+            table.column('match_percentage').to_pylist()
+        )
+    }
+
+
+def test_parquet_output_matches_direct_scoring(dump, model_columns, tmp_path):
+    path, model_dir, profiles, model = dump
+    output = str(tmp_path / 'matches')
+    run(parse_args([path, output, '--workers', '2', '--model-dir', model_dir]))
+    assert _read_parts(output) == _expected(profiles, model, model_columns)
+
+
+def test_top_k_keeps_the_best_candidates(dump, model_columns, tmp_path):
+    path, model_dir, profiles, model = dump
+    output = str(tmp_path / 'matches')
+    run(parse_args([path, output, '--workers', '2', '--model-dir', model_dir, '--top-k', '5']))
+
+    written = _read_parts(output)
+    expected = _expected(profiles, model, model_columns)
+    for user in {user for user, _ in expected}:
+        scores = sorted((score for (u, _), score in expected.items() if u == user), reverse=True)
+        kept = sorted((score for (u, _), score in written.items() if u == user), reverse=True)
+        assert kept == scores[:5]
+
+
+def test_npy_output_and_resume(dump, model_columns, tmp_path):
+    path, model_dir, profiles, model = dump
+    output = str(tmp_path / 'matches')
+    args = parse_args([path, output, '--workers', '2', '--model-dir', model_dir, '--format', 'npy'])
+    run(args)
+
+    matches = np.load(os.path.join(output, 'matches.npy'))
+    assert np.load(os.path.join(output, 'done.npy')).all()
+    assert {
+        (profiles[user]['id'], profiles[candidate]['id']): int(score)
+        for user, candidate, score in matches.tolist()
+    } == _expected(profiles, model, model_columns)
+
+    # A finished run has nothing left to do; other options need --restart
+    mtime = os.path.getmtime(os.path.join(output, 'matches.npy'))
+    run(args)
+    assert os.path.getmtime(os.path.join(output, 'matches.npy')) == mtime
+    with pytest.raises(SystemExit):
+        run(parse_args([path, output, '--workers', '2', '--model-dir', model_dir, '--format', 'npy', '--top-k', '3']))
@@ -0,0 +1,39 @@
+"""/predict-enhanced batch scoring"""
+
+
+def _scores(client, body):
+    response = client.post('/predict-enhanced', json=body)
+    assert response.status_code == 200, response.get_json()
+    return response.get_json()['match_percentages']
+
+
+def test_batch_matches_single_pair_requests(client, profiles):
+    pairs = [{'user': user, 'candidate': candidate} for user, candidate in zip(profiles[:40], profiles[40:80])]
+
+    scores = _scores(client, pairs)
+
+    assert scores == [_scores(client, [pair])[0] for pair in pairs]
+    assert all(10 <= score <= 95 for score in scores)
+
+
+def test_empty_batch(client):
+    assert _scores(client, []) == []
+
+
+def test_unsupported_body_is_rejected(client):
+    assert client.post('/predict-enhanced', json={'pairs': []}).status_code == 400
+
+
+def test_shared_user_matches_pair_list(client, profiles):
+    user, candidates = profiles[0], profiles[1:60]
+
+    scores = _scores(client, {'user': user, 'candidates': candidates})
+
+    assert scores == _scores(client, [{'user': user, 'candidate': candidate} for candidate in candidates])
+
+
+def test_non_object_profiles_are_rejected(client):
+    for body in ({'user': 'x', 'candidates': [{}]}, {'user': {}, 'candidates': [1, 2]}, [{'user': 1, 'candidate': 2}], [{}, 'pair']):
+        response = client.post('/predict-enhanced', json=body)
+        assert response.status_code == 400, body
+    assert response.get_json() == {'error': 'Expected a {user, candidate} object', 'index': 1}
@@ -0,0 +1,73 @@
+"""Candidate pre-filtering"""
+import numpy as np
+import pytest
+
+from feature_encoder import BUDGET_ORDER, encode_profiles
+from prefilter import filter_pairs, parse_filter
+
+
+def _passes(spec, user, candidate):
+    """The filter rules pair by pair"""
+    if 'budget_window' in spec and abs(BUDGET_ORDER.index(user['budget']) - BUDGET_ORDER.index(candidate['budget'])) > spec['budget_window']:
+        return False
+    if spec.get('gender') and not (user['gender'] == 'Both' or candidate['gender'] in (user['gender'], 'Both')):
+        return False
+    if 'min_age' in spec and candidate['age'] < spec['min_age']:
+        return False
+    if 'max_age' in spec and candidate['age'] > spec['max_age']:
+        return False
+    if 'max_age_difference' in spec and abs(user['age'] - candidate['age']) > spec['max_age_difference']:
+        return False
+    if spec.get('same_locality') and candidate['locality'] != user['locality']:
+        return False
+    if 'localities' in spec and candidate['locality'] not in spec['localities']:
+        return False
+    return True
+
+
+SPECS = [
+    True,
+    {'budget_window': 0},
+    {'gender': True, 'min_age': 21, 'max_age': 28},
+    {'max_age_difference': 3, 'same_locality': True},
+    {'localities': ['Bandra', 'Powai'], 'budget_window': 2},
+]
+
+
+@pytest.mark.parametrize('spec', SPECS)
+def test_aligned_pairs_match_rules(spec, profiles):
+    users, candidates = profiles[:100], profiles[100:]
+    parsed = parse_filter(spec)
+    expected = [i for i, (u, c) in enumerate(zip(users, candidates)) if _passes(parsed, u, c)]
+    assert filter_pairs(parsed, encode_profiles(users), encode_profiles(candidates)).tolist() == expected
+
+
+@pytest.mark.parametrize('spec', SPECS)
+def test_shared_user_matches_rules(spec, profiles):
+    user, candidates = profiles[0], profiles[1:]
+    parsed = parse_filter(spec)
+    expected = [i for i, c in enumerate(candidates) if _passes(parsed, user, c)]
+    assert filter_pairs(parsed, encode_profiles([user]), encode_profiles(candidates)).tolist() == expected
+
+
+@pytest.mark.parametrize('spec', [[], {'budget': 1}, {'gender': 'yes'}, {'min_age': -1}, {'max_age': True}, {'localities': 'Bandra'}])
+def test_invalid_specs_are_rejected(spec):
+    with pytest.raises(ValueError):
+        parse_filter(spec)
+
+
+def test_filtered_requests_report_surviving_pairs(client, profiles):
+    user, candidates = profiles[0], profiles[1:80]
+    spec = {'budget_window': 1, 'gender': True}
+    survivors = [i for i, c in enumerate(candidates) if _passes(spec, user, c)]
+    scores = client.post('/predict-enhanced', json={'user': user, 'candidates': candidates}).get_json()['match_percentages']
+
+    body = client.post('/predict-enhanced', json={'user': user, 'candidates': candidates, 'filter': spec}).get_json()
+    assert body['indices'] == survivors
+    assert body['match_percentages'] == [scores[i] for i in survivors]
+
+    ranked = client.post('/rank', json={'user': user, 'candidates': candidates, 'filter': True, 'k': 200}).get_json()
+    assert ranked['filtered'] == len(survivors)
+    assert sorted(match['index'] for match in ranked['matches']) == survivors
+
+    assert client.post('/rank', json={'user': user, 'candidates': candidates, 'filter': {'nope': 1}}).status_code == 400
@@ -0,0 +1,36 @@
+"""Cascade pre-ranking"""
+import numpy as np
+
+from feature_encoder import encode_pair_features, encode_profiles
+from prerank import compatibility_formula, prerank
+
+
+def test_prerank_selects_the_best_formula_scores(profiles, model_columns):
+    features = encode_pair_features(encode_profiles([profiles[0]]), encode_profiles(profiles), model_columns)
+    formula = compatibility_formula(features, model_columns)
+
+    scores, selected = prerank(features, model_columns, 20)
+
+    np.testing.assert_array_equal(scores, np.clip(formula, 0, 1))
+    assert selected.sum() == 20
+    assert scores[selected].min() >= scores[~selected].max()
+    assert prerank(features[:10], model_columns, 20)[1].all()
+    assert not prerank(features, model_columns, 0)[1].any()
+
+
+def test_cascade_rescores_only_the_top_n(client, profiles):
+    body = {'user': profiles[0], 'candidates': profiles[1:120], 'k': 10}
+    plain = client.post('/rank', json=body).get_json()
+    full = client.post('/rank', json={**body, 'cascade': 500}).get_json()
+    cascade = client.post('/rank', json={**body, 'cascade': 15}).get_json()
+
+    assert 'model_scored' not in plain
+    assert [m['match_percentage'] for m in full['matches']] == [m['match_percentage'] for m in plain['matches']]
+    assert {m['stage'] for m in full['matches']} == {'model'}
+    assert cascade['model_scored'] == 15
+    assert {m['stage'] for m in cascade['matches']} <= {'model', 'prerank'}
+    assert sum(m['stage'] == 'model' for m in cascade['matches']) >= 1
+
+
+def test_negative_cascade_is_rejected(client, profiles):
+    assert client.post('/rank', json={'user': profiles[0], 'candidates': profiles[1:5], 'cascade': -1}).status_code == 400
@@ -0,0 +1,107 @@
+"""Request profiling"""
+import time
+
+import pytest
+
+from profiling import ProfilerBusyError, RequestProfile, WorstProfiles
+
+
+def _busy(seconds):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        sum(range(1000))
+
+
+def test_table_report_names_the_profiled_code():
+    profile = RequestProfile('table')
+    profile.start()
+    _busy(0.01)
+    report = profile.finish()
+    assert '_busy' in report
+    assert profile.seconds >= 0.01
+
+
+def test_collapsed_report_lists_sampled_stacks():
+    profile = RequestProfile('collapsed')
+    profile.start()
+    _busy(0.05)
+    report = profile.finish()
+    stack, count = report.splitlines()[0].rsplit(' ', 1)
+    assert '_busy' in report and ';' in stack and int(count) > 0
+
+
+def test_one_profile_at_a_time():
+    first = RequestProfile()
+    first.start()
+    try:
+        with pytest.raises(ProfilerBusyError):
+            RequestProfile().start()
+    finally:
+        first.finish()
+    second = RequestProfile()
+    second.start()
+    second.finish()
+
+
+@pytest.mark.parametrize('options', [{'profile_format': 'svg'}, {'sort': 'name'}])
+def test_unknown_options_are_rejected(options):
+    with pytest.raises(ValueError):
+        RequestProfile(**options)
+
+
+def test_worst_profiles_keeps_the_slowest_of_every_nth():
+    worst = WorstProfiles(every=3, keep=2)
+    assert [worst.due() for _ in range(6)] == [False, False, True, False, False, True]
+    for seconds in (0.2, 0.5, 0.1, 0.4):
+        worst.add(seconds, 'rank_candidates', f"report {seconds}")
+    assert [entry['seconds'] for entry in worst.entries()] == [0.5, 0.4]
+    assert not WorstProfiles(every=0, keep=2).due()
+
+
+@pytest.fixture
+def profiled(service, monkeypatch):
+    monkeypatch.setattr(service, 'PROFILE_TOKEN', 'secret')
+    return service
+
+
+def test_requested_profile_replaces_the_response(client, profiled, profiles):
+    response = client.post('/rank', json={'user': profiles[0], 'candidates': profiles[1:20]}, headers={
+        'X-Profile': 'table', 'X-Profile-Token': 'secret'
+    })
+    assert response.status_code == 200
+    assert response.headers['X-Profiled-Status'] == '200'
+    assert 'function calls' in response.get_data(as_text=True)
+
+
+def _requests_total(client, endpoint, status):
+    prefix = f'ml_requests_total{{endpoint="{endpoint}",status="{status}"}} '
+    lines = [line for line in client.get('/metrics').get_data(as_text=True).splitlines() if line.startswith(prefix)]
+    return float(lines[0].rsplit(' ', 1)[1]) if lines else 0
+
+
+def test_metrics_count_the_profiled_status(client, profiled, profiles):
+    before = _requests_total(client, 'rank_candidates', 400)
+    response = client.post('/rank', json={'user': profiles[0], 'candidates': profiles[1:5], 'k': 0}, headers={
+        'X-Profile': 'table', 'X-Profile-Token': 'secret'
+    })
+    assert response.headers['X-Profiled-Status'] == '400'
+    assert _requests_total(client, 'rank_candidates', 400) == before + 1
+
+
+def test_profiling_needs_the_token(client, service, monkeypatch, profiles):
+    body = {'user': profiles[0], 'candidates': profiles[1:5]}
+    assert client.post('/rank', json=body, headers={'X-Profile': 'table'}).is_json  # disabled: X-Profile is ignored
+    monkeypatch.setattr(service, 'PROFILE_TOKEN', 'secret')
+    assert client.post('/rank', json=body, headers={'X-Profile': 'table', 'X-Profile-Token': 'wrong'}).status_code == 403
+    assert client.post('/rank', json=body, headers={'X-Profile': 'table'}).status_code == 403
+    assert client.get('/profiles', headers={'X-Profile-Token': 'wrong'}).status_code == 403
+
+
+def test_sampled_profiles_are_listed(client, profiled, monkeypatch, profiles):
+    monkeypatch.setattr(profiled, 'worst_profiles', WorstProfiles(every=2, keep=5))
+    for _ in range(4):
+        assert client.post('/rank', json={'user': profiles[0], 'candidates': profiles[1:5]}).is_json
+
+    body = client.get('/profiles', headers={'X-Profile-Token': 'secret'}).get_json()
+    assert len(body['profiles']) == 2
+    assert {entry['endpoint'] for entry in body['profiles']} == {'rank_candidates'}
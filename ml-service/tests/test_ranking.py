@@ -0,0 +1,57 @@
+"""Top-K selection and the /rank endpoint"""
+import numpy as np
+import pytest
+
+from ranking import select_top_k
+
+
+def _reference(scores, k, offset=0, min_score=None):
+    """Stable descending sort of everything, then the page"""
+    order = [i for i in np.argsort(-np.asarray(scores), kind='stable') if min_score is None or scores[i] >= min_score]
+    return order[offset:offset + k], len(order)
+
+
+@pytest.mark.parametrize('k, offset, min_score', [
+    (1, 0, None), (5, 0, None), (5, 3, None), (10, 95, None), (7, 0, 50), (3, 4, 60), (200, 0, None), (5, 200, None)
+])
+def test_select_top_k_matches_stable_sort(k, offset, min_score):
+    # Few distinct values, so the page boundaries fall inside runs of ties
+    scores = np.random.default_rng(3).integers(10, 96, 100) // 10 * 10
+    indices, total = select_top_k(scores, k, offset, min_score)
+    expected, expected_total = _reference(scores, k, offset, min_score)
+    assert indices.tolist() == expected
+    assert total == expected_total
+
+
+def test_select_top_k_breaks_ties_by_index():
+    indices, total = select_top_k([50, 70, 50, 70, 50], 3)
+    assert indices.tolist() == [1, 3, 0]
+    assert total == 5
+
+
+def test_rank_returns_the_best_page(client, profiles):
+    user, candidates = profiles[0], profiles[1:100]
+    scores = client.post('/predict-enhanced', json={'user': user, 'candidates': candidates}).get_json()['match_percentages']
+
+    body = client.post('/rank', json={'user': user, 'candidates': candidates, 'k': 5, 'offset': 2}).get_json()
+
+    expected, _ = _reference(scores, 5, 2)
+    assert [match['index'] for match in body['matches']] == expected
+    assert [match['match_percentage'] for match in body['matches']] == [scores[i] for i in expected]
+    assert (body['total'], body['k'], body['offset']) == (len(candidates), 5, 2)
+
+
+def test_rank_reports_candidate_ids(client, profiles):
+    entries = [{'id': f"rank-{i}", 'version': '1', 'profile': profile} for i, profile in enumerate(profiles[:20])]
+    client.post('/candidates', json=entries)
+
+    body = client.post('/rank', json={
+        'user': profiles[50], 'candidate_refs': [{'id': e['id'], 'version': '1'} for e in entries], 'k': 3
+    }).get_json()
+
+    assert [match['id'] for match in body['matches']] == [f"rank-{match['index']}" for match in body['matches']]
+
+
+@pytest.mark.parametrize('options', [{'k': 0}, {'k': 'ten'}, {'offset': -1}])
+def test_rank_rejects_bad_paging(client, profiles, options):
+    assert client.post('/rank', json={'user': profiles[0], 'candidates': profiles[1:5], **options}).status_code == 400
@@ -0,0 +1,43 @@
+"""Synthetic training data generation"""
+import numpy as np
+
+from feature_encoder import BUDGET_ORDER, OVERLAP_VOCABULARIES, category_code, encode_pair_features, encode_profiles
+from retrain_model import PROFILE_OPTIONS, create_feature_columns, generate_training_data, sample_profile_columns
+
+
+def _decode(columns):
+    """Profile dicts equivalent to sampled encoded columns"""
+    options = {
+        field: {category_code(option): option for option in field_options} for field, field_options in PROFILE_OPTIONS.items()
+    }
+    profiles = []
+    for i in range(columns['size']):
+        profile = {field: options[field][columns['categories'][field][i]] for field in PROFILE_OPTIONS}
+        profile['age'] = int(columns['age'][i])
+        profile['cleanliness'] = int(columns['cleanliness'][i])
+        profile['budget'] = BUDGET_ORDER[columns['budget'][i]]
+        for field, masks in columns['masks'].items():
+            bits = int(masks[i, 0])
+            profile[field] = [item for bit, item in enumerate(OVERLAP_VOCABULARIES[field]) if bits >> bit & 1]
+        profiles.append(profile)
+    return profiles
+
+
+def test_sampled_columns_encode_like_profiles():
+    rng = np.random.default_rng(0)
+    users, candidates = sample_profile_columns(rng, 300), sample_profile_columns(rng, 300)
+    columns = create_feature_columns()
+
+    np.testing.assert_array_equal(
+        encode_pair_features(users, candidates, columns),
+        encode_pair_features(encode_profiles(_decode(users)), encode_profiles(_decode(candidates)), columns)
+    )
+
+
+def test_generation_is_reproducible_per_seed():
+    first, again, other = (generate_training_data(2000, seed) for seed in (1, 1, 2))
+
+    assert list(first.columns) == create_feature_columns() + ['compatibility_score']
+    assert first.equals(again)
+    assert not first.equals(other)
+    assert first['compatibility_score'].between(0, 1).all()
@@ -0,0 +1,73 @@
+"""Score cache"""
+import numpy as np
+
+from score_cache import ScoreCache
+
+
+class CountingModel:
+    """Sums each row, recording every batch it is asked to score"""
+
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X):
+        self.calls.append(np.array(X))
+        return np.asarray(X).sum(axis=1)
+
+
+def _rows(seed, size, distinct=10):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, 3, (distinct, 4)).astype(np.float64)[rng.integers(0, distinct, size)]
+
+
+def test_predictions_match_the_model():
+    cache, model = ScoreCache(max_size=100), CountingModel()
+    for seed in range(3):
+        X = _rows(seed, 50)
+        np.testing.assert_array_equal(cache.predict(model, X, 'v1'), X.sum(axis=1))
+
+
+def test_only_new_distinct_rows_reach_the_model():
+    cache, model = ScoreCache(max_size=100), CountingModel()
+    X = _rows(0, 200)
+    cache.predict(model, X, 'v1')
+    assert len(model.calls) == 1
+    assert len(model.calls[0]) == len(np.unique(X, axis=0))
+
+    cache.predict(model, X[::-1], 'v1')
+    assert len(model.calls) == 1
+    assert (cache.hits, cache.misses) == (200, 200)
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_a_new_model_key_empties_the_cache():
+    cache, model = ScoreCache(max_size=100), CountingModel()
+    X = _rows(0, 20)
+    cache.predict(model, X, 'v1')
+    cache.predict(model, X, 'v2')
+    assert len(model.calls) == 2
+
+
+def test_least_recently_used_rows_are_evicted():
+    cache, model = ScoreCache(max_size=3), CountingModel()
+    rows = np.eye(4)
+    for i in range(3):
+        cache.predict(model, rows[i:i + 1], 'v1')
+    cache.predict(model, rows[:1], 'v1')  # row 0 is now the most recently used
+    cache.predict(model, rows[3:], 'v1')  # evicts row 1
+    assert len(cache) == 3
+
+    model.calls.clear()
+    cache.predict(model, rows[[0, 2, 3]], 'v1')
+    assert model.calls == []
+    cache.predict(model, rows[1:2], 'v1')
+    assert len(model.calls) == 1
+
+
+def test_disabled_cache_passes_through():
+    cache, model = ScoreCache(max_size=0), CountingModel()
+    X = _rows(0, 20)
+    cache.predict(model, X, 'v1')
+    cache.predict(model, X, 'v1')
+    assert [len(call) for call in model.calls] == [20, 20]
+    assert len(cache) == 0
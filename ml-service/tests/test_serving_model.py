@@ -0,0 +1,156 @@
+"""Model warm-up, hot reload and the artifact watcher"""
+import threading
+import time
+
+import numpy as np
+import pytest
+from sklearn.ensemble import RandomForestRegressor
+
+from feature_encoder import encode_pair_features, encode_profiles, scores_from_predictions
+from forest_engine import ArrayForest
+from model_artifact import save_artifact
+from serving_model import ModelReloader, ModelWatcher, ServingModel, file_signature
+
+
+class StubModel:
+    def __init__(self, version='v1'):
+        self.version = version
+        self.warmed_up = False
+
+    def warm_up(self):
+        self.warmed_up = True
+
+
+class StubReloader:
+    def __init__(self):
+        self.sources = []
+
+    def start(self, source=None):
+        self.sources.append(source)
+        return True
+
+
+def _wait(condition, timeout=10):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'timed out'
+        time.sleep(0.01)
+
+
+@pytest.fixture(scope='module')
+def artifact(tmp_path_factory, model_columns):
+    """A freshly exported model artifact plus its engine"""
+    rng = np.random.default_rng(0)
+    X = rng.random((1000, len(model_columns)))
+    forest = RandomForestRegressor(n_estimators=5, max_depth=5, random_state=0).fit(X, X[:, :5].mean(axis=1))
+    path = str(tmp_path_factory.mktemp('artifact') / 'model.bin')
+    engine = ArrayForest.from_sklearn(forest)
+    save_artifact(path, engine, model_columns)
+    return path, engine
+
+
+def test_warm_up_runs_the_predictor(model_columns):
+    calls = []
+
+    class Predictor:
+        def predict(self, X):
+            calls.append(len(X))
+            return np.zeros(len(X))
+
+    model = ServingModel(None, model_columns, Predictor())
+    model.warm_up(rows=16)
+    assert model.warmed_up and calls == [1, 16]
+
+
+def test_reloader_activates_a_warmed_up_model():
+    activated = []
+    reloader = ModelReloader(StubModel, activated.append)
+    assert reloader.start('v2')
+    _wait(lambda: activated)
+    _wait(lambda: reloader.status()['finished_at'])
+    assert activated[0].version == 'v2' and activated[0].warmed_up
+    assert reloader.status()['state'] == 'idle'
+
+
+def test_reloader_keeps_the_active_model_on_failure():
+    def load(source):
+        raise ValueError('corrupt artifact')
+
+    activated = []
+    reloader = ModelReloader(load, activated.append)
+    reloader.start()
+    _wait(lambda: reloader.status()['finished_at'])
+    assert reloader.status()['state'] == 'failed' and 'corrupt' in reloader.status()['error']
+    assert activated == []
+
+
+def test_one_reload_at_a_time():
+    release = threading.Event()
+
+    def load(source):
+        release.wait(10)
+        return StubModel(source)
+
+    reloader = ModelReloader(load, lambda model: None)
+    assert reloader.start('a')
+    assert not reloader.start('b')
+    release.set()
+    _wait(lambda: reloader.status()['finished_at'])
+    assert reloader.start('c')
+
+
+def test_watcher_reloads_a_changed_file(tmp_path):
+    path = tmp_path / 'model.bin'
+    path.write_bytes(b'v1')
+    active = ServingModel(None, [], None, source=str(path), signature=file_signature(str(path)))
+    reloader = StubReloader()
+    ModelWatcher(str(path), 0.01, reloader, active).start()
+
+    time.sleep(0.05)
+    assert reloader.sources == []
+    path.write_bytes(b'v2 is longer')
+    _wait(lambda: reloader.sources)
+    time.sleep(0.05)
+    assert reloader.sources == [str(path)]
+
+
+def test_watcher_reloads_when_the_file_holds_another_model(artifact, model_columns):
+    path, engine = artifact
+    # e.g. a worker forked from a master that loaded the previous artifact
+    active = ServingModel(engine, model_columns, engine, version='previous', source=path)
+    reloader = StubReloader()
+
+    watcher = ModelWatcher(path, 60, reloader, active)
+    assert watcher.stale_model is active
+    watcher.start()
+    assert reloader.sources == [path]
+
+
+def test_ready(client):
+    body = client.get('/ready').get_json()
+    assert body['ready'] is True and body['stale'] is False
+
+
+def test_reload_needs_the_token(client, service, monkeypatch):
+    assert client.post('/reload').status_code == 403
+    monkeypatch.setattr(service, 'RELOAD_TOKEN', 'secret')
+    assert client.post('/reload', headers={'X-Reload-Token': 'wrong'}).status_code == 403
+
+
+def test_reload_swaps_in_the_artifact(client, service, monkeypatch, artifact, profiles, model_columns):
+    path, engine = artifact
+    monkeypatch.setattr(service, 'RELOAD_TOKEN', 'secret')
+    original = service.serving
+    try:
+        response = client.post('/reload', json={'artifact': path}, headers={'X-Reload-Token': 'secret'})
+        assert response.status_code == 202
+        _wait(lambda: service.serving is not original or service.model_reloader.status()['state'] == 'failed')
+        assert service.serving.source == path
+
+        features = encode_pair_features(encode_profiles([profiles[0]]), encode_profiles(profiles[1:20]), model_columns)
+        expected = scores_from_predictions(engine.predict(features), features).tolist()
+        scores = client.post('/predict-enhanced', json={'user': profiles[0], 'candidates': profiles[1:20]}).get_json()
+        assert scores['match_percentages'] == expected
+        assert client.get('/model-info').get_json()['model_version'] == service.serving.version
+    finally:
+        service.activate_model(original)
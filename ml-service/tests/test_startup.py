@@ -0,0 +1,16 @@
+"""Startup timings"""
+
+
+def test_startup_reports_every_phase(client):
+    body = client.get('/startup').get_json()
+    phases = body['phases']
+
+    assert {'imports', 'model_load', 'warm_up', 'total'} <= set(phases)
+    assert body['total_seconds'] == phases['total']
+    assert all(seconds >= 0 for seconds in phases.values())
+    assert phases['imports'] + phases['model_load'] + phases['warm_up'] <= phases['total']
+
+
+def test_startup_phases_are_exported_as_metrics(client):
+    metrics = client.get('/metrics').get_data(as_text=True)
+    assert 'ml_startup_phase_seconds{phase="imports"}' in metrics
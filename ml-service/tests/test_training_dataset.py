@@ -0,0 +1,86 @@
+"""Training dataset cache"""
+import json
+import os
+
+import numpy as np
+import pytest
+
+import retrain_model
+from training_dataset import TARGET_COLUMN, TrainingDataset, read_pairs_file
+
+COLUMNS = ['a', 'b', 'c']
+
+
+def _chunk(seed, rows):
+    rng = np.random.default_rng(seed)
+    return rng.random((rows, len(COLUMNS))).astype(np.float32), rng.random(rows)
+
+
+def test_shards_load_back_in_order(tmp_path):
+    dataset = TrainingDataset(str(tmp_path), {'seed': 1}, COLUMNS)
+    chunks = [_chunk(0, 10), _chunk(1, 5)]
+    dataset.create(iter(chunks))
+    extra = _chunk(2, 3)
+    dataset.add_shard(*extra, source='logged')
+
+    reopened = TrainingDataset(str(tmp_path), {'seed': 1}, COLUMNS)
+    features, target = reopened.load()
+
+    assert reopened.exists and reopened.rows == 18
+    assert [shard['source'] for shard in reopened.manifest['shards']] == ['generated', 'generated', 'logged']
+    np.testing.assert_array_equal(features, np.concatenate([chunks[0][0], chunks[1][0], extra[0]]))
+    np.testing.assert_array_equal(target, np.concatenate([chunks[0][1], chunks[1][1], extra[1]]))
+
+
+def test_key_follows_config_and_schema(tmp_path):
+    key = TrainingDataset(str(tmp_path), {'seed': 1}, COLUMNS).key
+    assert TrainingDataset(str(tmp_path), {'seed': 1}, COLUMNS).key == key
+    assert TrainingDataset(str(tmp_path), {'seed': 2}, COLUMNS).key != key
+    assert TrainingDataset(str(tmp_path), {'seed': 1}, COLUMNS[::-1]).key != key
+
+
+def test_interrupted_create_leaves_no_dataset(tmp_path):
+    def chunks():
+        yield _chunk(0, 4)
+        raise KeyboardInterrupt
+
+    with pytest.raises(KeyboardInterrupt):
+        TrainingDataset(str(tmp_path), {}, COLUMNS).create(chunks())
+    assert not TrainingDataset(str(tmp_path), {}, COLUMNS).exists
+
+
+def test_mismatched_shards_are_rejected(tmp_path):
+    dataset = TrainingDataset(str(tmp_path), {}, COLUMNS)
+    with pytest.raises(ValueError):
+        dataset.add_shard(*_chunk(0, 2), source='logged')
+    dataset.create([_chunk(0, 2)])
+    with pytest.raises(ValueError):
+        dataset.add_shard(np.zeros((2, 2)), np.zeros(2), source='logged')
+    with pytest.raises(ValueError):
+        dataset.add_shard(np.zeros((2, 3)), np.zeros(3), source='logged')
+
+
+def test_read_pairs_file(tmp_path):
+    path = tmp_path / 'pairs.csv'
+    path.write_text(f"b,a,c,{TARGET_COLUMN}\n2,1,3,0.5\n5,4,6,0.25\n")
+    features, target = read_pairs_file(str(path), COLUMNS)
+    np.testing.assert_array_equal(features, [[1, 2, 3], [4, 5, 6]])
+    np.testing.assert_array_equal(target, [0.5, 0.25])
+
+    path.write_text(f"a,b,{TARGET_COLUMN}\n1,2,0.5\n")
+    with pytest.raises(ValueError, match='c'):
+        read_pairs_file(str(path), COLUMNS)
+
+
+def test_retraining_reuses_the_cached_dataset(tmp_path, monkeypatch):
+    features, scores, dataset = retrain_model.load_training_data(500, 3, str(tmp_path))
+    with open(os.path.join(dataset.directory, 'manifest.json')) as f:
+        assert json.load(f)['config']['seed'] == 3
+
+    def regenerate(*args):
+        raise AssertionError('the cached dataset should have been used')
+
+    monkeypatch.setattr(retrain_model, 'iter_training_chunks', regenerate)
+    cached_features, cached_scores, _ = retrain_model.load_training_data(500, 3, str(tmp_path))
+    np.testing.assert_array_equal(cached_features, features)
+    np.testing.assert_array_equal(cached_scores, scores)
@@ -0,0 +1,132 @@
+"""
+Homiee ML Service - Training Dataset Cache
+Encoded training pairs kept as Parquet shards, versioned by generator config and feature schema
+
+A dataset lives in <root>/<key>/, where the key hashes the JSON config that
+produced it together with the feature schema, so a retrain with the same
+settings reuses the stored pairs and any change starts a new dataset.
+manifest.json lists the shards in order: the generated ones first, then any
+added later with add_shard() (e.g. real pairs logged by the service). Every
+shard holds one float32 column per feature plus the float64 target.
+"""
+import hashlib
+import json
+import os
+import shutil
+from datetime import datetime, timezone
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from model_artifact import feature_schema_hash
+
+TARGET_COLUMN = 'compatibility_score'
+
+
+def dataset_key(config, feature_columns):
+    """Short, stable fingerprint of a generator config plus the feature schema"""
+    payload = json.dumps({'config': config, 'feature_schema': feature_schema_hash(feature_columns)}, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+
+
+def read_pairs_file(path, feature_columns):
+    """(features, target) from a CSV or Parquet file with every feature column plus the target"""
+    table = pq.read_table(path) if path.endswith('.parquet') else pa_csv.read_csv(path)
+    missing = [name for name in list(feature_columns) + [TARGET_COLUMN] if name not in table.column_names]
+    if missing:
+        raise ValueError(f"{path} is missing columns: {', '.join(missing)}")
+
+    features = np.column_stack([
+        table.column(name).cast(pa.float32()).to_numpy(zero_copy_only=False) for name in feature_columns
+    ])
+    target = table.column(TARGET_COLUMN).cast(pa.float64()).to_numpy(zero_copy_only=False)
+    return features, target
+
+
+class TrainingDataset:
+    """On-disk training set for one (config, feature schema) key"""
+
+    def __init__(self, root, config, feature_columns):
+        self.config = config
+        self.feature_columns = list(feature_columns)
+        self.key = dataset_key(config, self.feature_columns)
+        self.directory = os.path.join(root, self.key)
+        self._manifest_path = os.path.join(self.directory, 'manifest.json')
+
+        self.manifest = None
+        if os.path.exists(self._manifest_path):
+            with open(self._manifest_path) as f:
+                self.manifest = json.load(f)
+
+    @property
+    def exists(self):
+        return self.manifest is not None
+
+    @property
+    def rows(self):
+        return sum(shard['rows'] for shard in self.manifest['shards']) if self.exists else 0
+
+    def create(self, chunks, source='generated'):
+        """Write the dataset from an iterable of (features, target) chunks, one shard each.
+
+        The manifest is written last, so an interrupted run leaves no dataset
+        behind and the next one starts over.
+        """
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+
+        shards = [self._write_shard(index, features, target, source) for index, (features, target) in enumerate(chunks)]
+        self._write_manifest({
+            'key': self.key,
+            'config': self.config,
+            'feature_columns': self.feature_columns,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'shards': shards,
+        })
+
+    def add_shard(self, features, target, source):
+        """Append one shard of extra pairs, returns its manifest entry"""
+        if not self.exists:
+            raise ValueError(f"Training dataset {self.key} has not been created")
+        shard = self._write_shard(len(self.manifest['shards']), features, target, source)
+        self._write_manifest({**self.manifest, 'shards': self.manifest['shards'] + [shard]})
+        return shard
+
+    def load(self):
+        """(float32 features, float64 target) of every shard, read from memory-mapped files"""
+        features = np.empty((self.rows, len(self.feature_columns)), dtype=np.float32)
+        target = np.empty(self.rows)
+
+        offset = 0
+        for shard in self.manifest['shards']:
+            table = pq.read_table(os.path.join(self.directory, shard['file']), memory_map=True)
+            end = offset + table.num_rows
+            for i, name in enumerate(self.feature_columns):
+                features[offset:end, i] = table.column(name).to_numpy()
+            target[offset:end] = table.column(TARGET_COLUMN).to_numpy()
+            offset = end
+        return features, target
+
+    def _write_shard(self, index, features, target, source):
+        features = np.asarray(features, dtype=np.float32)
+        target = np.asarray(target, dtype=np.float64)
+        if features.ndim != 2 or features.shape[1] != len(self.feature_columns):
+            raise ValueError(f"Expected {len(self.feature_columns)} feature columns, got shape {features.shape}")
+        if len(target) != len(features):
+            raise ValueError(f"Got {len(features)} feature rows but {len(target)} targets")
+
+        name = f"shard-{index:05d}.parquet"
+        path = os.path.join(self.directory, name)
+        columns = {column: features[:, i] for i, column in enumerate(self.feature_columns)}
+        pq.write_table(pa.table({**columns, TARGET_COLUMN: target}), f"{path}.tmp")
+        os.replace(f"{path}.tmp", path)
+        return {'file': name, 'rows': len(features), 'source': source}
+
+    def _write_manifest(self, manifest):
+        with open(f"{self._manifest_path}.tmp", 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(f"{self._manifest_path}.tmp", self._manifest_path)
+        self.manifest = manifest